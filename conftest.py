@@ -21,6 +21,7 @@ from tools.gitlab_integration import skip_if_opened
 from tools.gitlab_integration import url_to_path
 from tools.licenses import request_demo_license
 from tools.mailinator import Inbox
+from tools.response_cache import response_cache_stats
 from tools.types import CompanyNameType
 from tools.types import EmailType
 from tools.users import create_user_and_company
@@ -38,6 +39,8 @@ from tools.version import get_app_version
 
 log = logging.getLogger(__name__)
 
+pytest_plugins = ('tools.pytest_endpoint_stats', )
+
 
 @pytest.fixture(scope='session')
 def session_options() -> Namespace:
@@ -306,6 +309,11 @@ def pytest_configure(config):
         cfg.app_version = None
 
 
+def pytest_sessionfinish(session, exitstatus):
+    if response_cache_stats:
+        log.info(f'Response cache: {response_cache_stats}')
+
+
 def pytest_runtest_setup(item):
     def is_dev_env(env):
         return env in ('dev-metapix', 'dev-dw', 'alphatest1')
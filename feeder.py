@@ -14,12 +14,19 @@ from tools.cameras import enable_camera
 from tools.cameras import get_camera_by_id
 from tools.client import ApiClient
 from tools.image_sender import ImageSender
+from tools.ingestion_probe import IngestionProbe
+from tools.ingestion_probe import STAGES
 from tools.license_server import LicenseServerAPI
+from tools.load import LoadProfile
+from tools.load import run_open_loop
+from tools.load import run_sharded
 from tools.license_server import get_not_activated_licenses
 from tools.licenses import activate_license
 from tools.licenses import request_demo_license
 from tools.mailinator import Inbox
 from tools.mailinator import resend_confirmation_email
+from tools.packet_log import replay
+from tools.synthetic import SyntheticProfile
 from tools.types import CompanyNameType
 from tools.types import EmailType
 from tools.users import create_user_and_company
@@ -80,7 +87,38 @@ if __name__ == '__main__':
     parser.add_argument('--list-companies', action='store_true')
     parser.add_argument('--delete-test-data', action='store_true')
     parser.add_argument('--camera', type=str, help="Camera ID or name to send objects")
-    parser.add_argument('--interval', type=float, default=0.5, help="Time between sending objects (in seconds)")
+    parser.add_argument('--interval', type=float, default=0.5,
+                        help="Time between sending objects (in seconds). 0 means send all objects at once")
+    parser.add_argument('--workers', type=int, default=None, help="Amount of threads which send objects")
+    parser.add_argument('--inflight', type=int, default=None, help="Max amount of requests in flight")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Open loop load mode: objects per second (use with --duration)")
+    parser.add_argument('--duration', type=float, default=60, help="Open loop load mode: duration (in seconds)")
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant',
+                        help="Open loop load mode: distribution of objects arrival")
+    parser.add_argument('--load-cameras', type=str, default=None,
+                        help="Open loop load mode: comma separated camera IDs or names (all cameras by default)")
+    parser.add_argument('--load-templates', type=str, default='face,vehicle,person',
+                        help="Open loop load mode: comma separated templates")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Open loop load mode: amount of worker processes (cameras/bases are sharded)")
+    parser.add_argument('--synthetic', action='store_true',
+                        help="Send distinct images generated from templates instead of the same template")
+    parser.add_argument('--identities', type=int, default=None,
+                        help="Synthetic images: amount of identities (clusters). Every image is unique by default")
+    parser.add_argument('--synthetic-seed', type=int, default=None, help="Synthetic images: seed of identities")
+    parser.add_argument('--record', type=str, default=None,
+                        help="Record packets sent to meta-receiver into the file (appended)")
+    parser.add_argument('--replay', type=str, default=None, help="Replay packets recorded with --record")
+    parser.add_argument('--replay-speed', type=float, default=1,
+                        help="Replay: speed relative to recording (2 means twice faster). 0 means max speed")
+    parser.add_argument('--replay-cameras', type=str, default=None,
+                        help="Replay: comma separated camera IDs or names to send to (recorded cameras by default)")
+    parser.add_argument('--probe', type=int, default=None,
+                        help="Ingestion latency probe: amount of objects of every base to send and track")
+    parser.add_argument('--probe-stages', type=str, default=','.join(STAGES),
+                        help="Ingestion latency probe: comma separated stages to wait for")
+    parser.add_argument('--probe-output', type=str, default=None, help="Ingestion latency probe: JSON report file")
     # parser.add_argument('--add-company', type=str)
     parser.add_argument('--custom-script', type=str, default=None)
     parser.add_argument('--complete-registration', type=str, default=None)
@@ -90,6 +128,7 @@ if __name__ == '__main__':
 
     # workaround for https://stackoverflow.com/questions/18608812/accepting-a-dictionary-as-an-argument-with-argparse-and-python
     args.full_meta = json.loads(args.full_meta) if args.full_meta else None
+    synthetic = SyntheticProfile(identities=args.identities, seed=args.synthetic_seed) if args.synthetic else None
 
     config.environment = args.env
 
@@ -127,6 +166,10 @@ if __name__ == '__main__':
             'password': args.password,
         }
         sender = ImageSender(client)
+        if args.workers or args.inflight:
+            sender.configure_engine(workers=args.workers or args.inflight, inflight=args.inflight)
+        if args.record:
+            sender.record_packets(args.record)
 
     if args.list_companies:
         for company in get_available_companies(client):
@@ -177,15 +220,69 @@ if __name__ == '__main__':
         if not args.camera:
             log.error("No camera specified")
             sys.exit()
-        for _ in range(args.n):
+        if args.interval:
+            for _ in range(args.n):
+                sender.send(
+                    object_type=args.object_type,
+                    camera=args.camera,
+                    count=1,
+                    meta=args.full_meta,
+                    get_meta=False,
+                    synthetic=synthetic,
+                )
+                time.sleep(args.interval)
+        else:
             sender.send(
                 object_type=args.object_type,
                 camera=args.camera,
-                count=1,
+                count=args.n,
                 meta=args.full_meta,
                 get_meta=False,
+                synthetic=synthetic,
             )
-            time.sleep(args.interval)
+        log.info(f'Sender stats: {sender.engine.stats}')
+        log.info(f'Sender stats (json): {json.dumps(sender.engine.stats.report())}')
+        sender.close()
+
+    if args.rate:
+        load_cameras = [sender.resolve_camera(camera) for camera in args.load_cameras.split(',')] \
+            if args.load_cameras else sender.cameras
+        profile = LoadProfile(
+            rate=args.rate,
+            duration=args.duration,
+            arrival=args.arrival,
+            object_types=args.load_templates.split(','),
+            cameras=load_cameras,
+            synthetic=synthetic,
+        )
+        if args.processes > 1:
+            report = run_sharded(sender, profile, args.processes)
+        else:
+            report = run_open_loop(sender, profile)
+        log.info(f'Load report: {json.dumps(report, indent=2)}')
+        sender.close()
+
+    if args.replay:
+        if args.record:
+            log.warning('Replayed packets are not recorded again')
+            sender.stop_recording()
+        replay_cameras = [sender.resolve_camera(camera).id for camera in args.replay_cameras.split(',')] \
+            if args.replay_cameras else []
+        report = replay(sender.engine, client, args.replay, speed=args.replay_speed, cameras=replay_cameras)
+        log.info(f'Replay report: {json.dumps(report, indent=2)}')
+        sender.close()
+
+    if args.probe:
+        probe_report = IngestionProbe(sender).run(
+            count=args.probe,
+            camera=sender.resolve_camera(args.camera),
+            stages=args.probe_stages.split(','),
+        )
+        if args.probe_output:
+            with open(args.probe_output, 'w') as f:
+                json.dump(probe_report.to_dict(), f, indent=2)
+            log.info(f'Probe report is written to {args.probe_output}')
+        sender.close()
 
     if args.custom_script:
         log.info(f"Run script: {args.custom_script}")
@@ -0,0 +1,38 @@
+from typing import Iterator
+
+import pytest
+
+from tools import config
+from tools.client import ApiClient
+from tools.standin import StandIn
+
+
+@pytest.fixture(autouse=True)
+def user_config(tmp_path) -> Iterator[dict]:
+    ''' Minimal config which points nowhere. Tests change it in place '''
+    saved = config.user_config, config.environment
+    config.user_config = {
+        'requests_timeout': [5, 30],
+        'token_refresh_ahead': 0,
+        'circuit_breaker_threshold': 0,
+        'object_cache_path': str(tmp_path / 'objects.sqlite'),
+    }
+    config.environment = 'unit'
+    try:
+        yield config.user_config
+    finally:
+        config.user_config, config.environment = saved
+
+
+@pytest.fixture
+def standin() -> Iterator[StandIn]:
+    with StandIn() as standin:
+        yield standin
+
+
+@pytest.fixture
+def standin_client(standin) -> ApiClient:
+    client = ApiClient(url=standin.url)
+    client.set_access_token('token')
+    client.set_refresh_token('refresh')
+    return client
@@ -0,0 +1,96 @@
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Optional
+
+import consts
+from tools.arrival import SEARCH_PAGE_SIZE
+from tools.arrival import scan_backend
+from tools.arrival import wait_arrival
+from tools.cameras import CameraData
+from tools.correlation import MICROSECONDS
+from tools.correlation import ObjectMatcher
+from tools.search import search_api_v2
+
+
+@dataclass(eq=False)
+class Sent:
+    timestamp: float
+    track_id: Optional[str] = None
+    camera: CameraData = field(
+        default_factory=lambda: CameraData(id='camera', name='camera', active=True, archived=False, analytics={}))
+    base: str = consts.BASE_FACE
+    meta: dict = field(default_factory=dict)
+
+
+def add(standin, timestamp: float, visible_at: float = 0.) -> Sent:
+    standin.db.add(
+        {'label': 0, 'camera_id': 'camera', 'timestamp': round(timestamp * MICROSECONDS), 'meta': {}},
+        visible_at=visible_at,
+    )
+    return Sent(timestamp)
+
+
+class Pages:
+    ''' `PageRequest` which remembers requested pages '''
+    def __init__(self, client):
+        self.client = client
+        self.requests = []
+
+    def __call__(self, pgoffset, pgsize, timestamps):
+        self.requests.append((pgoffset, timestamps))
+        return search_api_v2(
+            self.client,
+            consts.BASE_FACE,
+            consts.API_ANY_QUALITY,
+            pgsize=pgsize,
+            pgoffset=pgoffset,
+            order=consts.API_ORDER_DATE_DESC,
+            timestamps=timestamps,
+        )
+
+
+def test_scan_is_bounded_by_timestamps_of_pending_objects(standin, standin_client):
+    pending = [add(standin, 1_700_000_000 + ix / 10) for ix in range(5)]
+    for ix in range(3 * SEARCH_PAGE_SIZE):   # newer objects which aren't waited for
+        add(standin, 1_700_001_000 + ix)
+    matched = []
+    pages = Pages(standin_client)
+    matcher = ObjectMatcher(pending)
+    assert scan_backend(pages, matcher, lambda obj, item: matched.append(obj)) == 5
+    assert matched == pending[::-1]
+    assert pages.requests == [(0, (1_700_000_000., 1_700_000_000.4))]
+
+
+def test_scan_reads_few_pages_per_poll(standin, standin_client):
+    pending = [add(standin, 1_700_000_000 + ix / 1000) for ix in range(3 * SEARCH_PAGE_SIZE)]
+    pages = Pages(standin_client)
+    matcher = ObjectMatcher(pending)
+    assert scan_backend(pages, matcher, lambda obj, item: None, max_pages=2) == 2 * SEARCH_PAGE_SIZE
+    assert len(pages.requests) == 2
+    # the next poll starts over within the window of objects which are left
+    assert scan_backend(pages, matcher, lambda obj, item: None, max_pages=2) == SEARCH_PAGE_SIZE
+    assert not matcher
+
+
+def test_wait_arrival_of_late_objects(standin, standin_client, monkeypatch):
+    pending = [add(standin, 1_700_000_000 + ix, visible_at=float('inf')) for ix in range(3)]
+    pages = Pages(standin_client)
+    matcher = ObjectMatcher(pending)
+
+    def _sleep(seconds):   # objects become visible one by one
+        for obj in standin.db.search(consts.BASE_FACE, float('inf'), False, None, None):
+            if obj.visible_at == float('inf'):
+                obj.visible_at = 0.
+                break
+
+    monkeypatch.setattr('tools.arrival.time.sleep', _sleep)
+    assert wait_arrival(pages, matcher, lambda obj, item: None, timeout=10)
+    assert len(pages.requests) == 4
+    assert pages.requests[-1][1] == (1_700_000_002., 1_700_000_002.)
+
+
+def test_wait_arrival_deadline(standin, standin_client, monkeypatch):
+    monkeypatch.setattr('tools.arrival.time.sleep', lambda seconds: None)
+    matcher = ObjectMatcher([Sent(1_700_000_000.5)])
+    assert not wait_arrival(Pages(standin_client), matcher, lambda obj, item: None, timeout=0)
+    assert len(matcher) == 1
@@ -0,0 +1,138 @@
+from collections import Counter
+import asyncio
+import threading
+
+import consts
+import tools.tokens
+import tools.users
+from tools.async_client import AsyncApiClient
+from tools.async_client import gather_limited
+from tools.async_client import get_object
+from tools.async_client import search_api_v2
+from tools.client import ApiClient
+from tools.correlation import MICROSECONDS
+from tools.endpoint_stats import endpoint_stats
+
+
+class TokenServer:
+    '''
+    HTTP/1.1 keep-alive server which replies `{}` to everything
+    valid_token: other access tokens are expired
+    '''
+    def __init__(self, valid_token=None):
+        self.valid_token = valid_token
+        self.received: Counter = Counter()
+        self.requests = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}'
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while request_line := await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    key, _, value = line.decode().partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                self.received[request_line.split()[0].decode()] += 1
+                if self.valid_token and headers.get('access-token') != self.valid_token:
+                    body = b'{"detail": "Token is expired"}'
+                    writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body))
+                else:
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def make_client(url: str, token: str = 'token') -> ApiClient:
+    client = ApiClient(url=url)
+    client.set_access_token(token)
+    client.set_refresh_token('refresh')
+    return client
+
+
+def add_objects(standin, amount: int) -> None:
+    for ix in range(amount):
+        standin.db.add(
+            {'label': 0, 'camera_id': 'camera', 'timestamp': (1_700_000_000 + ix) * MICROSECONDS, 'meta': {}},
+            visible_at=0.,
+        )
+
+
+def test_get_objects_from_standin(standin):
+    add_objects(standin, 40)
+    endpoint_stats.clear()
+
+    async def _scenario():
+        async with AsyncApiClient(make_client(standin.url), concurrency=8) as aclient:
+            objects = await gather_limited((get_object(aclient, ix) for ix in range(1, 41)), limit=20)
+            found = await search_api_v2(aclient, consts.BASE_FACE, pgsize=100)
+            return objects, found, aclient.client.connection_stats
+
+    objects, found, connections = run(_scenario())
+    assert [obj.id for obj in objects] == list(range(1, 41))
+    assert len(found) == 40
+    assert connections.requests == 41
+    assert connections.connections <= 8
+    counts = {(endpoint.method, endpoint.path): endpoint.count for endpoint in endpoint_stats.endpoints()}
+    assert counts[('GET', '/object-manager/objects/{id}')] == 40
+    assert counts[('POST', '/object-manager/v2/search/face')] == 1
+
+
+def test_expired_token_is_refreshed_once_by_sync_client(monkeypatch):
+    refreshes = []
+    lock = threading.Lock()
+
+    def _refresh_token(client):
+        with lock:
+            refreshes.append(client.access_token)
+        client.set_access_token('fresh')
+
+    monkeypatch.setattr(tools.tokens, 'refresh_token', _refresh_token)
+    monkeypatch.setattr(tools.users, 'set_company', lambda client: None)
+
+    async def _scenario():
+        async with TokenServer(valid_token='fresh') as server:
+            client = make_client(server.url, token='expired')
+            async with AsyncApiClient(client, concurrency=10) as aclient:
+                tasks = [aclient.request('get', '/x', expected_code=200) for _ in range(10)]
+                # sync request of the same client at the same time
+                tasks.append(asyncio.to_thread(client.request, 'get', '/x', expected_code=200))
+                await asyncio.gather(*tasks)
+            return client.access_token
+
+    assert run(_scenario()) == 'fresh'
+    assert refreshes == ['expired']
+
+
+def test_get_requests_go_through_response_cache():
+    async def _scenario():
+        async with TokenServer() as server:
+            client = make_client(server.url)
+            client.enable_response_cache()
+            async with AsyncApiClient(client) as aclient:
+                for _ in range(3):
+                    await aclient.request('get', '/device-manager/cameras', expected_code=200)
+                await aclient.request('patch', '/device-manager/cameras/1', data={'name': 'x'}, expected_code=200)
+                await aclient.request('get', '/device-manager/cameras', expected_code=200)
+            return server.received
+
+    assert run(_scenario()) == {'GET': 2, 'PATCH': 1}
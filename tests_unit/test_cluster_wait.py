@@ -0,0 +1,98 @@
+from collections import Counter
+import time
+
+import pytest
+
+import tools.image_sender
+from tools import ObjectData
+from tools.cameras import CameraData
+from tools.image_sender import ClusterizationException
+from tools.image_sender import ImageSender
+from tools.image_sender import Object
+from tools.histogram import LatencyHistogram
+from tools.object_store import ObjectStore
+
+CAMERA = CameraData(id='camera', name='camera', active=True, archived=False, analytics={})
+
+
+class Backend:
+    ''' `get_object` which reports objects in cluster after `polls` requests of every object '''
+    def __init__(self, polls: int):
+        self.polls = polls
+        self.requests: Counter = Counter()
+
+    def __call__(self, client, object_id: int) -> ObjectData:
+        self.requests[object_id] += 1
+        return ObjectData(
+            id=object_id,
+            cluster_size=2 if self.requests[object_id] >= self.polls else 1,
+            base='face',
+            camera_id=CAMERA.id,
+            timestamp=time.time(),
+            roi=None,
+            meta={},
+            is_reference=False,
+            parent_id=None,
+            image_url='',
+        )
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.image_sender.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(tools.image_sender.time, 'sleep', clock.sleep)
+    return clock
+
+
+def make_sender(amount: int) -> tuple[ImageSender, list[Object]]:
+    sender = ImageSender.__new__(ImageSender)
+    sender.client = None
+    sender._objects = ObjectStore()
+    sender.cluster_latency = LatencyHistogram()
+    objects = []
+    for ix in range(amount):
+        obj = Object(path=None, camera=CAMERA, client=None, base='face', timestamp=time.time())
+        obj._id = ix + 1
+        obj._sent_at = time.time()
+        sender._objects.append(obj)
+        objects.append(obj)
+    return sender, objects
+
+
+def test_objects_are_polled_until_they_are_in_cluster(monkeypatch, clock):
+    backend = Backend(polls=12)
+    monkeypatch.setattr(tools.image_sender, 'get_object', backend)
+    sender, objects = make_sender(3)
+    sender._wait_objects_are_in_cluster(objects, timeout=100)
+    assert backend.requests == {1: 12, 2: 12, 3: 12}
+    assert len(clock.sleeps) == 11
+    assert clock.sleeps == sorted(clock.sleeps)
+    assert clock.sleeps[-2:] == [5., 5.]   # backoff is capped
+    assert all(obj.meta['matched'] for obj in objects)
+    assert sender._objects.count(meta={'matched': True}) == 3
+    assert len(sender.cluster_latency) == 3
+
+
+def test_timeout(monkeypatch, clock):
+    backend = Backend(polls=1000)
+    monkeypatch.setattr(tools.image_sender, 'get_object', backend)
+    sender, objects = make_sender(2)
+    with pytest.raises(ClusterizationException):
+        sender._wait_objects_are_in_cluster(objects, timeout=10)
+    assert sum(clock.sleeps) == pytest.approx(10)   # the last delay is cut by the deadline
+    assert 'matched' not in objects[0].meta
+    assert len(sender.cluster_latency) == 0
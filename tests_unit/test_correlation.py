@@ -0,0 +1,144 @@
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Optional
+import threading
+
+import pytest
+
+from tools import ObjectData
+from tools.cameras import CameraData
+from tools.correlation import MICROSECONDS
+from tools.correlation import ObjectMatcher
+from tools.correlation import timestamp_key
+from tools.correlation import unique_timestamp
+
+
+def camera(camera_id: str) -> CameraData:
+    return CameraData(id=camera_id, name=camera_id, active=True, archived=False, analytics={})
+
+
+@dataclass(eq=False)
+class Sent:
+    timestamp: float
+    track_id: Optional[str] = None
+    camera: CameraData = field(default_factory=lambda: camera('camera'))
+    base: str = 'face'
+    meta: dict = field(default_factory=lambda: {'_any_quality_stub': True})
+
+
+def from_backend(
+        timestamp: float,
+        track_id: Optional[str] = None,
+        camera_id: str = 'camera',
+        meta: dict = {},
+) -> ObjectData:
+    return ObjectData(
+        id=1,
+        cluster_size=1,
+        base='face',
+        camera_id=camera_id,
+        timestamp=timestamp,
+        roi=None,
+        meta=meta,
+        is_reference=False,
+        parent_id=None,
+        image_url='',
+        track_id=track_id,
+    )
+
+
+def test_unique_timestamps_within_second():
+    timestamps = [unique_timestamp(1_600_000_000.25) for _ in range(1000)]
+    assert len({timestamp_key(timestamp) for timestamp in timestamps}) == 1000
+    assert all(int(timestamp) == 1_600_000_000 for timestamp in timestamps)
+    assert timestamp_key(timestamps[0]) == 1_600_000_000_250_000
+
+
+def test_unique_timestamps_from_threads():
+    timestamps = []
+
+    def _allocate():
+        timestamps.extend(unique_timestamp(1_600_000_001.) for _ in range(500))
+
+    threads = [threading.Thread(target=_allocate) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({timestamp_key(timestamp) for timestamp in timestamps}) == 2000
+
+
+def test_second_is_exhausted():
+    second = 1_600_000_002
+    unique_timestamp(second + (MICROSECONDS - 1) / MICROSECONDS)
+    with pytest.raises(RuntimeError):
+        unique_timestamp(second + 0.5)
+
+
+def test_match_by_track_id():
+    first, second = Sent(100.000001, 'track-1'), Sent(100.000002, 'track-2')
+    matcher = ObjectMatcher([first, second])
+    assert matcher.match(from_backend(555., 'track-2')) is second
+    assert matcher.match(from_backend(555., 'track-2')) is None   # every object is matched once
+    assert len(matcher) == 1
+
+
+def test_match_by_microseconds():
+    objects = [Sent(100 + ix / MICROSECONDS) for ix in range(5)]
+    matcher = ObjectMatcher(objects)
+    assert matcher.match(from_backend(100.000003)) is objects[3]
+    assert matcher.match(from_backend(100.000003)) is None
+    assert matcher.remaining() == objects[:3] + objects[4:]
+
+
+def test_match_by_second_if_backend_rounds_timestamps():
+    objects = [Sent(100.25), Sent(100.5), Sent(101.25)]
+    matcher = ObjectMatcher(objects)
+    assert matcher.match(from_backend(100)) is objects[0]
+    assert matcher.match(from_backend(100)) is objects[1]
+    assert matcher.match(from_backend(100)) is None
+    assert matcher.match(from_backend(100.75)) is None   # not rounded: no fallback
+    assert matcher.remaining() == objects[2:]
+
+
+def test_match_by_second_checks_camera_and_meta():
+    male = Sent(100.25, camera=camera('camera-1'), meta={'gender': 'male', '_any_quality_stub': True})
+    female = Sent(100.5, camera=camera('camera-2'), meta={'gender': 'female', '_any_quality_stub': True})
+    matcher = ObjectMatcher([male, female])
+    assert matcher.match(from_backend(100, camera_id='camera-3')) is None
+    assert matcher.match(from_backend(100, camera_id='camera-1', meta={'gender': 'female'})) is None
+    assert matcher.match(from_backend(100, camera_id='camera-2', meta={'gender': 'female', 'age': 30})) is female
+    assert matcher.match(from_backend(100, camera_id='camera-1', meta={'gender': 'male'})) is male
+    assert not matcher
+
+
+def test_ambiguous_match_by_second_is_refused():
+    male = Sent(100.25, meta={'gender': 'male'})
+    female = Sent(100.5, meta={'gender': 'female'})
+    matcher = ObjectMatcher([male, female])
+    assert matcher.match(from_backend(100)) is None   # backend meta doesn't tell which one
+    assert matcher.match(from_backend(100, meta={'gender': 'male'})) is male
+    assert matcher.match(from_backend(100)) is female   # the only candidate
+
+
+def test_object_matched_by_track_id_is_not_matched_by_timestamp():
+    obj = Sent(100.5, 'track-1')
+    matcher = ObjectMatcher([obj])
+    assert matcher.match(from_backend(100.5, 'track-1')) is obj
+    assert matcher.match(from_backend(100.5)) is None
+    assert not matcher
+
+
+def test_object_matched_by_timestamp_is_not_matched_by_track_id():
+    obj = Sent(100.5, 'track-1')
+    matcher = ObjectMatcher([obj])
+    assert matcher.match(from_backend(100.5)) is obj
+    assert matcher.match(from_backend(100.5, 'track-1')) is None
+
+
+def test_timestamp_window():
+    matcher = ObjectMatcher([Sent(100.5), Sent(99.25), Sent(101.75)])
+    assert (matcher.oldest_timestamp, matcher.newest_timestamp) == (99.25, 101.75)
+    matcher.match(from_backend(101.75))
+    assert matcher.newest_timestamp == 100.5
+    assert ObjectMatcher().oldest_timestamp is None
@@ -0,0 +1,79 @@
+import math
+import random
+
+import pytest
+
+from tools.histogram import LatencyHistogram
+
+
+def exact_percentile(values_ms: list[int], pct: float) -> int:
+    ''' Nearest rank '''
+    values_ms = sorted(values_ms)
+    return values_ms[max(1, math.ceil(pct / 100 * len(values_ms))) - 1]
+
+
+@pytest.mark.parametrize('significant_digits', [1, 2, 3])
+def test_percentiles_have_bounded_relative_error(significant_digits):
+    rng = random.Random(significant_digits)
+    values_ms = [round(rng.lognormvariate(5, 1.5)) for _ in range(10_000)]
+    histogram = LatencyHistogram(significant_digits)
+    for value in values_ms:
+        histogram.record(value / 1000)
+    for pct in (1, 10, 50, 75, 90, 95, 99, 99.9, 100):
+        exact = exact_percentile(values_ms, pct)
+        assert exact <= histogram.percentile(pct) <= exact * (1 + 10 ** -significant_digits)
+    assert histogram.percentile(100) == histogram.max == max(values_ms)
+    assert histogram.min == min(values_ms)
+    assert histogram.count == len(values_ms)
+    assert histogram.total == sum(values_ms)
+
+
+def test_small_values_are_exact():
+    histogram = LatencyHistogram()
+    for value in range(1, 101):
+        histogram.record(value / 1000)
+    assert [histogram.percentile(pct) for pct in (1, 50, 95, 100)] == [1, 50, 95, 100]
+
+
+def test_memory_does_not_depend_on_amount_of_values():
+    histogram = LatencyHistogram(2)
+    for value in range(100_000):
+        histogram.record(value / 1000)
+    assert len(histogram._counts) < 1500
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0
+    assert str(histogram) == 'no values'
+    assert histogram.to_dict()['max_ms'] == 0
+
+
+def test_merge_is_equal_to_recording_all_values():
+    rng = random.Random(1)
+    values = [rng.expovariate(1 / 0.2) for _ in range(2000)]
+    merged, first, second = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for ix, value in enumerate(values):
+        merged.record(value)
+        (first if ix % 2 else second).record(value)
+    first.merge(second)
+    assert first.to_dict() == merged.to_dict()
+
+
+def test_histograms_of_different_precision_are_not_merged():
+    with pytest.raises(ValueError):
+        LatencyHistogram(2).merge(LatencyHistogram(3))
+
+
+def test_dict_round_trip():
+    histogram = LatencyHistogram(3)
+    for value in (0.001, 0.0123, 1.5, 42.):
+        histogram.record(value)
+    restored = LatencyHistogram.from_dict(histogram.to_dict())
+    assert restored.to_dict() == histogram.to_dict()
+    assert restored.percentile(75) == histogram.percentile(75)
+
+
+def test_invalid_precision():
+    with pytest.raises(ValueError):
+        LatencyHistogram(0)
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from tools.cameras import CameraData
+from tools.image_sender import ImageSender
+from tools.load import LoadProfile
+from tools.load import run_sharded
+from tools.sender_engine import SendStats
+from tools.sender_engine import percentile
+
+CAMERAS = tuple(
+    CameraData(id=f'camera-{ix}', name=f'camera-{ix}', active=True, archived=False, analytics={}) for ix in range(2))
+
+
+@pytest.fixture
+def sender(standin, standin_client, user_config, tmp_path, monkeypatch):
+    ''' Base images are looked up in the current directory (by worker processes too) '''
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'base_images' / 'face').mkdir(parents=True)
+    Image.new('RGB', (64, 64), 'gray').save(tmp_path / 'base_images' / 'face' / 'female.jpg')
+    user_config['unit'] = {'url': standin.url}
+    sender = ImageSender(standin_client)
+    sender.configure_engine(workers=2)
+    yield sender
+    sender.close()
+
+
+def test_stats_of_shards_are_merged(standin, sender, monkeypatch):
+    standin.latency = 0.02
+    shard_stats = []
+    merge = SendStats.merge
+
+    def _merge(self, other):
+        shard_stats.append(other)
+        merge(self, other)
+
+    monkeypatch.setattr(SendStats, 'merge', _merge)
+    report = run_sharded(sender, LoadProfile(rate=40, duration=1, object_types=('face',), cameras=CAMERAS), 2)
+    assert [stats.count for stats in shard_stats] == [20, 20]   # shards by cameras
+    assert report['scheduled'] == report['count'] == len(standin.db) == 40
+    assert report['errors'] == 0
+    latencies = sorted(latency for stats in shard_stats for latency in stats.latencies)
+    for pct in (50, 95, 99):
+        assert report['latency_ms'][f'p{pct}'] == round(1000 * percentile(latencies, pct), 2)
+    assert report['latency_ms']['p50'] >= 20
+
+
+def test_token_is_refreshed_during_sharded_run(standin, sender):
+    profile = LoadProfile(rate=20, duration=4, object_types=('face',), cameras=CAMERAS)
+    reports = []
+    thread = threading.Thread(target=lambda: reports.append(run_sharded(sender, profile, processes=2)))
+    thread.start()
+    while not len(standin.db) and thread.is_alive():   # workers have started
+        time.sleep(0.05)
+    sender.client.set_access_token('refreshed-token')   # what refresh in the parent process does
+    time.sleep(0.2)   # packets with the old token in flight
+    standin.expired_tokens.add('token')
+    sent_before_expiration = len(standin.db)
+    thread.join()
+    report = reports[0]
+    assert report['errors'] == 0
+    assert report['scheduled'] == report['count'] == len(standin.db) == 80
+    assert sent_before_expiration < 80
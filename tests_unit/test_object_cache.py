@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from tools import ObjectData
+from tools.correlation import MICROSECONDS
+from tools.object_cache import ObjectCache
+
+
+def make_object(object_id: int, timestamp: float, base: str = 'face') -> ObjectData:
+    return ObjectData(
+        id=object_id,
+        cluster_size=1,
+        base=base,
+        camera_id='camera',
+        timestamp=timestamp,
+        roi=[0, 0, 1, 1],
+        meta={'bad_quality': 'good'},
+        is_reference=False,
+        parent_id=None,
+        image_url=f'/object-manager/objects/{object_id}/image',
+    )
+
+
+@pytest.fixture
+def cache(tmp_path) -> ObjectCache:
+    return ObjectCache(tmp_path / 'objects.sqlite', 'unit', company_id=1)
+
+
+def test_round_trip(cache):
+    items = [make_object(1, 100.5), make_object(2, 200.25, base='vehicle')]
+    cache.store(items)
+    assert cache.load('face') == items[:1]
+    assert cache.load('vehicle') == items[1:]
+    assert cache.high_water_mark('face') == 100.5
+    assert cache.high_water_mark('person') is None
+
+
+def test_store_updates_cached_objects(cache):
+    cache.store([make_object(1, 100.)])
+    updated = make_object(1, 100.)
+    updated.cluster_size = 5
+    cache.store([updated])
+    assert cache.load('face') == [updated]
+
+
+def test_load_window_and_limit(cache):
+    cache.store([make_object(ix, 100. + ix) for ix in range(10)])
+    assert [item.id for item in cache.load('face', since=105.)] == [5, 6, 7, 8, 9]
+    assert [item.id for item in cache.load('face', limit=3)] == [7, 8, 9]
+    assert [item.id for item in cache.load('face', since=108., limit=3)] == [8, 9]
+
+
+def test_environments_and_companies_are_separated(tmp_path, cache):
+    cache.store([make_object(1, 100.)])
+    assert ObjectCache(tmp_path / 'objects.sqlite', 'unit', company_id=2).load('face') == []
+    assert ObjectCache(tmp_path / 'objects.sqlite', 'other', company_id=1).load('face') == []
+
+
+def test_prune(cache):
+    cache.store([make_object(ix, 100. + ix) for ix in range(10)])
+    cache.prune(before=107.)
+    assert [item.id for item in cache.load('face')] == [7, 8, 9]
+
+
+def add_to_standin(standin, timestamp: float) -> ObjectData:
+    obj = standin.db.add(
+        {'label': 0, 'camera_id': 'camera', 'timestamp': round(timestamp * MICROSECONDS), 'meta': {}},
+        visible_at=0.,
+    )
+    return make_object(obj.id, obj.timestamp)
+
+
+def test_validate(standin, standin_client, cache):
+    now = time.time()
+    cache.store([add_to_standin(standin, now - 10), add_to_standin(standin, now - 5)])
+    assert cache.validate(standin_client)
+    assert len(cache.load('face')) == 2
+
+
+def test_cache_is_dropped_if_newest_object_is_missing(standin, standin_client, cache):
+    cache.store([add_to_standin(standin, time.time()), make_object(100, time.time() + 1)])
+    assert not cache.validate(standin_client)
+    assert cache.load('face') == []
+
+
+def test_cache_is_dropped_if_timestamp_has_changed(standin, standin_client, cache):
+    item = add_to_standin(standin, time.time())
+    item.timestamp += 0.5
+    cache.store([item])
+    assert not cache.validate(standin_client)
+    assert cache.load('face') == []
@@ -0,0 +1,125 @@
+from datetime import datetime
+import random
+
+import pytest
+
+import consts
+from tools.cameras import CameraData
+from tools.image_sender import Object
+from tools.object_store import ObjectStore
+
+CAMERAS = [CameraData(id=f'camera-{ix}', name=f'camera {ix}', active=True, archived=False, analytics={})
+           for ix in range(3)]
+BASES = ('face', 'vehicle', 'person')
+T0 = 1_700_000_000
+
+
+def random_meta(rng: random.Random) -> dict:
+    meta = {}
+    if rng.random() < 0.8:
+        meta |= rng.choice([consts.META_GOOD_QUALITY, consts.META_BAD_QUALITY])
+    if rng.random() < 0.5:
+        meta['gender'] = rng.choice(['male', 'female'])
+    if rng.random() < 0.3:
+        meta['age'] = rng.randint(10, 60)
+    if rng.random() < 0.2:
+        meta[consts.META_LIC_PLATE] = rng.choice(['12345', 'ABC', None])
+    if rng.random() < 0.1:
+        meta['colors'] = [rng.choice(['black', 'white'])]   # unhashable
+    return meta
+
+
+def random_object(rng: random.Random) -> Object:
+    obj = Object(
+        path=None,
+        camera=rng.choice(CAMERAS),
+        client=None,
+        base=rng.choice(BASES),
+        timestamp=T0 + rng.randint(0, 50) + rng.choice([0, 0.5]),
+        meta=random_meta(rng),
+    )
+    obj._is_meta_required = rng.random() < 0.3
+    return obj
+
+
+QUERIES = [
+    {},
+    {'base': 'face'},
+    {'base': 'unknown'},
+    {'camera_ids': ['camera-0']},
+    {'camera_ids': ['camera-1', 'camera-2'], 'base': 'vehicle'},
+    {'camera_ids': []},
+    {'time_from': T0 + 10},
+    {'time_to': T0 + 10},
+    {'time_from': T0 + 10, 'time_to': T0 + 10.5},
+    {'time_from': datetime.fromtimestamp(T0 + 20), 'time_to': datetime.fromtimestamp(T0 + 40), 'base': 'person'},
+    {'time_from': T0 + 60},
+    {'meta': consts.META_GOOD_QUALITY},
+    {'meta': consts.META_GOOD_QUALITY | {'gender': 'male'}, 'base': 'face', 'time_from': T0 + 5},
+    {'meta': {'gender': 'female'}, 'camera_ids': ['camera-0', 'camera-2']},
+    {'meta': {'colors': ['black']}},
+    {'meta': consts.META_LIC_PLATE_ANY},
+    {'meta': consts.META_LIC_PLATE_ANY | consts.META_BAD_QUALITY, 'base': 'vehicle'},
+    {'meta': consts.META_LIC_PLATE_12345},
+    {'meta': {consts.AGE_RANGE_STUB: (20, 30)} | consts.META_GOOD_QUALITY},
+    {'meta': consts.META_GOOD_QUALITY, 'predicate': lambda obj: (obj.meta.get('age') or 0) > 30},
+]
+
+
+def naive_find(objects, base=None, camera_ids=None, time_from=None, time_to=None, meta=None, predicate=None):
+    ''' Linear scan: the reference behaviour of `ObjectStore.find` '''
+    def to_timestamp(value):
+        return value.timestamp() if isinstance(value, datetime) else value
+
+    time_from, time_to = to_timestamp(time_from), to_timestamp(time_to)
+    return tuple(
+        obj for obj in objects
+        if (base is None or obj.base == base)
+        and (camera_ids is None or obj.camera.id in camera_ids)
+        and (time_from is None or obj.timestamp >= time_from)
+        and (time_to is None or obj.timestamp <= time_to)
+        and (not meta or obj.has_meta(meta))
+        and (predicate is None or predicate(obj))
+    )
+
+
+@pytest.fixture
+def objects():
+    rng = random.Random(42)
+    return [random_object(rng) for _ in range(500)]
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=[f'query-{ix}' for ix in range(len(QUERIES))])
+def test_queries_are_equivalent_to_linear_scan(objects, query):
+    store = ObjectStore(objects)
+    expected = naive_find(objects, **query)
+    assert store.find(**query) == expected
+    assert store.count(**query) == len(expected)
+
+
+def test_meta_is_reindexed(objects):
+    store = ObjectStore(objects)
+    rng = random.Random(7)
+    for obj in rng.sample(objects, 100):
+        obj._meta.update(random_meta(rng))
+        obj._is_meta_required = False
+        store.update_meta(obj)
+    for query in QUERIES:
+        assert store.find(**query) == naive_find(objects, **query)
+
+
+def test_pending(objects):
+    store = ObjectStore(objects)
+    assert store.pending() == tuple(obj for obj in objects if obj._is_meta_required)
+    assert store.pending('face') == tuple(obj for obj in objects if obj._is_meta_required and obj.base == 'face')
+    obj = store.pending()[0]
+    obj._is_meta_required = False
+    store.update_meta(obj)
+    assert obj not in store.pending()
+
+
+def test_object_is_appended_once(objects):
+    store = ObjectStore(objects[:10])
+    store.extend(objects[:20])
+    assert list(store) == objects[:20]
+    assert store[5] is objects[5]
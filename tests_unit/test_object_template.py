@@ -0,0 +1,74 @@
+import time
+
+import pytest
+from PIL import Image
+
+import tools.image_sender
+from tools.cameras import CameraData
+from tools.image_sender import Object
+from tools.synthetic import Variation
+from tools.templates import template_cache
+
+CAMERA = CameraData(id='camera-id', name='camera', active=True, archived=False, analytics={})
+
+
+class Client:
+    access_token = 'token'
+
+
+@pytest.fixture
+def template_path(tmp_path):
+    path = tmp_path / 'face.jpg'
+    Image.new('RGB', (64, 64), (120, 80, 40)).save(path)
+    return path
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    ''' Amount of encoded images '''
+    calls = []
+    encode_image = tools.image_sender.encode_image
+
+    def _encode_image(image):
+        calls.append(image)
+        return encode_image(image)
+
+    monkeypatch.setattr(tools.image_sender, 'encode_image', _encode_image)
+    return calls
+
+
+def make_object(path, **kwargs) -> Object:
+    return Object(path=path, camera=CAMERA, client=Client(), base='face', timestamp=time.time(), **kwargs)
+
+
+def test_variation_is_rendered_once(template_path, encoded):
+    obj = make_object(template_path, variation=Variation(identity=1))
+    image = obj.image
+    packet = obj.packet
+    assert obj.image is image
+    assert obj.packet['im_bytes'] == packet['im_bytes']
+    assert len(encoded) == 1
+
+
+def test_released_template_is_rendered_again(template_path, encoded):
+    obj = make_object(template_path, variation=Variation(identity=1))
+    im_bytes = obj.packet['im_bytes']
+    obj.release_template()
+    assert obj.packet['im_bytes'] == im_bytes   # the same variation gives the same image
+    assert len(encoded) == 2
+
+
+def test_plain_templates_are_shared(template_path):
+    template_cache.clear()
+    first, second = make_object(template_path), make_object(template_path)
+    assert first.template is second.template
+
+
+def test_one_off_template_is_loaded_once(template_path, monkeypatch):
+    loaded = []
+    load_template = tools.image_sender.load_template
+    monkeypatch.setattr(tools.image_sender, 'load_template', lambda path: loaded.append(path) or load_template(path))
+    obj = make_object(template_path, cache_template=False)
+    obj.image, obj.packet
+    assert loaded == [template_path]
+    assert make_object(template_path, cache_template=False).template is not obj.template
@@ -0,0 +1,125 @@
+import time
+
+import msgpack
+import pytest
+import requests
+from PIL import Image
+
+import tools.retry
+from tools.cameras import CameraData
+from tools.correlation import MICROSECONDS
+from tools.image_sender import ImageSender
+from tools.image_sender import Object
+from tools.packet_log import MAGIC
+from tools.packet_log import PacketLogError
+from tools.packet_log import PacketRecorder
+from tools.packet_log import PacketRewriter
+from tools.packet_log import read_packets
+from tools.packet_log import replay
+from tools.sender_engine import SenderEngine
+
+
+class Client:
+    access_token = 'replay-token'
+
+
+def make_packet(camera_id: str = 'camera-a', timestamp: int = 1_700_000_000 * MICROSECONDS) -> bytes:
+    return msgpack.packb({
+        'access_token': 'recorded-token',
+        'label': 0,
+        'track_id': 'recorded-track',
+        'camera_id': camera_id,
+        'timestamp': timestamp,
+        'meta': {},
+        'im_bytes': b'\xff\xd8jpeg',
+        'roi': [0, 0, 1, 1],
+    })
+
+
+def record(path, packets) -> None:
+    recorder = PacketRecorder(path)
+    for sent_at, packet in packets:
+        recorder.write(packet, sent_at)
+    recorder.close()
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'packets.bin'
+    packets = [(100. + ix, make_packet(timestamp=ix)) for ix in range(5)]
+    record(path, packets[:2])
+    record(path, packets[2:])   # appended to the same log
+    assert list(read_packets(path)) == packets
+    assert path.read_bytes().count(MAGIC) == 1
+
+
+@pytest.mark.parametrize('cut', [1, 5])
+def test_truncated_record_is_skipped(tmp_path, cut):
+    path = tmp_path / 'packets.bin'
+    packets = [(100., make_packet()), (101., make_packet())]
+    record(path, packets)
+    path.write_bytes(path.read_bytes()[:-cut])
+    assert list(read_packets(path)) == packets[:1]
+
+
+def test_not_a_packet_log(tmp_path):
+    path = tmp_path / 'packets.bin'
+    path.write_bytes(b'something else')
+    with pytest.raises(PacketLogError):
+        list(read_packets(path))
+
+
+def test_rewriter():
+    rewrite = PacketRewriter(Client(), cameras=['new-1', 'new-2'])
+    first = msgpack.unpackb(rewrite(make_packet('camera-a'), time_shift=10.))
+    second = msgpack.unpackb(rewrite(make_packet('camera-b'), time_shift=10.))
+    third = msgpack.unpackb(rewrite(make_packet('camera-a'), time_shift=10.))
+    assert first['access_token'] == 'replay-token'
+    assert first['timestamp'] == (1_700_000_000 + 10) * MICROSECONDS
+    assert len({first['track_id'], second['track_id'], third['track_id'], 'recorded-track'}) == 4
+    assert [first['camera_id'], second['camera_id'], third['camera_id']] == ['new-1', 'new-2', 'new-1']
+    assert first['im_bytes'] == b'\xff\xd8jpeg'
+
+
+def test_replay_to_standin(tmp_path, standin):
+    path = tmp_path / 'packets.bin'
+    record(path, [(100. + ix / 10, make_packet(timestamp=(1_700_000_000 + ix) * MICROSECONDS)) for ix in range(20)])
+    engine = SenderEngine(f'{standin.url}/meta-receiver/', timeout=(5, 5), workers=4)
+    try:
+        report = replay(engine, Client(), path, speed=0, cameras=['replayed'])
+    finally:
+        engine.close()
+    assert report['scheduled'] == 20
+    assert len(standin.db) == 20
+    assert {obj.camera_id for obj in standin.db.search('face', float('inf'), False, None, None)} == {'replayed'}
+
+
+def test_sent_object_is_recorded_once_without_token(tmp_path, standin, standin_client, user_config, monkeypatch):
+    user_config['unit'] = {'url': standin.url}
+    monkeypatch.setattr(tools.retry.time, 'sleep', lambda seconds: None)
+    template = tmp_path / 'face.jpg'
+    Image.new('RGB', (64, 64), 'gray').save(template)
+    path = tmp_path / 'packets.bin'
+    sender = ImageSender(standin_client)
+    sender.record_packets(path)
+    post = sender.engine.post
+    attempts = []
+
+    def _flaky_post(data):
+        attempts.append(data)
+        if len(attempts) == 1:
+            raise requests.exceptions.ConnectionError('Connection reset by peer')
+        return post(data)
+
+    monkeypatch.setattr(sender.engine, 'post', _flaky_post)
+    camera = CameraData(id='camera', name='camera', active=True, archived=False, analytics={})
+    sender._send_object(
+        Object(path=template, camera=camera, client=standin_client, base='face', timestamp=time.time()),
+        remember=False,
+    )
+    report = replay(sender.engine, standin_client, path, speed=0)   # replay is not recorded again
+    sender.close()
+    assert len(attempts) == 3
+    [(_, packet)] = read_packets(path)
+    assert msgpack.unpackb(packet)['access_token'] == ''
+    assert report['errors'] == 0   # token is filled in by replay
+    assert len(standin.db) == 2
@@ -0,0 +1,156 @@
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import threading
+
+import pytest
+from requests.models import Response
+
+import tools.response_cache
+from tools.client import ApiClient
+from tools.response_cache import ResponseCache
+
+CAMERAS = '/device-manager/cameras'
+
+
+def make_response(content: bytes = b'[]', etag: str = None) -> Response:
+    response = Response()
+    response.status_code = 200
+    response._content = content
+    if etag:
+        response.headers['ETag'] = etag
+    return response
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.response_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_fresh_response_is_returned_until_ttl(clock):
+    cache = ResponseCache()
+    response = make_response()
+    cache.store('key', CAMERAS, response)
+    assert cache.lookup('key', CAMERAS) == (response, {})
+    clock.now += 31   # ttl of cameras is 30s
+    assert cache.lookup('key', CAMERAS) == (None, {})
+    assert len(cache) == 0   # stale response without validators is dropped
+
+
+def test_stale_response_is_revalidated_by_etag(clock):
+    cache = ResponseCache()
+    response = make_response(etag='"v1"')
+    cache.store('key', CAMERAS, response)
+    clock.now += 31
+    assert cache.lookup('key', CAMERAS) == (None, {'If-None-Match': '"v1"'})
+    assert cache.revalidated('key') is response
+    assert cache.lookup('key', CAMERAS) == (response, {})   # fresh again
+
+
+def test_paths_without_rule_are_not_cached():
+    cache = ResponseCache()
+    cache.store('key', '/object-manager/v2/search/face', make_response())
+    assert len(cache) == 0
+    assert cache.lookup('key', '/object-manager/v2/search/face') == (None, {})
+
+
+def test_mutating_request_invalidates_rule():
+    cache = ResponseCache()
+    cache.store('cameras', CAMERAS, make_response())
+    cache.store('layouts', '/layout-manager/v2/layouts', make_response())
+    cache.invalidate(CAMERAS + '/camera-id')
+    assert cache.lookup('cameras', CAMERAS) == (None, {})
+    assert cache.lookup('layouts', '/layout-manager/v2/layouts')[0] is not None
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_bytes=3 * (100 + len(CAMERAS)))
+    for key in range(3):
+        cache.store(key, CAMERAS, make_response(b'x' * 100))
+    cache.lookup(0, CAMERAS)
+    cache.store(3, CAMERAS, make_response(b'x' * 100))
+    assert cache.lookup(1, CAMERAS) == (None, {})
+    assert cache.lookup(0, CAMERAS)[0] is not None
+
+
+class EtagServer(ThreadingHTTPServer):
+    ''' GET of any path: 200 with ETag or 304 if ETag matches '''
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _EtagHandler)
+        self.etag = '"v1"'
+        self.conditional = []   # If-None-Match of every request
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class _EtagHandler(BaseHTTPRequestHandler):
+    server: EtagServer
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if_none_match = self.headers.get('If-None-Match')
+        self.server.conditional.append(if_none_match)
+        if if_none_match == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'[]')
+
+
+@pytest.fixture
+def etag_server():
+    server = EtagServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(etag_server) -> ApiClient:
+    client = ApiClient(url=etag_server.url)
+    client.set_access_token('token')
+    client.enable_response_cache()
+    return client
+
+
+def test_client_revalidates_stale_response(etag_server, client, clock):
+    first = client.request('get', CAMERAS, expected_code=200)
+    clock.now += 31
+    assert client.request('get', CAMERAS, expected_code=200) is first
+    assert etag_server.conditional == [None, '"v1"']
+
+
+def test_client_requests_again_if_cached_response_has_gone(etag_server, client, clock):
+    client.request('get', CAMERAS, expected_code=200)
+    clock.now += 31
+    revalidated = client.response_cache.revalidated
+
+    def _revalidated(key):
+        client.response_cache.clear()   # e.g. invalidated by a concurrent request
+        return revalidated(key)
+
+    client.response_cache.revalidated = _revalidated
+    response = client.request('get', CAMERAS, expected_code=200)
+    assert response.status_code == 200
+    assert response.json() == []
+    assert etag_server.conditional == [None, '"v1"', None]
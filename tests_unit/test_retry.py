@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+
+import tools.retry
+from tools.retry import CircuitBreaker
+from tools.retry import CircuitOpenError
+from tools.retry import async_retry
+from tools.retry import circuit_breaker
+from tools.retry import retry
+from tools.retry import retry_budget
+from tools.retry import retry_delays
+
+
+class Flaky:
+    ''' Fails `failures` times, then returns amount of calls '''
+    __name__ = 'flaky'
+
+    def __init__(self, failures: int, exc: type = ConnectionError):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    def __call__(self) -> int:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc(f'call {self.calls}')
+        return self.calls
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tools.retry.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    ''' Sleeps of `retry` and `async_retry`: nothing is slept, clock is advanced '''
+    sleeps = []
+
+    def _sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    async def _async_sleep(seconds):
+        _sleep(seconds)
+
+    monkeypatch.setattr(tools.retry.time, 'sleep', _sleep)
+    monkeypatch.setattr(tools.retry.asyncio, 'sleep', _async_sleep)
+    return sleeps
+
+
+def test_default_delay_is_constant(sleeps):
+    func = retry(ConnectionError, tries=4, delay=2)(Flaky(3))
+    assert func() == 4
+    assert sleeps == [2, 2, 2]
+
+
+def test_exponential_backoff_is_capped():
+    delays = retry_delays(delay=1, backoff=2, max_delay=5, jitter=0)
+    assert [next(delays) for _ in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_jitter_bounds():
+    delays = retry_delays(delay=10, backoff=1, jitter=0.2)
+    assert all(8 <= next(delays) <= 12 for _ in range(100))
+
+
+def test_original_exception_is_raised_when_tries_are_over(sleeps):
+    func = retry(ConnectionError, tries=3, delay=0)(Flaky(5))
+    with pytest.raises(ConnectionError, match='call 3'):
+        func()
+    assert len(sleeps) == 2
+
+
+def test_other_exception_is_not_retried(sleeps):
+    func = retry(ConnectionError, tries=3)(Flaky(1, exc=ValueError))
+    with pytest.raises(ValueError):
+        func()
+    assert sleeps == []
+
+
+def test_circuit_open_error_is_not_retried(sleeps):
+    func = retry(Exception, tries=3)(Flaky(1, exc=CircuitOpenError))
+    with pytest.raises(CircuitOpenError):
+        func()
+    assert sleeps == []
+
+
+def test_timeout_stops_retries(sleeps, clock):
+    flaky = Flaky(10)
+
+    @retry(ConnectionError, tries=10, delay=3, timeout=10)
+    def func():
+        clock.now += 1
+        return flaky()
+
+    with pytest.raises(ConnectionError):
+        func()
+    # attempts at 1001, 1005, 1009: the next one would start after the timeout
+    assert flaky.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_on_retry_gets_arguments(sleeps):
+    retried = []
+
+    @retry(ConnectionError, tries=3, delay=0, on_retry=lambda *args, **kwargs: retried.append((args, kwargs)))
+    def func(flaky, key=None):
+        return flaky()
+
+    assert func(Flaky(2), key='value') == 3
+    assert len(retried) == 2
+    assert retried[0][1] == {'key': 'value'}
+
+
+def test_budget_limits_stacked_retries(sleeps):
+    flaky = Flaky(100)
+
+    @retry_budget(retries=3)
+    @retry(ConnectionError, tries=3, delay=0)
+    @retry(ConnectionError, tries=3, delay=0)
+    def func():
+        return flaky()
+
+    with pytest.raises(ConnectionError):
+        func()
+    assert flaky.calls == 4   # 9 attempts without budget
+
+
+def test_budget_is_per_call(sleeps):
+    flaky = Flaky(2)
+
+    @retry_budget(retries=2)
+    @retry(ConnectionError, tries=5, delay=0)
+    def func():
+        return flaky()
+
+    assert func() == 3
+    flaky.calls = 0
+    assert func() == 3   # budget of the first call doesn't leak
+
+
+def test_budget_timeout(sleeps, clock):
+    flaky = Flaky(100)
+
+    @retry_budget(timeout=5)
+    @retry(ConnectionError, tries=100, delay=2)
+    def func():
+        clock.now += 1
+        return flaky()
+
+    with pytest.raises(ConnectionError):
+        func()
+    assert flaky.calls == 2
+
+
+def test_async_retry_with_budget(sleeps):
+    flaky = Flaky(100)
+
+    @retry_budget(retries=2)
+    @async_retry(ConnectionError, tries=5, delay=1, backoff=2)
+    async def func():
+        return flaky()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(func())
+    assert flaky.calls == 3
+    assert sleeps == [1, 2]
+
+
+def test_breaker_transitions(clock):
+    breaker = CircuitBreaker('service', failure_threshold=2, reset_timeout=10)
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    clock.now += 10
+    assert breaker.allow()   # trial call
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN   # trial call has failed
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED   # failures are counted from zero
+
+
+def test_success_resets_consecutive_failures():
+    breaker = CircuitBreaker('service', failure_threshold=2)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breakers_are_shared_by_service_and_netloc(user_config):
+    user_config['circuit_breaker_threshold'] = 3
+    api = circuit_breaker('api', 'backend:443')
+    assert circuit_breaker('api', 'backend:443') is api
+    assert circuit_breaker('meta-receiver', 'backend:443') is not api
+    assert circuit_breaker('api', 'backend:8443') is not api
+
+
+def test_breakers_are_disabled(user_config):
+    user_config['circuit_breaker_threshold'] = 0
+    assert circuit_breaker('api', 'backend:443') is None
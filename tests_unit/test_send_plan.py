@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+import consts
+from tools import PreconditionException
+from tools.cameras import CameraData
+from tools.image_sender import ImageSender
+from tools.image_sender import Object
+from tools.object_store import ObjectStore
+from tools.send_plan import MAX_TOP_UPS
+from tools.send_plan import SendPlan
+
+
+def make_camera(name: str) -> CameraData:
+    return CameraData(id=f'id-{name}', name=name, active=True, archived=False, analytics={})
+
+
+class FakeSender(ImageSender):
+    ''' Objects are "sent" instantly; every `bad_every`-th object gets bad quality from backend '''
+    def __init__(self, bad_every: int = 0):
+        self.client = None
+        self._objects = ObjectStore()
+        self.bad_every = bad_every
+        self.sent = 0
+        self.bursts = []
+
+    def _submit_objects(self, object_type, count, camera, meta=None, **kwargs):
+        self.bursts.append(count)
+        for _ in range(count):
+            self.sent += 1
+            bad = self.bad_every and self.sent % self.bad_every == 0
+            self._objects.append(Object(
+                path=None,
+                camera=camera,
+                client=None,
+                base='face',
+                timestamp=time.time(),
+                meta=(meta or {}) | (consts.META_BAD_QUALITY if bad else consts.META_GOOD_QUALITY),
+            ))
+        return [], []
+
+    def _wait_sent(self, futures_):
+        pass
+
+    def get_meta_information_from_backend(self):
+        pass
+
+
+def test_deficit_is_sent_in_one_burst():
+    sender = FakeSender()
+    cameras = (make_camera('a'),)
+    plan = SendPlan(sender)
+    assert plan.require_min('face', 5, cameras) == 5
+    plan.execute()
+    assert sender.bursts == [5]
+    assert plan.count('face', cameras) == 5
+
+
+def test_planned_objects_are_counted_without_creating_objects():
+    sender = FakeSender()
+    cameras = (make_camera('a'), make_camera('b'))
+    plan = SendPlan(sender)
+    objects_created = Object.counter
+    assert plan.require_min('face-male', 3, cameras[:1]) == 3
+    assert plan.require_min('face', 2, cameras, meta=consts.META_MALE) == 0   # planned ones are counted
+    assert plan.require_min('face-female', 1, cameras) == 1
+    assert plan.require_min('face-30-age', 1, cameras[1:]) == 1
+    assert plan.count('face', cameras, meta=consts.META_ANY_QUALITY) == 5
+    assert plan.count('face', cameras[1:]) == 1
+    assert Object.counter == objects_created
+
+
+def test_objects_with_unexpected_meta_are_topped_up():
+    sender = FakeSender(bad_every=3)
+    cameras = (make_camera('a'),)
+    plan = SendPlan(sender)
+    plan.require_min('face', 7, cameras)
+    plan.execute()
+    assert sender.bursts == [7, 2, 1]   # 2 of 7 and 1 of 2 have bad quality
+    assert plan.count('face', cameras) == 7
+
+
+def test_top_ups_are_bounded():
+    sender = FakeSender(bad_every=1)
+    plan = SendPlan(sender)
+    plan.require_min('face', 2, (make_camera('a'),))
+    with pytest.raises(PreconditionException):
+        plan.execute()
+    assert len(sender.bursts) == MAX_TOP_UPS + 1
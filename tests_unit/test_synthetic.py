@@ -0,0 +1,24 @@
+import sys
+
+import pytest
+
+from tools.synthetic import SyntheticProfile
+
+
+def test_identities_are_spread_round_robin():
+    profile = SyntheticProfile(identities=3, seed=1)
+    variations = [profile.next_variation() for _ in range(7)]
+    assert [variation.identity for variation in variations[3:6]] == [variation.identity for variation in variations[:3]]
+    assert len({variation.identity for variation in variations}) == 3
+    assert len({variation.sample for variation in variations}) == 7
+
+
+def test_the_same_seed_gives_the_same_identities():
+    first, second = SyntheticProfile(identities=2, seed=5), SyntheticProfile(identities=2, seed=5)
+    assert [first.next_variation().identity for _ in range(4)] == [second.next_variation().identity for _ in range(4)]
+
+
+def test_clear_error_without_numpy(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'numpy', None)   # import fails
+    with pytest.raises(RuntimeError, match='require NumPy'):
+        SyntheticProfile()
@@ -0,0 +1,42 @@
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from tools.templates import draw_text
+from tools.templates import fit_font_size
+from tools.templates import get_font
+
+FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+
+@pytest.fixture(autouse=True)
+def font():
+    if not Path(FONT).exists():
+        pytest.skip(f'No font {FONT}')
+    get_font.cache_clear()
+
+
+@pytest.mark.parametrize('width', [1, 37, 200, 1234])
+def test_fitted_size_is_the_smallest_one_which_fills_width(width):
+    text = 'camera (42)\n2024-01-01 00:00:00'
+    size = fit_font_size(FONT, text, width)
+    assert get_font(FONT, size).getlength(text) >= width
+    assert size == 1 or get_font(FONT, size - 1).getlength(text) < width
+    # the same result as linear search of the original implementation
+    assert size == next(size for size in range(1, 1000) if get_font(FONT, size).getlength(text) >= width)
+
+
+def test_repeated_fit_is_served_from_cache():
+    fit_font_size(FONT, 'text', 500)
+    loaded = get_font.cache_info().misses
+    assert loaded < 20   # exponential + binary search
+    fit_font_size(FONT, 'text', 500)
+    assert get_font.cache_info().misses == loaded
+
+
+def test_draw_text():
+    image = Image.new('RGB', (200, 200), (0, 0, 0))
+    draw_text(image, 'text', FONT, xy=(0, 0))
+    assert (0, 255, 0) in {color for _, color in image.getcolors(maxcolors=200 * 200)}
+    assert get_font.cache_info().currsize > 0
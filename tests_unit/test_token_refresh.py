@@ -0,0 +1,158 @@
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import pickle
+import threading
+import time
+import uuid
+
+import jwt
+import pytest
+
+import tools.users
+from tools.client import ApiClient
+from tools.token_refresh import refresh_time
+from tools.token_refresh import token_expiration
+
+SECRET = 'unit-test-secret-which-is-long-enough-for-hs256'
+
+
+def issue_token(lifetime: float) -> str:
+    return jwt.encode({'exp': time.time() + lifetime, 'jti': uuid.uuid4().hex}, SECRET, algorithm='HS256')
+
+
+class AuthServer(ThreadingHTTPServer):
+    ''' Rotates refresh tokens: a refresh token can be exchanged only once '''
+    def __init__(self, lifetime: float):
+        super().__init__(('127.0.0.1', 0), _AuthHandler)
+        self.lifetime = lifetime
+        self.lock = threading.Lock()
+        self.prefix = uuid.uuid4().hex   # refresh tokens are unique between tests
+        self.refresh_tokens = {self.refresh_token(0)}
+        self.refreshes = 0
+        self.rejected = 0
+
+    def refresh_token(self, ix: int) -> str:
+        return f'refresh-{self.prefix}-{ix}'
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class _AuthHandler(BaseHTTPRequestHandler):
+    server: AuthServer
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code: int, body) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/auth-manager/auth/refresh-token'):
+            return self._reply(404, {})
+        time.sleep(0.1)   # concurrent refreshes overlap
+        with self.server.lock:
+            used = self.headers['refresh-token']
+            if used not in self.server.refresh_tokens:
+                self.server.rejected += 1
+                return self._reply(401, {'detail': 'Invalid refresh token'})
+            self.server.refresh_tokens.remove(used)
+            self.server.refreshes += 1
+            new_refresh_token = self.server.refresh_token(self.server.refreshes)
+            self.server.refresh_tokens.add(new_refresh_token)
+        self._reply(200, {'access_token': issue_token(self.server.lifetime), 'refresh_token': new_refresh_token})
+
+    def do_GET(self):
+        try:
+            jwt.decode(self.headers['access-token'], SECRET, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            return self._reply(403, {'detail': 'Token is expired'})
+        self._reply(200, {})
+
+
+@pytest.fixture
+def auth_server():
+    server = AuthServer(lifetime=60)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_company(monkeypatch):
+    monkeypatch.setattr(tools.users, 'set_company', lambda client: None)
+
+
+def make_client(server: AuthServer, access_token: str) -> ApiClient:
+    client = ApiClient(url=server.url)
+    client.set_refresh_token(server.refresh_token(0))
+    client.set_access_token(access_token)
+    return client
+
+
+def test_token_expiration():
+    token = issue_token(100)
+    assert token_expiration(token) == pytest.approx(time.time() + 100, abs=2)
+    assert token_expiration('not-a-jwt') is None
+    assert token_expiration(None) is None
+
+
+def test_refresh_time_is_not_earlier_than_half_of_lifetime():
+    assert refresh_time(expires_at=1000., ahead=60., now=0.) == 940.
+    assert refresh_time(expires_at=100., ahead=60., now=0.) == 50.
+
+
+def test_concurrent_requests_refresh_once(auth_server):
+    client = make_client(auth_server, issue_token(1))
+    time.sleep(1.5)
+    with futures.ThreadPoolExecutor(10) as executor:
+        responses = list(executor.map(lambda _: client.request('get', '/x', expected_code=200), range(10)))
+    assert len(responses) == 10
+    assert auth_server.refreshes == 1
+    assert auth_server.rejected == 0
+
+
+def test_clients_sharing_token_refresh_once(auth_server):
+    ''' The second client adopts tokens issued to the first one instead of reusing rotated refresh token '''
+    token = issue_token(1)
+    clients = [make_client(auth_server, token), make_client(auth_server, token)]
+    time.sleep(1.5)
+    with futures.ThreadPoolExecutor(10) as executor:
+        list(executor.map(lambda ix: clients[ix % 2].request('get', '/x', expected_code=200), range(10)))
+    assert auth_server.refreshes == 1
+    assert auth_server.rejected == 0
+    assert clients[0].access_token == clients[1].access_token != token
+    assert clients[0].refresh_token == clients[1].refresh_token == auth_server.refresh_token(1)
+
+
+def test_background_refresh(auth_server, user_config):
+    user_config['token_refresh_ahead'] = 1
+    auth_server.lifetime = 10
+    client = make_client(auth_server, issue_token(2))
+    time.sleep(2.5)   # refresh is scheduled in 1s
+    assert auth_server.refreshes == 1
+    assert token_expiration(client.access_token) > time.time() + 5
+    client.request('get', '/x', expected_code=200)
+    assert auth_server.refreshes == 1
+
+
+def test_unpickled_copy_leaves_refresh_to_original(auth_server, user_config):
+    user_config['token_refresh_ahead'] = 1
+    auth_server.lifetime = 10
+    original = make_client(auth_server, issue_token(2))
+    copy = pickle.loads(pickle.dumps(original))
+    time.sleep(2.5)
+    assert auth_server.refreshes == 1
+    assert auth_server.rejected == 0
+    assert original.refresh_token == auth_server.refresh_token(1)
+    assert copy.refresh_token == auth_server.refresh_token(0)   # copy hasn't touched the rotated token
@@ -13,6 +13,7 @@ from tools import PreconditionException
 from tools import RequestStatusCodeException
 from tools import attach_screenshot
 from tools import config
+from tools.arrival import arrival_tracker
 from tools.cameras import CameraDoesNotExist
 from tools.cameras import change_camera_panel_state
 from tools.cameras import enable_camera
@@ -78,6 +79,7 @@ def sender(client: ApiClient) -> Generator[ImageSender, None, None]:
     sender.init_objects()
     yield sender
     # TODO: check sender has correct amount of objects
+    log.info(f'Ingestion lag: {arrival_tracker}')
 
 
 @pytest.fixture(scope='module')
@@ -1,6 +1,13 @@
+import json
+
+import allure
 import pytest
 
 import consts
+from tools.ingestion_probe import IngestionProbe
+from tools.ingestion_probe import STAGE_CLUSTER
+from tools.ingestion_probe import STAGE_META
+from tools.ingestion_probe import STAGE_VISIBLE
 from tools.steps import prepare_cameras_for_suite
 from tools.search import search_api_v2
 from tools.types import EmailType
@@ -12,6 +19,14 @@ def cameras(client):
     return prepare_cameras_for_suite(client, count=1)
 
 
+def attach_probe_report(report):
+    allure.attach(
+        json.dumps(report.to_dict(), indent=2),
+        name='ingestion latency',
+        attachment_type=allure.attachment_type.JSON,
+    )
+
+
 def check_meta(sender, object_type, meta):
     sender.send(object_type)
     assert sender._objects[-1].has_meta(meta), f"{object_type} doesn't match meta: {meta}"
@@ -52,11 +67,15 @@ def test_is_clusterization_works(sender):
 
 
 def test_clickhouse_objects_arrive_speed(sender):
-    pass
+    report = IngestionProbe(sender).run(count=5, stages=(STAGE_VISIBLE, STAGE_META))
+    attach_probe_report(report)
+    assert report.is_complete, f'Not all objects have arrived: {report.missing}'
 
 
 def test_clusterization_speed(sender):
-    pass
+    report = IngestionProbe(sender).run(object_types=['face'], count=5, stages=(STAGE_VISIBLE, STAGE_CLUSTER))
+    attach_probe_report(report)
+    assert report.is_complete, f'Not all objects have been clustered: {report.missing}'
 
 
 @pytest.mark.parametrize('base', ['face'])
@@ -131,6 +131,7 @@ class ObjectData:
     is_reference: bool
     parent_id: Optional[int]
     image_url: UrlType
+    track_id: Optional[str] = None
 
     def __str__(self):
         return f'Object id={self.id} base={self.base} cluster_size={self.cluster_size}'
@@ -190,6 +191,7 @@ def json_to_object(data: dict, camera_id_field: str) -> ObjectData:
         meta=data['meta'],
         parent_id=data['parent_id'],
         image_url=data['image_url'],
+        track_id=data.get('track_id'),
     )
 
 
@@ -260,11 +262,25 @@ def generate_id_from_time(random_length: int = 5) -> str:
 
 
 def wait_objects_arrive(clickhouse_lag: bool = True) -> None:
+    """
+    Poll search until objects sent by `ImageSender` are visible.
+    Fixed `WAIT_OBJECTS_ARRIVE_TIME` is used only if it is unknown what has been sent.
+    Clickhouse lag is counted from the moment objects have arrived.
+    """
+    from tools.arrival import arrival_tracker
     from tools.time_tools import now_pst
+    from tools.time_tools import timestamp_to_date
     # TODO: clickhouse_lag=False by default
     if not config.last_object_sent_time:
         return
-    last_object_will_arrive = config.last_object_sent_time + WAIT_OBJECTS_ARRIVE_TIME
+    if arrival_tracker.unconfirmed():
+        arrival_tracker.wait()
+    last_arrival_time = arrival_tracker.last_arrival_time
+    if (last_arrival_time and not arrival_tracker.unconfirmed()
+            and timestamp_to_date(last_arrival_time) >= config.last_object_sent_time):
+        last_object_will_arrive = timestamp_to_date(last_arrival_time)
+    else:
+        last_object_will_arrive = config.last_object_sent_time + WAIT_OBJECTS_ARRIVE_TIME
     if clickhouse_lag:
         last_object_will_arrive += WAIT_CLICKHOUSE_LAG
     seconds_to_wait = round((last_object_will_arrive - now_pst()).total_seconds(), 2)
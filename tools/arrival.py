@@ -0,0 +1,187 @@
+'''
+Waiting for sent objects to become visible in search.
+
+Instead of sleeping a fixed amount of time after sending, backend is polled
+with growing delays (adaptive backoff) until every sent object is found or
+the deadline is reached. Every poll searches only within timestamps of
+objects which haven't been found yet and reads a few pages at most.
+Time between sending an object and finding it is recorded as ingestion lag.
+'''
+from __future__ import annotations
+from collections import defaultdict
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+import logging
+import threading
+import time
+
+import consts
+from tools import ObjectData
+from tools import config
+from tools.correlation import ObjectMatcher
+from tools.search import search_api_v2
+from tools.sender_engine import percentile
+if TYPE_CHECKING:
+    from tools.image_sender import Object
+
+log = logging.getLogger('tools.arrival')
+
+DEFAULT_ARRIVAL_TIMEOUT = 40.  # seconds
+SEARCH_PAGE_SIZE = 250
+SEARCH_MAX_PAGES = 4   # per poll: the window shrinks as objects are found
+
+# (pgoffset, pgsize, (start, end) timestamps) -> the newest objects of the window first
+PageRequest = Callable[[int, int, tuple[float, float]], Sequence[ObjectData]]
+OnMatch = Callable[['Object', ObjectData], None]
+
+
+def backoff_delays(
+        initial: float = 0.25,
+        factor: float = 1.5,
+        maximum: float = 2.) -> Iterator[float]:
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def scan_backend(
+        request_page: PageRequest,
+        matcher: ObjectMatcher,
+        on_match: OnMatch,
+        pgsize: int = SEARCH_PAGE_SIZE,
+        max_pages: int = SEARCH_MAX_PAGES,
+) -> int:
+    '''
+    One pass over objects from backend with timestamps of unmatched objects (at most `max_pages` pages).
+    The window starts at the whole second: backend may truncate timestamps to seconds.
+    Paging stops when every object is matched or the window is over.
+    Returns amount of matched objects.
+    '''
+    if not matcher:
+        return 0
+    matched = 0
+    timestamps = float(int(matcher.oldest_timestamp)), matcher.newest_timestamp
+    for page in range(max_pages):
+        items = request_page(page * pgsize, pgsize, timestamps)
+        for item in items:
+            if (obj := matcher.match(item)) is not None:
+                on_match(obj, item)
+                matched += 1
+        if not matcher or len(items) < pgsize:
+            break
+    return matched
+
+
+def wait_arrival(
+        request_page: PageRequest,
+        matcher: ObjectMatcher,
+        on_match: OnMatch,
+        timeout: Optional[float] = None,
+) -> bool:
+    '''
+    Poll backend until every object from `matcher` is found.
+    Returns False if deadline has been reached (unmatched objects are left in `matcher`).
+    '''
+    if timeout is None:
+        timeout = config.user_config.get('arrival_timeout', DEFAULT_ARRIVAL_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    for delay in backoff_delays():
+        scan_backend(request_page, matcher, on_match)
+        if not matcher:
+            return True
+        delay = min(delay, deadline - time.monotonic())
+        if delay <= 0:
+            return False
+        log.debug(f'{len(matcher)} objects have not arrived yet. Next check in {delay:.2f}s')
+        time.sleep(delay)
+    return False
+
+
+class ArrivalTracker:
+    '''
+    Objects which have been sent but not found in search yet
+    and ingestion lag of objects which have been found.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._unconfirmed: dict[int, Object] = {}
+        self.lags: list[float] = []
+        self.last_arrival_time: Optional[float] = None
+
+    def __len__(self):
+        return len(self._unconfirmed)
+
+    def __str__(self):
+        report = self.report()
+        return (f'arrived={report["count"]} unconfirmed={len(self)} '
+                f'lag p50={report["p50"]}s p95={report["p95"]}s max={report["max"]}s')
+
+    def sent(self, obj: Object) -> None:
+        with self._lock:
+            self._unconfirmed[id(obj)] = obj
+
+    def forget(self, obj: Object) -> None:
+        with self._lock:
+            self._unconfirmed.pop(id(obj), None)
+
+    def arrived(self, obj: Object) -> None:
+        now = time.time()
+        with self._lock:
+            if self._unconfirmed.pop(id(obj), None) is None:
+                return
+            self.last_arrival_time = now
+            if obj.sent_at is not None:
+                self.lags.append(now - obj.sent_at)
+
+    def unconfirmed(self) -> tuple[Object, ...]:
+        with self._lock:
+            return tuple(self._unconfirmed.values())
+
+    def report(self) -> Mapping[str, Any]:
+        ''' Ingestion lag in seconds. NB: accuracy is limited by polling interval '''
+        with self._lock:
+            lags = sorted(self.lags)
+        return {
+            'count': len(lags),
+            'mean': round(sum(lags) / len(lags), 2) if lags else 0.,
+            'p50': round(percentile(lags, 50), 2),
+            'p95': round(percentile(lags, 95), 2),
+            'max': round(lags[-1], 2) if lags else 0.,
+        }
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        ''' Wait until all sent objects are visible in search. Objects which haven't arrived are forgotten '''
+        by_base: dict[str, list[Object]] = defaultdict(list)
+        for obj in self.unconfirmed():
+            by_base[obj.base].append(obj)
+        arrived = True
+        for base, objects in by_base.items():
+            def request_page(pgoffset: int, pgsize: int, timestamps: tuple[float, float]) -> Sequence[ObjectData]:
+                return search_api_v2(
+                    objects[0]._client,
+                    base,
+                    consts.API_ANY_QUALITY,
+                    pgsize=pgsize,
+                    pgoffset=pgoffset,
+                    order=consts.API_ORDER_DATE_DESC,
+                    timestamps=timestamps,
+                )
+
+            matcher = ObjectMatcher(objects)
+            log.info(f'Wait {len(matcher)} {base} objects arrive')
+            if not wait_arrival(request_page, matcher, lambda obj, _: self.arrived(obj), timeout):
+                log.warning(f'{len(matcher)} {base} objects have not arrived: {matcher.remaining()}')
+                for obj in matcher.remaining():
+                    self.forget(obj)
+                arrived = False
+        log.info(f'Ingestion lag: {self}')
+        return arrived
+
+
+arrival_tracker = ArrivalTracker()
@@ -0,0 +1,217 @@
+'''
+asyncio counterpart of `ApiClient` for concurrent API fan-out (bulk setup and teardown).
+
+    async with AsyncApiClient(client) as aclient:
+        cameras = await asyncio.gather(*(create_camera(aclient, f'camera-{ix}') for ix in range(100)))
+
+`AsyncApiClient` runs `ApiClient.request` in a thread pool of `concurrency` threads,
+so retries, exceptions, token refresh (single-flight), response cache, circuit breakers and
+endpoint stats are the same as for sync requests, and keep-alive connections of the client are reused.
+'''
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Awaitable
+from typing import Iterable
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TypeVar
+import asyncio
+import contextvars
+import functools
+import logging
+import uuid
+
+from requests.models import Response
+
+import consts
+from tools import CompanyInfoData
+from tools import ObjectData
+from tools import RequestStatusCodeException
+from tools import json_to_object
+from tools import parse_api_exception_message
+from tools.cameras import CameraData
+from tools.cameras import CameraType
+from tools.cameras import CameraDoesNotExist
+from tools.cameras import NoMoreLicensesAvailable
+from tools.cameras import create_camera_data
+from tools.cameras import mark_camera_as_changed
+from tools.client import ApiClient
+from tools.getlist import GetList
+from tools.search import make_search_request
+from tools.types import FiltersType
+from tools.types import IdIntType
+from tools.types import IdStrType
+from tools.types import ImageTemplateType
+
+log = logging.getLogger('tools.async_client')
+
+DEFAULT_CONCURRENCY = 50
+
+T = TypeVar('T')
+
+
+class AsyncApiClient:
+    def __init__(self, client: ApiClient, concurrency: int = DEFAULT_CONCURRENCY):
+        self._client = client
+        self._concurrency = concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def __str__(self):
+        return f'Async {self._client}'
+
+    @property
+    def client(self) -> ApiClient:
+        return self._client
+
+    @property
+    def access_token(self):
+        return self._client.access_token
+
+    @property
+    def company(self):
+        return self._client.company
+
+    @property
+    def user(self):
+        return self._client.user
+
+    def close(self) -> None:
+        if self._executor is not None:
+            log.debug(f'{self}: close ({self._client.connection_stats})')
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        ''' NB: not `asyncio.to_thread`: its default executor would limit concurrency to a few threads '''
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._concurrency, thread_name_prefix='async-client')
+        return self._executor
+
+    async def request(
+            self,
+            method: str,
+            path_with_params: str,
+            headers: Optional[Mapping[str, Any]] = None,
+            data: Optional[Mapping[str, Any]] = None,
+            expected_code: Optional[int] = None,
+    ) -> Response:
+        ''' See `ApiClient.request` '''
+        call = functools.partial(
+            contextvars.copy_context().run,
+            self._client.request, method, path_with_params, headers, data, expected_code,
+        )
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+
+
+async def gather_limited(awaitables: Iterable[Awaitable[T]], limit: int) -> list[T]:
+    ''' `asyncio.gather` with at most `limit` awaitables running at the same time '''
+    semaphore = asyncio.Semaphore(limit)
+
+    async def _run(awaitable: Awaitable[T]) -> T:
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(_run(awaitable) for awaitable in awaitables))
+
+
+async def search_api_v2(
+        client: AsyncApiClient,
+        object_type: ImageTemplateType,
+        filters: FiltersType = consts.API_GOOD_QUALITY,
+        pgsize: int = 100,
+        pgoffset: int = 0,
+        order: Optional[FiltersType] = None,
+        camera_id: Optional[Sequence[IdStrType]] = None,
+        location_id: Optional[Sequence[IdStrType]] = None,
+        timestamps: Optional[tuple[float, float]] = None,
+) -> GetList[ObjectData]:
+    ''' See `tools.search.search_api_v2`. Use `asyncio.gather` over pages instead of `recursive` '''
+    base, data = make_search_request(
+        object_type, filters, pgsize, pgoffset, order, camera_id, location_id, timestamps)
+    response = await client.request('post', '/object-manager/v2/search/' + base, data=data, expected_code=200)
+    items = GetList([json_to_object(item, camera_id_field='camera_id') for item in response.json()['items']])
+    log.info(f'V2 search: found {len(items)} {base} objects {pgoffset=} {pgsize=}')
+    return items
+
+
+async def get_object(client: AsyncApiClient, object_id: IdIntType) -> ObjectData:
+    response = await client.request('get', f'/object-manager/objects/{object_id}', expected_code=200)
+    return json_to_object(response.json(), camera_id_field='camera')
+
+
+async def get_cameras(client: AsyncApiClient, camera_type: CameraType = "both") -> list[CameraData]:
+    ''' NB: unlike `tools.cameras.get_cameras`, cameras cache isn't used '''
+    response = await client.request(
+        "get",
+        f"/{consts.SERVICE_DEVICE_MANAGER}/cameras?cameras_type={camera_type}",
+        expected_code=200,
+    )
+    return [create_camera_data(data) for data in sorted(response.json(), key=lambda x: x["name"])]
+
+
+async def create_camera(client: AsyncApiClient, name: str, camera_id: Optional[str] = None) -> CameraData:
+    camera_id = camera_id or str(uuid.uuid4())
+    log.info(f'Creating {name} id:{camera_id}')
+    response = await client.request(
+        "put",
+        f'/device-manager/cameras/{camera_id}',
+        data={'name': name},
+        expected_code=201,
+    )
+    return create_camera_data(response.json())
+
+
+async def patch_camera(
+        client: AsyncApiClient,
+        camera: CameraData,
+        data: dict[str, Any],
+        mark_as_changed: bool = True,
+) -> CameraData:
+    if not data:
+        raise RuntimeError('No options were specified')
+    log.info(f'Patch {camera} -> {data}')
+    try:
+        if mark_as_changed:
+            mark_camera_as_changed(camera)
+        response = await client.request(
+            "patch",
+            f'/device-manager/cameras/{camera.id}',
+            data=data,
+            expected_code=200,
+        )
+    except RequestStatusCodeException as exc:
+        exc_data = parse_api_exception_message(exc)
+        if 'No more licenses available' in exc_data['message']:
+            raise NoMoreLicensesAvailable from exc
+        if 'doesn\'t exist' in exc_data['message']:
+            raise CameraDoesNotExist from exc
+        raise
+    return create_camera_data(response.json())
+
+
+async def delete_camera(client: AsyncApiClient, camera: CameraData) -> None:
+    log.warning(f'Delete {camera} by {client}')
+    try:
+        await client.request('delete', f'/device-manager/cameras/{camera.id}', expected_code=202)
+    except RequestStatusCodeException as exc:
+        exc_data = parse_api_exception_message(exc)
+        if 'doesn\'t exist' in exc_data['message']:
+            raise CameraDoesNotExist from exc
+        raise
+
+
+async def delete_company(client: AsyncApiClient, company: CompanyInfoData) -> None:
+    log.warning(f'Delete {company} by {client.user}')
+    await client.request(
+        'delete',
+        f'/{consts.SERVICE_AUTH_MANAGER}/v1/user/companies/{company.id}/',
+        expected_code=202,  # Accepted
+    )
@@ -0,0 +1,330 @@
+'''
+Throughput and latency benchmarks of `ImageSender` (offline, against `tools.standin.StandIn`).
+
+Benchmarks:
+ - packet_build: `Object.packet` + msgpack encoding rate (plain templates and templates with text)
+ - send_object: round-trip latency of sequential `ImageSender._send_object`
+ - send_scaling: `ImageSender.send(count=N)` throughput for several amounts of sender workers
+ - objects_query: `ImageSender.objects` query time for several object store sizes
+
+Results are written to JSON and compared with a stored baseline:
+
+    python -m tools.benchmark --output benchmark.json --baseline benchmark_baseline.json
+    python -m tools.benchmark --output benchmark_baseline.json   # store a new baseline
+
+Exit code is 1 if any metric is worse than the baseline by more than `--tolerance`.
+NB: base images are looked up in `ImageSender.base_images_dir` (relative to the current directory).
+'''
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+import argparse
+import datetime
+import json
+import logging
+import platform
+import random
+import sys
+import time
+import uuid
+
+import msgpack
+
+import consts
+from tools import config
+from tools.cameras import CameraData
+from tools.client import ApiClient
+from tools.image_sender import ImageSender
+from tools.image_sender import Object
+from tools.object_store import ObjectStore
+from tools.sender_engine import percentile
+from tools.standin import StandIn
+
+log = logging.getLogger('tools.benchmark')
+
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_WORKERS = (1, 2, 4, 8, 16)
+DEFAULT_STORE_SIZES = (1_000, 10_000, 100_000)
+OBJECT_TYPES = ('face', 'vehicle', 'person')
+QUERY_METAS = ({}, consts.META_MALE, consts.META_FEMALE)
+
+
+@dataclass
+class Metric:
+    name: str
+    value: float
+    unit: str
+    higher_is_better: bool
+
+
+@dataclass
+class Regression:
+    name: str
+    baseline: float
+    value: float
+    unit: str
+    change: float   # relative change: positive is worse
+
+    def __str__(self):
+        return f'{self.name}: {self.baseline} -> {self.value} {self.unit} ({self.change:+.0%})'
+
+
+@dataclass
+class BenchmarkSettings:
+    packets: int = 200
+    roundtrips: int = 200
+    send_count: int = 500
+    workers: Sequence[int] = DEFAULT_WORKERS
+    store_sizes: Sequence[int] = DEFAULT_STORE_SIZES
+    queries: int = 30
+    latency: float = 0.   # injected stand-in latency (seconds)
+    seed: int = 0
+
+
+def _timings_ms(name: str, timings: Sequence[float]) -> list[Metric]:
+    timings = sorted(timings)
+    return [
+        Metric(f'{name}.p50', round(1000 * percentile(timings, 50), 3), 'ms', False),
+        Metric(f'{name}.p95', round(1000 * percentile(timings, 95), 3), 'ms', False),
+    ]
+
+
+def _rate(name: str, count: int, duration: float, unit: str) -> Metric:
+    return Metric(name, round(count / duration, 1) if duration else 0., unit, True)
+
+
+@contextmanager
+def standin_environment(standin: StandIn) -> Iterator[None]:
+    ''' Point `tools.config` to the stand-in. The previous config is restored on exit '''
+    saved = config.user_config, config.environment
+    config.user_config = {
+        'requests_timeout': [5, 30],
+        'arrival_timeout': 10,
+        'standin': {'url': standin.url},
+    }
+    config.environment = 'standin'
+    try:
+        yield
+    finally:
+        config.user_config, config.environment = saved
+
+
+def make_camera(ix: int = 0) -> CameraData:
+    return CameraData(
+        id=str(uuid.UUID(int=ix + 1)), name=f'benchmark-camera-{ix}', active=True, archived=False, analytics={})
+
+
+def make_sender() -> ImageSender:
+    client = ApiClient()
+    client.set_access_token('benchmark-token')
+    sender = ImageSender(client)
+    sender._cameras_cached = [make_camera()]
+    return sender
+
+
+def _make_objects(sender: ImageSender, object_type: str, count: int, draw_text: bool) -> list[Object]:
+    return [
+        Object(
+            path=sender.get_template_path(object_type),
+            camera=sender.cameras[0],
+            client=sender.client,
+            base=object_type,
+            timestamp=time.time(),
+            draw_text=draw_text,
+        ) for _ in range(count)
+    ]
+
+
+def bench_packet_build(sender: ImageSender, settings: BenchmarkSettings) -> list[Metric]:
+    metrics = []
+    for variant, draw_text in (('plain', False), ('text', True)):
+        objects = []
+        for object_type in OBJECT_TYPES:
+            objects.extend(_make_objects(sender, object_type, settings.packets // len(OBJECT_TYPES), draw_text))
+        msgpack.packb(objects[0].packet)   # warm up template cache
+        time_start = time.perf_counter()
+        for obj in objects:
+            msgpack.packb(obj.packet)
+        metrics.append(
+            _rate(f'packet_build.{variant}', len(objects), time.perf_counter() - time_start, 'packets/s'))
+    return metrics
+
+
+def bench_send_object(sender: ImageSender, settings: BenchmarkSettings) -> list[Metric]:
+    objects = _make_objects(sender, 'face', settings.roundtrips, draw_text=False)
+    sender._send_object(objects[0], remember=False)   # warm up connection
+    timings = []
+    for obj in objects:
+        time_start = time.perf_counter()
+        sender._send_object(obj, remember=False)
+        timings.append(time.perf_counter() - time_start)
+    return _timings_ms('send_object.roundtrip', timings) + [
+        _rate('send_object.sequential', len(timings), sum(timings), 'objects/s')]
+
+
+def bench_send_scaling(sender: ImageSender, settings: BenchmarkSettings) -> list[Metric]:
+    metrics = []
+    for workers in settings.workers:
+        sender.configure_engine(workers=workers)
+        sender.send('face', count=workers, get_meta=False, remember=False)   # warm up connections
+        time_start = time.perf_counter()
+        sender.send('face', count=settings.send_count, get_meta=False, remember=False)
+        metrics.append(
+            _rate(f'send_scaling.workers_{workers}', settings.send_count, time.perf_counter() - time_start,
+                  'objects/s'))
+    return metrics
+
+
+def _fill_store(sender: ImageSender, size: int, rng: random.Random) -> ObjectStore:
+    ''' Objects spread over bases, 4 cameras, gender/quality meta and the last 24 hours '''
+    cameras = [make_camera(ix) for ix in range(4)]
+    now = time.time()
+    store = ObjectStore()
+    for _ in range(size):
+        base = rng.choice(OBJECT_TYPES)
+        meta = dict(rng.choice((consts.META_GOOD_QUALITY, consts.META_BAD_QUALITY)))
+        if base == consts.BASE_FACE:
+            meta.update(rng.choice((consts.META_MALE, consts.META_FEMALE)))
+        obj = Object(
+            path=None,
+            camera=rng.choice(cameras),
+            client=sender.client,
+            base=base,
+            timestamp=now - rng.uniform(0, 24 * 3600),
+            meta=meta,
+        )
+        obj._meta = meta
+        store.append(obj)
+    return store
+
+
+def bench_objects_query(sender: ImageSender, settings: BenchmarkSettings) -> list[Metric]:
+    rng = random.Random(settings.seed)
+    metrics = []
+    saved_objects = sender._objects
+    try:
+        for size in settings.store_sizes:
+            sender._objects = _fill_store(sender, size, rng)
+            cameras = [make_camera(ix) for ix in range(2)]
+            timings = []
+            for ix in range(settings.queries):
+                meta = QUERY_METAS[ix % len(QUERY_METAS)]
+                time_start = time.perf_counter()
+                sender.objects('face', meta=meta, cameras=cameras, timeslice='6h', log_info=False)
+                timings.append(time.perf_counter() - time_start)
+            metrics.extend(_timings_ms(f'objects_query.size_{size}', timings))
+    finally:
+        sender._objects = saved_objects
+    return metrics
+
+
+BENCHMARKS: Mapping[str, Callable[[ImageSender, BenchmarkSettings], list[Metric]]] = {
+    'packet_build': bench_packet_build,
+    'send_object': bench_send_object,
+    'send_scaling': bench_send_scaling,
+    'objects_query': bench_objects_query,
+}
+
+
+def run_benchmarks(settings: BenchmarkSettings, names: Sequence[str] = tuple(BENCHMARKS)) -> Mapping[str, Any]:
+    metrics: list[Metric] = []
+    with StandIn(latency=settings.latency, seed=settings.seed) as standin, standin_environment(standin):
+        sender = make_sender()
+        try:
+            for name in names:
+                log.info(f'Benchmark {name}')
+                time_start = time.perf_counter()
+                metrics.extend(BENCHMARKS[name](sender, settings))
+                log.info(f'Benchmark {name} finished in {time.perf_counter() - time_start:.1f}s')
+        finally:
+            sender.close()
+            sender.client.close()
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': asdict(settings),
+        'metrics': {metric.name: asdict(metric) for metric in metrics},
+    }
+
+
+def compare(results: Mapping[str, Any], baseline: Mapping[str, Any], tolerance: float) -> list[Regression]:
+    ''' Metrics which are worse than baseline by more than `tolerance` (relative change) '''
+    regressions = []
+    for name, metric in results['metrics'].items():
+        if (base_metric := baseline['metrics'].get(name)) is None:
+            log.info(f'{name}: no baseline')
+            continue
+        base_value, value = base_metric['value'], metric['value']
+        if not base_value:
+            continue
+        change = (value - base_value) / base_value
+        if metric['higher_is_better']:
+            change = -change
+        if change > tolerance:
+            regressions.append(Regression(name, base_value, value, metric['unit'], change))
+    return regressions
+
+
+def format_report(results: Mapping[str, Any], baseline: Optional[Mapping[str, Any]] = None) -> str:
+    lines = []
+    for name, metric in results['metrics'].items():
+        line = f'{name:<36} {metric["value"]:>12} {metric["unit"]}'
+        if baseline and (base_metric := baseline['metrics'].get(name)):
+            line += f'  (baseline {base_metric["value"]})'
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ImageSender throughput and latency benchmarks')
+    parser.add_argument('--output', type=Path, default=Path('benchmark.json'), help='Write results to JSON file')
+    parser.add_argument('--baseline', type=Path, help='Compare results with baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative regression (0.25 = 25%%)')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--packets', type=int, default=BenchmarkSettings.packets)
+    parser.add_argument('--roundtrips', type=int, default=BenchmarkSettings.roundtrips)
+    parser.add_argument('--send-count', type=int, default=BenchmarkSettings.send_count)
+    parser.add_argument('--workers', type=int, nargs='+', default=list(DEFAULT_WORKERS))
+    parser.add_argument('--store-sizes', type=int, nargs='+', default=list(DEFAULT_STORE_SIZES))
+    parser.add_argument('--queries', type=int, default=BenchmarkSettings.queries)
+    parser.add_argument('--latency', type=float, default=0., help='Stand-in response latency (seconds)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('tools.image_sender').setLevel(logging.WARNING)
+
+    results = run_benchmarks(
+        BenchmarkSettings(
+            packets=args.packets,
+            roundtrips=args.roundtrips,
+            send_count=args.send_count,
+            workers=args.workers,
+            store_sizes=args.store_sizes,
+            queries=args.queries,
+            latency=args.latency,
+            seed=args.seed,
+        ),
+        names=args.only,
+    )
+    args.output.write_text(json.dumps(results, indent=2))
+    log.info(f'Results are written to {args.output}')
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print(format_report(results, baseline))
+    if baseline:
+        if regressions := compare(results, baseline, args.tolerance):
+            print(f'{len(regressions)} regressions (tolerance {args.tolerance:.0%}):')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print(f'No regressions (tolerance {args.tolerance:.0%})')
@@ -1,6 +1,10 @@
 import logging
 from typing import Mapping
 from typing import Any
+from typing import Callable
+from typing import Optional
+import threading
+import time
 
 import allure
 import requests
@@ -12,14 +16,37 @@ from tools import RequestStatusCodeException
 from tools import UserData
 from tools import config
 from tools.config import get_env_data
+from tools.endpoint_stats import count_request_retry
+from tools.endpoint_stats import endpoint_stats
 from tools.local_storage import LocalStorage
+from tools.response_cache import DEFAULT_CACHE_SIZE
+from tools.response_cache import ResponseCache
+from tools.retry import CircuitOpenError
+from tools.retry import NETWORK_BACKOFF
+from tools.retry import NETWORK_JITTER
+from tools.retry import UNAVAILABLE_STATUS_CODES
+from tools.retry import circuit_breaker
 from tools.retry import retry
+from tools.retry import retry_budget
+from tools.token_refresh import DEFAULT_REFRESH_AHEAD
+from tools.token_refresh import refresh_scheduler
+from tools.token_refresh import refresh_time
+from tools.token_refresh import refreshed_tokens
+from tools.token_refresh import token_expiration
+from tools.sessions import ConnectionStats
+from tools.sessions import DEFAULT_POOL_SIZE
+from tools.sessions import PooledSession
 from tools.types import TokenType
 from tools.types import UrlType
 from tools.webdriver import CustomWebDriver
 
 log = logging.getLogger(__name__)
 
+SYNC_REFRESH_MARGIN = 5.  # seconds: refresh before request if background refresh hasn't happened
+REQUEST_RETRIES = 4           # retries of all reasons per request (see `tools.retry.retry_budget`)
+REQUEST_RETRY_TIMEOUT = 60.   # seconds
+API_SERVICE = 'api'           # circuit breaker of API
+
 
 class ApiClientException(Exception):
     pass
@@ -33,6 +60,11 @@ class NetworkProblemException(requests.exceptions.RequestException):
     pass
 
 
+class CircuitOpenException(NetworkProblemException, CircuitOpenError):
+    ''' Host has failed too many times in a row: request isn't sent (see `tools.retry.CircuitBreaker`) '''
+    pass
+
+
 class InternalServerErrorException(Exception):
     pass
 
@@ -54,14 +86,24 @@ class UserContextCouldntBeObtainedException(Exception):
 
 
 class ApiClient:
-    def __init__(self, url=None):
+    def __init__(self, url=None, pool_size=None):
         self._root_url: UrlType = url or UrlType(get_env_data()['url'])
         self._access_token: TokenType = None
+        self._token_expires_at: Optional[float] = None
+        self._refresh_lock = threading.RLock()
+        self._refreshing_thread: Optional[int] = None
+        self._proactive_refresh = True   # copies in worker processes leave refresh to the original client
+        self._token_listeners: list[Callable[[TokenType], None]] = []
         self._refresh_token: TokenType = None
         self._requests_timeout: tuple[int, int] = tuple(config.user_config['requests_timeout'])
         self._host: str = self._root_url.split('//')[1]  # TODO: parse url
         self._user: UserData = None
         self._company: CompanyInfoData = None
+        self._session = PooledSession(
+            pool_size or config.user_config.get('requests_pool_size', DEFAULT_POOL_SIZE))
+        self._response_cache: Optional[ResponseCache] = None
+        if config.user_config.get('response_cache', False):
+            self.enable_response_cache()
 
     @property
     def company(self) -> CompanyInfoData:
@@ -71,12 +113,50 @@ class ApiClient:
     def user(self) -> UserData:
         return self._user
 
+    @property
+    def connection_stats(self) -> ConnectionStats:
+        ''' Keep-alive statistics: how many requests reused already opened connection '''
+        return self._session.stats()
+
+    @property
+    def response_cache(self) -> Optional[ResponseCache]:
+        return self._response_cache
+
+    def enable_response_cache(self, max_bytes: Optional[int] = None) -> ResponseCache:
+        ''' Cache responses of read-mostly endpoints (see `tools.response_cache`) '''
+        self._response_cache = ResponseCache(
+            max_bytes=max_bytes or config.user_config.get('response_cache_size', DEFAULT_CACHE_SIZE))
+        return self._response_cache
+
+    def disable_response_cache(self) -> None:
+        self._response_cache = None
+
+    def close(self) -> None:
+        log.debug(f'{self}: close connection pool ({self.connection_stats})')
+        self._session.close()
+
     def copy(self, client) -> None:
         self.set_access_token(client.access_token)
         self.set_refresh_token(client.refresh_token)
         self.set_user(client.user)
         self.set_company(client.company)
 
+    def __getstate__(self):
+        ''' Client is picklable (for worker processes): connection pool isn't shared '''
+        state = self.__dict__.copy()
+        state['_session'] = self._session.pool_size
+        state['_response_cache'] = None   # cached responses aren't shared with worker processes
+        del state['_refresh_lock']
+        state['_refreshing_thread'] = None
+        state['_token_listeners'] = []
+        return state
+
+    def __setstate__(self, state):
+        state['_session'] = PooledSession(state['_session'])
+        state['_refresh_lock'] = threading.RLock()
+        state['_proactive_refresh'] = False
+        self.__dict__.update(state)
+
     def __eq__(self, o):
         return self.user.id == o.user.id and self.company.id == o.company.id
 
@@ -125,44 +205,145 @@ class ApiClient:
             if not new_token:
                 raise ApiClientException("empty token isn't allowed")
             self._access_token = new_token
+            self._token_expires_at = token_expiration(new_token)
+            self._schedule_refresh()
+            for listener in self._token_listeners:
+                listener(new_token)
+
+    def add_token_listener(self, listener: Callable[[TokenType], None]) -> None:
+        ''' `listener` gets every new access token (e.g. to pass it to worker processes) '''
+        self._token_listeners.append(listener)
+
+    def remove_token_listener(self, listener: Callable[[TokenType], None]) -> None:
+        self._token_listeners.remove(listener)
+
+    def _schedule_refresh(self) -> None:
+        ''' Refresh access token in background before it expires (see `tools.token_refresh`) '''
+        ahead = config.user_config.get('token_refresh_ahead', DEFAULT_REFRESH_AHEAD)
+        if not ahead or not self._proactive_refresh or self._token_expires_at is None:
+            return
+        refresh_scheduler.schedule(self, self._access_token, refresh_time(self._token_expires_at, ahead))
+
+    def refresh_access_token(self, expired_token: TokenType) -> bool:
+        '''
+        Refresh access token and select company again.
+        Single-flight: if several threads want to refresh the same token, only the first one does it;
+        clients which share refresh token adopt tokens issued to the first one (see `tools.token_refresh`).
+        Returns False if the token has already been refreshed.
+        '''
+        from tools.tokens import refresh_token
+        from tools.users import set_company
 
-    @retry(NetworkProblemException, delay=3, tries=3)
-    @retry(InternalServerErrorException)
-    @retry(TokenIsExpiredException)
-    @retry(YouDidNotSelectCompany)
-    def request(
+        with self._refresh_lock:
+            if self._access_token != expired_token:
+                return False
+            if self._refresh_token is None:
+                log.debug(f'{self}: no refresh token')
+                return False
+            used_refresh_token = self._refresh_token
+            with refreshed_tokens.lock(used_refresh_token):
+                if (issued := refreshed_tokens.issued(used_refresh_token)) is not None:
+                    log.info(f'{self}: adopt access token refreshed by another client')
+                    self.set_access_token(issued[0])
+                    self.set_refresh_token(issued[1])
+                    return True
+                log.info(f'{self}: refresh access token')
+                self._refreshing_thread = threading.get_ident()
+                try:
+                    refresh_token(self)
+                    set_company(self)
+                finally:
+                    self._refreshing_thread = None
+                refreshed_tokens.add(used_refresh_token, self._access_token, self._refresh_token)
+            return True
+
+    def _send(
             self,
             method: str,
             path_with_params: str,
-            headers: Mapping[str, Any] = None,  # type: ignore[assignment]
-            data: Mapping[str, Any] = None,     # type: ignore[assignment]
-            expected_code: int = None,          # type: ignore[assignment]
+            headers: Mapping[str, Any],
+            data: Mapping[str, Any],
     ) -> Response:
-        from tools.tokens import refresh_token
-        from tools.users import set_company
-
-        data = data or {}
-        headers = headers if headers is not None else {"access-token": self.access_token}
+        ''' One request (through circuit breaker, recorded into `tools.endpoint_stats`) '''
         url = self._root_url + path_with_params
+        breaker = circuit_breaker(API_SERVICE, self._host)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenException(f'{breaker}: {method.upper()} {url} is not sent')
+        time_start = time.perf_counter()
         try:
-            response = getattr(requests, method)(url, headers=headers, json=data, timeout=self._requests_timeout)
+            response = getattr(self._session, method)(url, headers=headers, json=data, timeout=self._requests_timeout)
             log.debug(f'{method.upper()} {url} {response.status_code}{" Payload: " + str(data) if data else ""}')
         except (requests.exceptions.RequestException,
                 urllib3.exceptions.MaxRetryError) as exc:
+            endpoint_stats.record(method, path_with_params, None, time.perf_counter() - time_start)
+            if breaker is not None:
+                breaker.failure()
             log.error(f'{exc} url: {method} {url}')
             log.error(f'{exc} data: {data}')
             log.error(f'{exc} headers: {headers}')
             raise NetworkProblemException(url) from exc
+        endpoint_stats.record(method, path_with_params, response.status_code, time.perf_counter() - time_start)
+        if breaker is not None:
+            if response.status_code in UNAVAILABLE_STATUS_CODES:
+                breaker.failure()
+            else:
+                breaker.success()
+        return response
+
+    def _is_refreshing(self) -> bool:
+        ''' Current thread is refreshing token (requests of refresh must not trigger refresh again) '''
+        return self._refreshing_thread == threading.get_ident()
+
+    @retry_budget(retries=REQUEST_RETRIES, timeout=REQUEST_RETRY_TIMEOUT)
+    @retry(NetworkProblemException, delay=3, tries=3, backoff=NETWORK_BACKOFF, jitter=NETWORK_JITTER,
+           on_retry=count_request_retry)
+    @retry(InternalServerErrorException, backoff=NETWORK_BACKOFF, jitter=NETWORK_JITTER, on_retry=count_request_retry)
+    @retry(TokenIsExpiredException, on_retry=count_request_retry)
+    @retry(YouDidNotSelectCompany, on_retry=count_request_retry)
+    def request(
+            self,
+            method: str,
+            path_with_params: str,
+            headers: Mapping[str, Any] = None,  # type: ignore[assignment]
+            data: Mapping[str, Any] = None,     # type: ignore[assignment]
+            expected_code: int = None,          # type: ignore[assignment]
+    ) -> Response:
+        data = data or {}
+        if headers is None and self._proactive_refresh and self._token_expires_at is not None \
+                and not self._is_refreshing() and time.time() > self._token_expires_at - SYNC_REFRESH_MARGIN:
+            self.refresh_access_token(self.access_token)
+        cache = self._response_cache if headers is None else None
+        cache_key = (self._company.id if self._company else None, path_with_params)
+        headers = headers if headers is not None else {"access-token": self.access_token}
+        conditional_headers: Mapping[str, str] = {}
+        if cache is not None:
+            if method.lower() == 'get':
+                cached_response, conditional_headers = cache.lookup(cache_key, path_with_params)
+                if cached_response is not None:
+                    return cached_response
+            else:
+                cache.invalidate(path_with_params)
+        response = self._send(method, path_with_params, headers | conditional_headers, data)
+        if cache is not None and method.lower() == 'get':
+            if response.status_code == 304:
+                if (cached_response := cache.revalidated(cache_key)) is not None:
+                    return cached_response
+                log.info(f'{path_with_params}: cached response has gone before revalidation. Request it again')
+                response = self._send(method, path_with_params, headers, data)
+            if response.status_code == 200:
+                cache.store(cache_key, path_with_params, response)
         if response.status_code == 500:
             raise InternalServerErrorException(response.text)
         if response.status_code == 502:
             raise BadGatewayException(response.text)
         if response.status_code == 403:
             if 'Token is expired' in response.text:
-                refresh_token(self)
-                set_company(self)
+                if not self._is_refreshing():
+                    self.refresh_access_token(headers.get('access-token', self._access_token))
                 raise TokenIsExpiredException(response.text)
             if 'You did not select company' in response.text:
+                from tools.users import set_company
+
                 set_company(self)
                 raise YouDidNotSelectCompany
         if response.status_code >= 400 and 'User is not confirmed' in response.text:
@@ -0,0 +1,143 @@
+'''
+Identity of sent objects.
+
+Every sent object has its own `track_id` and a timestamp which is unique
+within the process (microseconds are used as a counter). Objects from
+backend are matched to sent objects by `track_id` (if backend returns it)
+or by timestamp with microsecond precision. So objects may be sent back to
+back without waiting for the next second.
+
+If backend rounds timestamps to seconds, an object is matched only if it is
+the only one sent within the second with the same base, camera and meta.
+'''
+from __future__ import annotations
+from collections import defaultdict
+from collections import deque
+from typing import Deque
+from typing import Generic
+from typing import Iterable
+from typing import Optional
+from typing import TypeVar
+import logging
+import threading
+
+from tools import ObjectData
+
+log = logging.getLogger('tools.correlation')
+
+MICROSECONDS = 1_000_000
+
+_timestamps_lock = threading.Lock()
+_last_microseconds: dict[int, int] = {}   # second -> the last allocated microsecond
+
+
+T = TypeVar('T')  # any object with `track_id`, `timestamp`, `base`, `camera` and `meta` attributes
+
+
+def unique_timestamp(timestamp: float) -> float:
+    ''' Timestamp within the same second which hasn't been allocated in this process yet '''
+    second = int(timestamp)
+    with _timestamps_lock:
+        microsecond = max(
+            round((timestamp - second) * MICROSECONDS),
+            _last_microseconds.get(second, -1) + 1,
+        )
+        if microsecond >= MICROSECONDS:
+            raise RuntimeError(f'Too many objects with timestamp {second}')
+        _last_microseconds[second] = microsecond
+    return second + microsecond / MICROSECONDS
+
+
+def timestamp_key(timestamp: float) -> int:
+    return round(float(timestamp) * MICROSECONDS)
+
+
+def _template_meta(obj) -> dict:
+    ''' Meta which was sent with object (stubs like `_any_quality_stub` are not sent to backend) '''
+    return {key: value for key, value in obj.meta.items() if not key.startswith('_')}
+
+
+def _fingerprint(obj) -> tuple:
+    ''' Objects with the same fingerprint are indistinguishable for backend '''
+    return obj.base, obj.camera.id, repr(sorted(_template_meta(obj).items()))
+
+
+def _is_compatible(obj, item: ObjectData) -> bool:
+    if (obj.base, obj.camera.id) != (item.base, item.camera_id):
+        return False
+    return all(item.meta.get(key, value) == value for key, value in _template_meta(obj).items())
+
+
+class ObjectMatcher(Generic[T]):
+    '''
+    Index of sent objects by correlation keys.
+    Every object is matched at most once.
+    Priority: track id -> timestamp (microseconds) -> timestamp (seconds).
+    The last one is a fallback for backends which round timestamps to seconds:
+    base, camera and meta must match too and ambiguous candidates are not guessed.
+    '''
+    def __init__(self, objects: Iterable[T] = ()):
+        self._pending: dict[int, T] = {}   # id(obj) -> obj
+        self._by_track_id: dict[str, T] = {}
+        self._by_timestamp: dict[int, Deque[T]] = defaultdict(deque)
+        self._by_second: dict[int, Deque[T]] = defaultdict(deque)
+        for obj in objects:
+            self.add(obj)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, obj: T) -> None:
+        self._pending[id(obj)] = obj
+        if obj.track_id:
+            self._by_track_id[obj.track_id] = obj
+        self._by_timestamp[timestamp_key(obj.timestamp)].append(obj)
+        self._by_second[int(obj.timestamp)].append(obj)
+
+    @property
+    def oldest_timestamp(self) -> Optional[float]:
+        return min((obj.timestamp for obj in self._pending.values()), default=None)
+
+    @property
+    def newest_timestamp(self) -> Optional[float]:
+        return max((obj.timestamp for obj in self._pending.values()), default=None)
+
+    def remaining(self) -> list[T]:
+        return list(self._pending.values())
+
+    def match(self, item: ObjectData) -> Optional[T]:
+        ''' Find (and forget) sent object which corresponds to object from backend '''
+        obj = None
+        if item.track_id:
+            obj = self._by_track_id.pop(item.track_id, None)
+            if obj is not None and id(obj) not in self._pending:
+                obj = None
+        if obj is None:
+            obj = self._pop(self._by_timestamp, timestamp_key(item.timestamp))
+        if obj is None and float(item.timestamp).is_integer():
+            obj = self._pop_second(item)
+        if obj is not None:
+            del self._pending[id(obj)]
+        return obj
+
+    def _pop(self, index: dict[int, Deque[T]], key: int) -> Optional[T]:
+        queue = index.get(key)
+        while queue:
+            obj = queue.popleft()
+            if id(obj) in self._pending:
+                return obj
+        return None
+
+    def _pop_second(self, item: ObjectData) -> Optional[T]:
+        queue = self._by_second.get(int(item.timestamp))
+        if not queue:
+            return None
+        candidates = [obj for obj in queue if id(obj) in self._pending and _is_compatible(obj, item)]
+        if not candidates:
+            return None
+        if len({_fingerprint(obj) for obj in candidates}) > 1:
+            log.debug(f'{item.id}: {len(candidates)} different objects were sent within {int(item.timestamp)}, skip')
+            return None
+        obj = candidates[0]
+        queue.remove(obj)
+        return obj
@@ -0,0 +1,228 @@
+'''
+Per-endpoint statistics of backend requests.
+
+Every request of `ApiClient` (and `AsyncApiClient`) and every packet posted by `ImageSender` is recorded by endpoint:
+method and path template (ids are replaced by placeholders, query string is dropped).
+An endpoint has amount of requests, latency histogram, status codes and amount of retries.
+Requests which didn't get response (network problems) are counted as status "error".
+One registry is shared by the run. See `tools.pytest_endpoint_stats` for the session report.
+'''
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Iterable
+from typing import Mapping
+from typing import Optional
+import logging
+import re
+import threading
+
+from tools.histogram import LatencyHistogram
+
+log = logging.getLogger('tools.endpoint_stats')
+
+STATUS_ERROR = 'error'
+SORT_KEYS = ('total', 'count', 'p95', 'errors', 'retries')
+
+_VERSION = re.compile(r'v\d+')
+_DIGIT = re.compile(r'\d')
+
+
+def path_template(path: str) -> str:
+    '''
+    /device-manager/cameras/3f2c...?x=1 -> /device-manager/cameras/{id}
+    Segments with digits are ids (except API versions like "v2"), segments with "@" are emails.
+    '''
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    segments = []
+    for segment in path.split('/'):
+        if '@' in segment:
+            segment = '{email}'
+        elif _DIGIT.search(segment) and not _VERSION.fullmatch(segment):
+            segment = '{id}'
+        segments.append(segment)
+    return '/'.join(segments)
+
+
+@dataclass
+class EndpointStats:
+    method: str
+    path: str
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    status_codes: Counter = field(default_factory=Counter)
+    retries: int = 0
+
+    @property
+    def count(self) -> int:
+        return self.latency.count
+
+    @property
+    def errors(self) -> int:
+        ''' Requests without response or with 5xx status code '''
+        return sum(
+            amount for status, amount in self.status_codes.items()
+            if status == STATUS_ERROR or str(status).startswith('5')
+        )
+
+    def sort_key(self, key: str) -> float:
+        if key == 'total':
+            return self.latency.total
+        if key == 'p95':
+            return self.latency.percentile(95)
+        return getattr(self, key)
+
+    def merge(self, other: EndpointStats) -> None:
+        self.latency.merge(other.latency)
+        self.status_codes.update(other.status_codes)
+        self.retries += other.retries
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {
+            'method': self.method,
+            'path': self.path,
+            'count': self.count,
+            'errors': self.errors,
+            'retries': self.retries,
+            'status_codes': {str(status): amount for status, amount in sorted(self.status_codes.items(), key=str)},
+            'latency': self.latency.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> EndpointStats:
+        return cls(
+            method=data['method'],
+            path=data['path'],
+            latency=LatencyHistogram.from_dict(data['latency']),
+            status_codes=Counter({
+                int(status) if status.isdigit() else status: amount
+                for status, amount in data['status_codes'].items()
+            }),
+            retries=data['retries'],
+        )
+
+
+class EndpointStatsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: dict[tuple[str, str], EndpointStats] = {}
+
+    def __bool__(self):
+        return bool(self._endpoints)
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    def _endpoint(self, method: str, path: str) -> EndpointStats:
+        key = method.upper(), path_template(path)
+        if (endpoint := self._endpoints.get(key)) is None:
+            endpoint = self._endpoints[key] = EndpointStats(*key)
+        return endpoint
+
+    def record(self, method: str, path: str, status: Optional[int], seconds: float) -> None:
+        ''' `status` is None if request failed without response '''
+        with self._lock:
+            endpoint = self._endpoint(method, path)
+            endpoint.latency.record(seconds)
+            endpoint.status_codes[STATUS_ERROR if status is None else status] += 1
+
+    def retried(self, method: str, path: str) -> None:
+        with self._lock:
+            self._endpoint(method, path).retries += 1
+
+    def endpoints(self) -> list[EndpointStats]:
+        with self._lock:
+            return list(self._endpoints.values())
+
+    def top(self, amount: Optional[int] = None, key: str = 'total') -> list[EndpointStats]:
+        ''' Endpoints which took the most time (or by another key from `SORT_KEYS`) '''
+        if key not in SORT_KEYS:
+            raise ValueError(f'Unknown sort key {key}. Expected one of {SORT_KEYS}')
+        endpoints = sorted(self.endpoints(), key=lambda endpoint: endpoint.sort_key(key), reverse=True)
+        return endpoints[:amount] if amount is not None else endpoints
+
+    def merge(self, endpoints: Iterable[EndpointStats]) -> None:
+        with self._lock:
+            for other in endpoints:
+                self._endpoint(other.method, other.path).merge(other)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._endpoints.clear()
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {'endpoints': [endpoint.to_dict() for endpoint in self.top()]}
+
+    def load(self, data: Mapping[str, Any]) -> None:
+        ''' Merge stats dumped by `to_dict` (e.g. by pytest-xdist worker) '''
+        self.merge(EndpointStats.from_dict(endpoint) for endpoint in data['endpoints'])
+
+    def format_table(self, amount: Optional[int] = None, key: str = 'total') -> str:
+        endpoints = self.top(amount, key)
+        header = ('method', 'path', 'count', 'total s', 'p50 ms', 'p95 ms', 'max ms', 'errors', 'retries', 'status codes')
+        rows = [header]
+        for endpoint in endpoints:
+            latency = endpoint.latency
+            rows.append((
+                endpoint.method,
+                endpoint.path,
+                str(endpoint.count),
+                f'{latency.total / 1000:.1f}',
+                str(latency.percentile(50)),
+                str(latency.percentile(95)),
+                str(latency.max or 0),
+                str(endpoint.errors),
+                str(endpoint.retries),
+                ' '.join(f'{status}:{amount}' for status, amount in sorted(endpoint.status_codes.items(), key=str)),
+            ))
+        widths = [max(len(row[ix]) for row in rows) for ix in range(len(header))]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+            for row in rows
+        )
+
+    def to_prometheus(self, prefix: str = 'autotest_api') -> str:
+        ''' Text exposition format: request counters, retries and latency summaries (quantiles in seconds) '''
+        def _labels(endpoint: EndpointStats, **extra) -> str:
+            labels = {'method': endpoint.method, 'path': endpoint.path} | extra
+            return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+        endpoints = self.top()
+        lines = [
+            f'# HELP {prefix}_requests_total Requests by endpoint and status code',
+            f'# TYPE {prefix}_requests_total counter',
+        ]
+        for endpoint in endpoints:
+            for status, amount in sorted(endpoint.status_codes.items(), key=str):
+                lines.append(f'{prefix}_requests_total{_labels(endpoint, status=status)} {amount}')
+        lines += [
+            f'# HELP {prefix}_retries_total Retried requests by endpoint',
+            f'# TYPE {prefix}_retries_total counter',
+        ]
+        for endpoint in endpoints:
+            lines.append(f'{prefix}_retries_total{_labels(endpoint)} {endpoint.retries}')
+        lines += [
+            f'# HELP {prefix}_request_duration_seconds Request latency by endpoint',
+            f'# TYPE {prefix}_request_duration_seconds summary',
+        ]
+        for endpoint in endpoints:
+            latency = endpoint.latency
+            for quantile in (0.5, 0.95, 0.99):
+                value = latency.percentile(quantile * 100) / 1000
+                lines.append(f'{prefix}_request_duration_seconds{_labels(endpoint, quantile=quantile)} {value}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{_labels(endpoint)} {latency.total / 1000}')
+            lines.append(f'{prefix}_request_duration_seconds_count{_labels(endpoint)} {latency.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def count_request_retry(client: Any, method: str, path_with_params: str, *args, **kwargs) -> None:
+    ''' `on_retry` callback of `retry` decorators of `request(method, path_with_params, ...)` methods '''
+    endpoint_stats.retried(method, path_with_params)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+endpoint_stats = EndpointStatsRegistry()
@@ -0,0 +1,109 @@
+'''
+HDR-style latency histogram: constant memory, percentiles with bounded relative error.
+'''
+from __future__ import annotations
+from collections import Counter
+from typing import Any
+from typing import Mapping
+from typing import Optional
+import math
+
+REPORT_PERCENTILES = (50, 75, 90, 95, 99, 100)
+
+
+class LatencyHistogram:
+    '''
+    Log-linear histogram in milliseconds (as HdrHistogram does):
+    values are grouped into buckets which keep `significant_digits` decimal digits,
+    so memory doesn't depend on amount of values and percentiles have bounded relative error.
+    '''
+    def __init__(self, significant_digits: int = 2):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError(f'significant_digits should be in range [1, 5]: {significant_digits}')
+        self.significant_digits = significant_digits
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._counts: Counter[int] = Counter()   # the lowest value of bucket -> amount of values
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def __len__(self):
+        return self.count
+
+    def __str__(self):
+        if not self.count:
+            return 'no values'
+        return ' '.join(f'p{pct}={self.percentile(pct)}ms' for pct in (50, 95, 99)) + f' max={self.max}ms'
+
+    def _bucket(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self._sub_bucket_bits)
+        return (value >> shift) << shift
+
+    def _highest_equivalent(self, bucket: int) -> int:
+        shift = max(0, bucket.bit_length() - self._sub_bucket_bits)
+        return bucket + (1 << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, round(seconds * 1000))
+        self._counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: LatencyHistogram) -> None:
+        if other.significant_digits != self.significant_digits:
+            raise ValueError('Histograms with different precision can not be merged')
+        self._counts.update(other._counts)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, pct: float) -> int:
+        ''' Value (ms) which `pct` percents of values are less or equal to (within bucket precision) '''
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return min(self._highest_equivalent(bucket), self.max)
+        return self.max
+
+    def distribution(self) -> list[tuple[int, int, float]]:
+        ''' (bucket highest value in ms, amount, cumulative percentile) rows, like HdrHistogram output '''
+        rows = []
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            rows.append((self._highest_equivalent(bucket), self._counts[bucket], round(100 * seen / self.count, 3)))
+        return rows
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {
+            'count': self.count,
+            'min_ms': self.min or 0,
+            'mean_ms': round(self.total / self.count, 1) if self.count else 0.,
+            'total_ms': self.total,
+            'percentiles_ms': {f'p{pct}': self.percentile(pct) for pct in REPORT_PERCENTILES},
+            'max_ms': self.max or 0,
+            'significant_digits': self.significant_digits,
+            'buckets': {str(bucket): amount for bucket, amount in sorted(self._counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> LatencyHistogram:
+        ''' Inverse of `to_dict` (e.g. histograms collected by another process) '''
+        histogram = cls(data['significant_digits'])
+        histogram._counts.update({int(bucket): amount for bucket, amount in data['buckets'].items()})
+        histogram.count = data['count']
+        histogram.total = data['total_ms']
+        if histogram.count:
+            histogram.min = data['min_ms']
+            histogram.max = data['max_ms']
+        return histogram
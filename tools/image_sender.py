@@ -1,14 +1,14 @@
 from datetime import datetime
+from collections import Counter
 from concurrent import futures
-from functools import cached_property
 from pathlib import Path
 from typing import Any
+from typing import Callable
 from typing import Sequence
 from typing import Mapping
 from typing import MutableMapping
 from typing import TypedDict
 from typing import Optional
-import io
 import json
 import logging
 import re
@@ -16,21 +16,30 @@ import shutil
 import time
 import uuid
 
-from PIL import Image, ImageDraw, ImageFile, ImageFont
+from PIL import Image, ImageFile
 from requests.exceptions import ConnectionError
 from requests.exceptions import JSONDecodeError
 from typing_extensions import Self
 import allure
 import msgpack
 import pytest
-import requests
 
 import consts
 from tools import ObjectData
 from tools import PreconditionException
 from tools import config
 from tools import parse_object_type
+from tools.arrival import arrival_tracker
+from tools.arrival import backoff_delays
+from tools.arrival import wait_arrival
 from tools.config import get_env_data
+from tools.correlation import ObjectMatcher
+from tools.correlation import timestamp_key
+from tools.correlation import unique_timestamp
+from tools.endpoint_stats import endpoint_stats
+from tools.histogram import LatencyHistogram
+from tools.retry import NETWORK_BACKOFF
+from tools.retry import NETWORK_JITTER
 from tools.retry import retry
 from tools.cameras import CameraData
 from tools.cameras import get_camera_by_id
@@ -38,12 +47,29 @@ from tools.cameras import get_camera_by_name
 from tools.cameras import get_cameras
 from tools.client import ApiClient
 from tools.objects import get_object
+from tools.packet_log import PacketRecorder
+from tools.object_cache import DEFAULT_REFRESH_WINDOW
+from tools.object_cache import open_object_cache
+from tools.object_fetch import DEFAULT_FETCH_WORKERS
+from tools.object_fetch import FetchBound
+from tools.object_fetch import fetch_pages
+from tools.object_store import ObjectStore
 from tools.search import search_api_v2
+from tools.send_plan import SendPlan
+from tools.sender_engine import DEFAULT_WORKERS
+from tools.sender_engine import SenderEngine
+from tools.synthetic import SyntheticProfile
+from tools.synthetic import Variation
+from tools.synthetic import synthesize
+from tools.templates import Template
+from tools.templates import draw_text
+from tools.templates import encode_image
+from tools.templates import load_template
+from tools.templates import template_cache
 from tools.time_tools import Ago
-from tools.time_tools import filter_objects_by_timeslice
-from tools.time_tools import filter_objects_by_timestamps
 from tools.time_tools import format_date_chart_like
 from tools.time_tools import now_pst
+from tools.time_tools import timeslice_to_range
 from tools.time_tools import timestamp_to_date
 from tools.types import ImageTemplateType
 from tools.types import TimestampType
@@ -74,9 +100,18 @@ BASE_TO_ID = {
     consts.BASE_PERSON: 2,
 }
 DEFAULT_ROI = Roi({'x1': 0.05, 'y1': 0.05, 'x2': 0.95, 'y2': 0.95})
+DEFAULT_INIT_DEPTH = 250   # objects per base loaded by `init_objects`
+DEFAULT_CLUSTER_TIMEOUT = 100.  # seconds
+CLUSTER_POLL_WORKERS = 8
 MetaType = MutableMapping[str, Any]
 
 
+def template_to_roi(template: ImageTemplateType) -> Roi:
+    return {
+        'face-male': Roi({'x1': 0.1, 'y1': 0.05, 'x2': 0.9, 'y2': 0.75}),
+    }.get(template, DEFAULT_ROI)
+
+
 def parse_template(object_type: ImageTemplateType, **kwargs) -> MetaType:
     base, attribute, _ = parse_object_type(object_type)
     meta = (kwargs.pop('meta', None) or {}).copy()
@@ -115,6 +150,22 @@ def parse_template(object_type: ImageTemplateType, **kwargs) -> MetaType:
     } | kwargs
 
 
+def has_meta(meta: MetaType, req_meta: MetaType) -> bool:
+    """ `meta` has all attributes of `req_meta` """
+    # NB: make sure you handle all stubs properly
+    for req_key in req_meta:
+        if req_key in (consts.AGE_RANGE_STUB, ):
+            continue
+        if req_key == consts.META_LIC_PLATE and req_meta[req_key] == '*':
+            if meta.get(consts.META_LIC_PLATE):
+                return True  # object has any license plate
+        if req_key not in meta:
+            return False
+        if meta[req_key] != req_meta[req_key]:
+            return False
+    return True
+
+
 class Object:
     FONT = 'courier.ttf'
     counter = 0
@@ -129,9 +180,15 @@ class Object:
             draw_text: bool = False,
             roi: Optional[Roi] = None,
             meta: MetaType = {},
+            track_id: Optional[str] = None,
+            cache_template: bool = True,
+            variation: Optional[Variation] = None,
     ):
         self._id: IdIntType = None  # type: ignore[assignment]
+        self._track_id = track_id or str(uuid.uuid4())
         self._path = path
+        self._cache_template = cache_template
+        self._variation = variation
         self._base = base
         self._meta = meta | consts.META_ANY_QUALITY  # type: ignore[assignment]
         self._camera = camera
@@ -139,10 +196,10 @@ class Object:
         self._is_meta_required = True
         self._roi = roi
         self._timestamp = timestamp
+        self._sent_at: Optional[float] = None
         Object.counter += 1
-
-        if draw_text:
-            self._draw_text()
+        self._text = self._make_text() if draw_text else None
+        self._template: Optional[Template] = None
 
     @property
     def meta(self):
@@ -158,15 +215,42 @@ class Object:
             base=data.base,
             timestamp=data.timestamp,
             roi=data.roi,
+            track_id=data.track_id,
         )
         obj.set_meta(data)
         return obj
 
-    @cached_property
-    def image(self) -> Image.Image:
+    @property
+    def template(self) -> Template:
+        """
+        Decoded image and encoded JPEG bytes. Memoized per object until `release_template`.
+        Plain templates are shared between objects via process-wide cache (key: path).
+        One-off images (`cache_template=False`) bypass the shared cache.
+        Images with text or synthetic variation are unique: they are rendered once from the cached template.
+        NB: not `functools.cached_property`: its lock (python < 3.12) would serialize rendering in sender workers
+        """
+        if self._template is None:
+            self._template = self._load_template()
+        return self._template
+
+    def release_template(self) -> None:
+        """ Forget memoized image (e.g. when object has been sent): it is loaded or rendered again on demand """
+        self._template = None
+
+    def _load_template(self) -> Template:
         if not self._path:
             raise RuntimeError
-        return Image.open(self._path)
+        if self._variation is not None:
+            return self._render_variation()
+        if not self._cache_template:
+            return load_template(self._path)
+        if self._text is None:
+            return template_cache.get((self._path, None), lambda: load_template(self._path))
+        return self._render_text()
+
+    @property
+    def image(self) -> Image.Image:
+        return self.template.image
 
     def __str__(self):
         return f'{self.base} at {self.timestamp} from {self.camera} id:{self.id}'
@@ -179,6 +263,16 @@ class Object:
     def id(self) -> int:
         return self._id
 
+    @property
+    def track_id(self) -> str:
+        """ Correlation key: the same value is sent to meta-receiver """
+        return self._track_id
+
+    @property
+    def sent_at(self) -> Optional[float]:
+        """ Time when meta-receiver accepted the object """
+        return self._sent_at
+
     @property
     def datetime(self) -> datetime:
         return timestamp_to_date(self.timestamp)
@@ -193,18 +287,17 @@ class Object:
 
     @property
     def packet(self) -> Mapping[str, Any]:
-        image_bytes = io.BytesIO()
-        self.image.save(image_bytes, format='JPEG', exif=b'')
+        template = self.template
         image_packet = {
             'access_token': self._client.access_token,
             'label': BASE_TO_ID[self.base],
-            'track_id': str(uuid.uuid4()),
+            'track_id': self._track_id,
             'camera_id': self._camera.id,
-            'timestamp': int(self.timestamp * 1e6),
+            'timestamp': timestamp_key(self.timestamp),
             'meta': self._meta,
             'score': 1.0,
-            'im_bytes': image_bytes.getvalue(),
-            'im_shape': (self.image.size[1], self.image.size[0], 3),
+            'im_bytes': template.im_bytes,
+            'im_shape': template.im_shape,
             'analytics': [f'{self.base}:dummy'],
             'roi': self._roi,
         }
@@ -221,36 +314,31 @@ class Object:
         self._is_meta_required = False
 
     def has_meta(self, req_meta: MetaType) -> bool:
-        # NB: make sure you handle all stubs properly
-        for req_key in req_meta:
-            if req_key in (consts.AGE_RANGE_STUB, ):
-                continue
-            if req_key == consts.META_LIC_PLATE and req_meta[req_key] == '*':
-                if self._meta.get(consts.META_LIC_PLATE):
-                    return True  # object has any license plate
-            if req_key not in self._meta:
-                return False
-            if self._meta[req_key] != req_meta[req_key]:
-                return False
-        return True
-
-    def _draw_text(self) -> None:
-        text = f"{self._camera['name']} ({Object.counter})\n{self.datetime}"
-        font_size = 1
-        font = ImageFont.truetype(self.FONT, font_size)
-        img_width_segment = 1.1
-
-        while font.getsize(text)[0] < img_width_segment * self.image.size[0]:
-            font_size += 1
-            font = ImageFont.truetype(self.FONT, font_size)
-
-        drawer = ImageDraw.Draw(self.image)
-        drawer.text(
-            xy=(10, 100),
-            text=text,
-            fill=(0, 255, 0),
-            font=font,
-        )
+        return has_meta(self._meta, req_meta)
+
+    def _make_text(self) -> str:
+        return f"{self._camera.name} ({Object.counter})\n{self.datetime}"
+
+    def _render_text(self) -> Template:
+        """ Draw text on a copy of template image: cached template must stay untouched """
+        base_template = template_cache.get((self._path, None), lambda: load_template(self._path))
+        image = base_template.image.copy()
+        self._draw_text(image, self._text)
+        return encode_image(image)
+
+    def _render_variation(self) -> Template:
+        base_template = template_cache.get((self._path, None), lambda: load_template(self._path))
+        image = synthesize(base_template.image, self._variation)
+        if self._text is not None:
+            self._draw_text(image, self._text)
+        return encode_image(image)
+
+    def _draw_text(self, image: Image.Image, text: str) -> None:
+        draw_text(image, text, self.FONT)
+
+
+def _count_send_retry(sender: 'ImageSender', *args, **kwargs) -> None:
+    endpoint_stats.retried('post', sender.engine.path)
 
 
 class ImageSender:
@@ -260,9 +348,59 @@ class ImageSender:
     def __init__(self, client: ApiClient):
         self.client = client
         self._metareceiver_url = f'{get_env_data()["url"]}/meta-receiver/'
-        self._objects = []
+        self._objects = ObjectStore()
         self._requests_timeout = tuple(config.user_config['requests_timeout'])
         self._cameras_cached = None
+        self._engine: Optional[SenderEngine] = None
+        self._recorder: Optional[PacketRecorder] = None
+        self.cluster_latency = LatencyHistogram()   # time since sending until object is in cluster
+        if cache_size := config.user_config.get('template_cache_size'):
+            template_cache.resize(cache_size)
+
+    @property
+    def engine(self) -> SenderEngine:
+        """
+        Long-lived engine which sends packets to meta-receiver.
+        Created on demand with settings from config (`sender_workers`, `sender_inflight`)
+        """
+        if self._engine is None:
+            self.configure_engine(
+                workers=config.user_config.get('sender_workers', DEFAULT_WORKERS),
+                inflight=config.user_config.get('sender_inflight'),
+            )
+        return self._engine
+
+    def configure_engine(self, workers: int = DEFAULT_WORKERS, inflight: Optional[int] = None) -> SenderEngine:
+        if self._engine is not None:
+            self._engine.close()
+        self._engine = SenderEngine(
+            self._metareceiver_url,
+            timeout=self._requests_timeout,
+            workers=workers,
+            inflight=inflight,
+        )
+        return self._engine
+
+    def record_packets(self, path: str | Path) -> PacketRecorder:
+        """
+        Record every object sent to meta-receiver (see `tools.packet_log`).
+        Packets are recorded once per object (not per attempt) and without access token
+        """
+        self.stop_recording()
+        self._recorder = PacketRecorder(path)
+        return self._recorder
+
+    def stop_recording(self) -> None:
+        if self._recorder is None:
+            return
+        self._recorder.close()
+        self._recorder = None
+
+    def close(self) -> None:
+        if self._engine is not None:
+            self._engine.close()
+            self._engine = None
+        self.stop_recording()
 
     @property
     def cameras(self):
@@ -292,23 +430,10 @@ class ImageSender:
             meta=None, **kwargs) -> Self:
         # TODO: it is silly to apply 'meta' to different object types from 'conditions'
         cameras = self._normalize_cameras(cameras)
-        kwargs['meta'] = meta  # kwargs for `objects_count`. but meta is required for `objects_count` and `send` methods
+        plan = SendPlan(self)
         for object_type, min_objects_amount in conditions.items():
-            actual_count = self.objects_count(**parse_template(object_type, **kwargs), cameras=cameras)
-            condition_str = f"min condition object_type:{object_type} {self._repr_meta(meta)}: {actual_count} >= {min_objects_amount}"
-            objects_amount_required = min_objects_amount - actual_count
-            if objects_amount_required <= 0:
-                log.info(f"{condition_str} OK!")
-                continue
-            log.info(f"{condition_str}: need {objects_amount_required} more objects")
-            self.send(
-                camera=cameras[0],
-                count=objects_amount_required,
-                object_type=object_type,
-                get_meta=False,
-                meta=meta,
-            )
-        self.get_meta_information_from_backend()
+            plan.require_min(object_type, min_objects_amount, cameras, meta=meta, **kwargs)
+        plan.execute()
         return self
 
     def check_max_objects_count(
@@ -338,17 +463,15 @@ class ImageSender:
         """
         cam_sets = [self._normalize_cameras(cam_set) for cam_set in cam_sets]
         min_count = kwargs.pop('min_count', 1)
+        plan = SendPlan(self)
 
         for cam_set in cam_sets:
             if not cam_set:
                 raise RuntimeError("camera set is empty")
-            self.check_min_objects_count({object_type: min_count}, cameras=cam_set, **kwargs)
+            plan.require_min(object_type, min_count, cam_set, **kwargs)
 
         sorted_count = sorted(
-            [
-                (cam_set, self.objects_count(**parse_template(object_type, **kwargs), cameras=cam_set))
-                for cam_set in cam_sets
-            ],
+            [(cam_set, plan.count(object_type, cam_set, **kwargs)) for cam_set in cam_sets],
             key=lambda x: x[1],
         )
 
@@ -356,11 +479,8 @@ class ImageSender:
             if ix == 0:
                 continue
             prev_objects_count = sorted_count[ix-1][1]
-            self.check_min_objects_count(
-                {object_type: prev_objects_count+ix},
-                cameras=cam_set,
-                **kwargs,
-            )
+            plan.require_min(object_type, prev_objects_count+ix, cam_set, **kwargs)
+        plan.execute()
 
         report = ""
         for cam_set in cam_sets:
@@ -371,25 +491,20 @@ class ImageSender:
 
     def check_diff_objects_count(self, object_types, cameras=None, min_count=1, **kwargs):
         cameras = self._normalize_cameras(cameras)
+        plan = SendPlan(self)
         for object_type in object_types:
-            self.check_min_objects_count({object_type: min_count}, cameras=cameras, **kwargs)
+            plan.require_min(object_type, min_count, cameras, **kwargs)
 
         sorted_count = sorted(
-            [
-                (object_type, self.objects_count(**parse_template(object_type, **kwargs), cameras=cameras))
-                for object_type in object_types
-            ],
+            [(object_type, plan.count(object_type, cameras, **kwargs)) for object_type in object_types],
             key=lambda x: x[1],
         )
         for ix, (object_type, _) in enumerate(sorted_count):
             if ix == 0:
                 continue
             prev_objects_count = sorted_count[ix-1][1]
-            self.check_min_objects_count(
-                {object_type: prev_objects_count+ix},
-                cameras=cameras,
-                **kwargs,
-            )
+            plan.require_min(object_type, prev_objects_count+ix, cameras, **kwargs)
+        plan.execute()
 
         report = ""
         for object_type in object_types:
@@ -413,6 +528,30 @@ class ImageSender:
         timeslice: None, 1h, 6h, 1d, 3d, 1w, 2w
         # TODO: support intervals
         """
+        query, description = self._make_query(object_type, meta, cameras, timeslice, date_from, date_to)
+        objects = self._objects.find(**query)
+        if log_info:
+            log.info(f"Image Sender: {description}: {len(objects)} found")
+        return objects
+
+    def objects_count(
+            self,
+            object_type,
+            meta=None,
+            cameras=None,
+            timeslice=consts.DEFAULT_TIMESLICE,
+            log_info=True,
+            date_from=None,
+            date_to=None,
+    ):
+        query, description = self._make_query(object_type, meta, cameras, timeslice, date_from, date_to)
+        count = self._objects.count(**query)
+        if log_info:
+            log.info(f"Image Sender: {description}: {count} found")
+        return count
+
+    def _make_query(self, object_type, meta, cameras, timeslice, date_from, date_to):
+        """ Convert `objects` arguments into `ObjectStore` query and its description (for logging) """
         if date_from and timeslice:
             log.warning(f'Overwrite timeslice {timeslice} -> None (since date_from = {date_from})')
             timeslice = None
@@ -424,23 +563,22 @@ class ImageSender:
         if consts.AGE_RANGE_STUB in meta and base != 'face':
             raise RuntimeError(f'Age range is available only for faces (base={base})')
         cameras = self._normalize_cameras(cameras)
-        objects = tuple(filter(lambda x: x.camera.id in [c.id for c in cameras], self._objects))
-        objects = tuple(filter(lambda x: x.base == base, objects))
+        predicate = None
         if consts.AGE_RANGE_STUB in meta:
             age_from, age_to = meta[consts.AGE_RANGE_STUB]
-            objects = tuple(filter(lambda x: age_from <= (x._meta.get('age') or -1) <= age_to, objects))
+            predicate = lambda x: age_from <= (x._meta.get('age') or -1) <= age_to
         if timeslice:
-            objects = filter_objects_by_timeslice(objects, lambda x: getattr(x, 'datetime'), timeslice)
-        else:
-            objects = filter_objects_by_timestamps(objects, lambda x: getattr(x, 'datetime'), date_from, date_to)
-
-        objects = tuple(filter(lambda x: x.has_meta(meta), objects))
-        if log_info:
-            log.info(f"Image Sender: base:{base} timeslice:{timeslice} {self._repr_meta(meta)} {self._repr_list_of_cameras(cameras)}: {len(objects)} found")
-        return objects
-
-    def objects_count(self, *args, **kwargs):
-        return len(self.objects(*args, **kwargs))
+            date_from, date_to = timeslice_to_range(timeslice)
+        query = {
+            'base': base,
+            'camera_ids': [c.id for c in cameras],
+            'time_from': date_from,
+            'time_to': date_to,
+            'meta': meta,
+            'predicate': predicate,
+        }
+        description = f"base:{base} timeslice:{timeslice} {self._repr_meta(meta)} {self._repr_list_of_cameras(cameras)}"
+        return query, description
 
     def objects_count_for_ages(
             self,
@@ -529,19 +667,29 @@ class ImageSender:
         else:
             raise RuntimeError(f"Unknown cameras type: {cameras}")
 
-    @retry(ConnectionError, tries=3, delay=3)
     def _send_object(self, obj, remember=True):
         if not obj.camera.active:
             log.warning(f'{obj.camera} is not active')
         if obj.camera.archived:
             log.warning(f'{obj.camera} is archived')
-        log.info(f'Send object: {obj} with meta {self._repr_meta(obj._meta)}')
-        response = requests.post(
-            self._metareceiver_url,
-            headers={'Content-Type': 'application/msgpack'},
-            data=msgpack.packb(obj.packet),
-            timeout=self._requests_timeout,
-        )
+        log.debug(f'Send object: {obj} with meta {self._repr_meta(obj._meta)}')
+        if self._recorder is not None:
+            self._recorder.write(msgpack.packb({**obj.packet, 'access_token': ''}))
+        self._post_object(obj)
+        obj._sent_at = time.time()
+        obj.release_template()
+        if remember:
+            self._objects.append(obj)
+            arrival_tracker.sent(obj)
+        else:
+            log.debug(f'Do not remember object: {obj}')
+
+        config.last_object_sent_time = now_pst()
+
+    @retry(
+        ConnectionError, tries=3, delay=3, backoff=NETWORK_BACKOFF, jitter=NETWORK_JITTER, on_retry=_count_send_retry)
+    def _post_object(self, obj):
+        response = self.engine.post(msgpack.packb(obj.packet))
         try:
             data = response.json()
         except JSONDecodeError as exc:
@@ -551,23 +699,62 @@ class ImageSender:
         if response.status_code != 200:
             raise RuntimeError(f'Bad response: {response.text}')
 
-        if remember:
-            self._objects.append(obj)
-        else:
-            log.warning(f'Do not remember object: {obj}')
-
-        config.last_object_sent_time = now_pst()
-
-    def init_objects(self, *args, **kwargs):
-        def init_for_base(base, pgoffset, pgsize):
-            items = self._request_last_objects(base, pgoffset=pgoffset, pgsize=pgsize, *args, **kwargs)
-            log.info(f"\tGot {len(items)} {base} objects {pgoffset=} {pgsize=}")
-            for item in items:
+    def init_objects(self, *args, depth=None, window=None, **kwargs):
+        """
+        Load objects from on-disk cache (see `tools.object_cache`) and
+        request from backend only objects newer than the cached ones.
+        Pages of all bases are requested concurrently and objects are added as soon as pages arrive.
+        depth: max amount of objects per base, cached and fresh ones together (config `init_objects_depth`)
+        window: request objects not older than `window` seconds (config `init_objects_window`)
+        Cache isn't used if extra search arguments are specified.
+        """
+        depth = depth or config.user_config.get('init_objects_depth', DEFAULT_INIT_DEPTH)
+        window = window or config.user_config.get('init_objects_window')
+        cache = None if args or kwargs else open_object_cache(self.client)
+        if cache:
+            cache.validate(self.client)
+        refresh_window = config.user_config.get('object_cache_refresh', DEFAULT_REFRESH_WINDOW)
+        window_start = time.time() - window if window else None
+        bounds = {}
+        for base in consts.BASES_ALL:
+            since = window_start
+            if cache and (high_water_mark := cache.high_water_mark(base)) is not None:
+                since = max(since or 0, high_water_mark - refresh_window)
+            bounds[base] = FetchBound(since=since, depth=depth)
+        log.info(f"Init objects for {self.client}: {bounds}")
+
+        def request_page(base, pgoffset, pgsize):
+            page = self._request_last_objects(
+                base, pgoffset=pgoffset, pgsize=pgsize, *args, **({'order': consts.API_ORDER_DATE_DESC} | kwargs))
+            log.info(f"\tGot {len(page)} {base} objects {pgoffset=} {pgsize=}")
+            return page
+
+        def add(item: ObjectData) -> None:
+            try:
                 self._objects.append(Object.init_from_dict(self, item))
-
-        for base in ("face", "vehicle", "person"):
-            log.info(f"Init {base} objects for {self.client}")
-            init_for_base(base, 0, 250)
+            except RuntimeError as exc:  # camera has been deleted
+                log.debug(f'Skip {item}: {exc}')
+
+        fresh_items: dict[int, ObjectData] = {}
+        workers = config.user_config.get('init_objects_workers', DEFAULT_FETCH_WORKERS)
+        for _, page in fetch_pages(request_page, bounds, workers=workers):
+            for item in page:
+                if item.id not in fresh_items:
+                    fresh_items[item.id] = item
+                    add(item)
+        cached_count = 0
+        if cache:
+            fresh_count = Counter(item.base for item in fresh_items.values())
+            for base in consts.BASES_ALL:
+                if (slots := depth - fresh_count[base]) <= 0:
+                    continue
+                cached = [item for item in cache.load(base, since=window_start, limit=depth)
+                          if item.id not in fresh_items]
+                for item in cached[-slots:]:   # the newest ones
+                    add(item)
+                    cached_count += 1
+            cache.store(fresh_items.values())
+        log.info(f'{len(self._objects)} objects: {len(fresh_items)} from backend, {cached_count} from cache')
 
     def _request_last_objects(self, base, pgsize=100, pgoffset=0, *args, **kwargs):
         return search_api_v2(
@@ -579,6 +766,17 @@ class ImageSender:
             *args, **kwargs,
         )
 
+    def resolve_camera(self, camera: CameraData | str | None) -> CameraData:
+        """ Camera object by camera id or name. The first camera by default """
+        if camera is None:
+            return self.cameras[0]
+        if isinstance(camera, str):
+            # example of camera id: d8a9a5a8-37b9-44cd-876a-7cfa800b5375
+            if len(camera) == 36:
+                return get_camera_by_id(self.client, camera)
+            return get_camera_by_name(self.client, camera)
+        return camera
+
     def get_template_path(self, object_type):
         base, attribute, _ = parse_object_type(object_type)
 
@@ -589,7 +787,7 @@ class ImageSender:
         return path
 
     def send(self, object_type, count=1, camera=None, roi=None, draw_text=False, timestamp=None,
-             meta=None, get_meta=True, remember=True, wait_for_cluster=False):
+             meta=None, get_meta=True, remember=True, wait_for_cluster=False, synthetic=None):
         """
         Find picture by template `object_type`, craft Object and sent it `count` times to CERTAIN camera
         Sending to several cameras isn't supported right now
@@ -597,133 +795,155 @@ class ImageSender:
         TODO: make sure `object-handler` service has configuration "SKIP_OLD_MESSAGES: 0"
         Otherwise objects with timestamp older than 2h will be ignored.
         remember: Useful if you send objects to camera which isn't working
+        synthetic: `SyntheticProfile` to send distinct images generated from the template
         """
-        def _template_to_roi(template):
-            return {
-                'face-male': Roi({'x1': 0.1, 'y1': 0.05, 'x2': 0.9, 'y2': 0.75}),
-            }.get(template, DEFAULT_ROI)
-
         if wait_for_cluster is True and get_meta is False:
             raise RuntimeError('You should "get_meta" to be able to "wait_for_cluster"')
         if config.pytest_options and config.pytest_options.skip_sender_tests:
             pytest.skip('Sending objects is not allowed')
-        meta = meta or {}
-        if camera is None:
-            camera = self.cameras[0]
-        if isinstance(camera, str):
-            # example of camera id: d8a9a5a8-37b9-44cd-876a-7cfa800b5375
-            if len(camera) == 36:
-                camera = get_camera_by_id(self.client, camera)
-            else:
-                camera = get_camera_by_name(self.client, camera)
+        camera = self.resolve_camera(camera)
+        sent_objects, futures_ = self._submit_objects(
+            object_type, count, camera,
+            roi=roi, draw_text=draw_text, timestamp=timestamp, meta=meta, remember=remember,
+            synthetic=synthetic,
+        )
+        self._wait_sent(futures_)
+
+        if get_meta:
+            self.get_meta_information_from_backend()
+        if wait_for_cluster:
+            self._wait_objects_are_in_cluster([o for o in sent_objects if o.id is not None])
 
-        timestamp = int(timestamp or time.time())
+        return sent_objects
+
+    def _submit_objects(
+            self,
+            object_type: ImageTemplateType,
+            count: int,
+            camera: CameraData,
+            roi: Optional[Roi] = None,
+            draw_text: bool = False,
+            timestamp: Optional[float] = None,
+            meta: Optional[MetaType] = None,
+            remember: bool = True,
+            synthetic: Optional[SyntheticProfile] = None,
+    ) -> tuple[list[Object], list[futures.Future]]:
+        """ Craft `count` objects and submit them to sender engine without waiting """
+        meta = meta or {}
+        timestamp = timestamp or time.time()
         log.info(f"Send template {object_type} {count} times to {camera}")
         base = parse_object_type(object_type)[0]
         assert base in BASE_TO_ID.keys()
 
         sent_objects = []
+        futures_ = []
+        for _ in range(count):
+            image_obj = Object(
+                path=self.get_template_path(object_type),
+                camera=camera,
+                client=self.client,
+                base=base,
+                draw_text=draw_text,
+                timestamp=unique_timestamp(timestamp),
+                meta=meta,
+                roi=roi or template_to_roi(object_type),
+                variation=synthetic.next_variation() if synthetic else None,
+            )
+            sent_objects.append(image_obj)
+            futures_.append(
+                self.engine.submit(self._send_object, image_obj, remember=remember)
+            )
+        return sent_objects, futures_
 
-        with futures.ThreadPoolExecutor(max_workers=10) as executor:
-            futures_ = []
-            for _ in range(count):
-                image_obj = Object(
-                    path=self.get_template_path(object_type),
-                    camera=camera,
-                    client=self.client,
-                    base=base,
-                    draw_text=draw_text,
-                    timestamp=timestamp,
-                    meta=meta,
-                    roi=roi or _template_to_roi(object_type),
-                )
-
-                sent_objects.append(image_obj)
-                futures_.append(
-                    executor.submit(self._send_object, image_obj, remember=remember)
-                )
-
-            futures.wait(futures_)
-            for future in futures_:
-                if future.exception():
-                    raise future.exception()
+    @staticmethod
+    def _wait_sent(futures_: Sequence[futures.Future]) -> None:
+        futures.wait(futures_)
+        for future in futures_:
+            if future.exception():
+                raise future.exception()
 
-        if wait_for_cluster:
-            objects_to_cluster = self._get_unknown_objects_from_backend(object_type)
-        if get_meta:
-            time.sleep(4)   # wait objects arrive. prevent retrying
-            self.get_meta_information_from_backend()
-        else:
-            time.sleep(1)  # prevent timestamp collision
-        if wait_for_cluster:
-            self._wait_objects_are_in_cluster(objects_to_cluster)
+    def _wait_objects_are_in_cluster(self, objects_to_cluster, timeout=None):
+        """
+        Poll cluster size of objects (concurrent `get_object` requests) with adaptive backoff
+        until every object is in a cluster. Time to cluster is recorded into `cluster_latency`.
+        """
+        pending = {obj.id: obj for obj in objects_to_cluster}
+        if not pending:
+            return
+        timeout = timeout or config.user_config.get('cluster_timeout', DEFAULT_CLUSTER_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        with futures.ThreadPoolExecutor(max_workers=min(len(pending), CLUSTER_POLL_WORKERS)) as executor:
+            for delay in backoff_delays(maximum=5.):
+                ids = list(pending)
+                cluster_sizes = executor.map(lambda id_: get_object(self.client, id_).cluster_size or 0, ids)
+                now = time.time()
+                for id_, cluster_size in zip(ids, cluster_sizes):
+                    if cluster_size > 1:
+                        obj = pending.pop(id_)
+                        obj._meta['matched'] = True
+                        self._objects.update_meta(obj)
+                        self.cluster_latency.record(now - (obj.sent_at or now))
+                if not pending:
+                    log.info(f'{len(objects_to_cluster)} objects are in cluster. Time to cluster: {self.cluster_latency}')
+                    return
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    raise ClusterizationException(f'Objects are not in cluster after {timeout}s: {list(pending)}')
+                log.info(f'{len(pending)} objects are not in cluster yet. Next check in {delay:.2f}s')
+                time.sleep(delay)
 
-        return sent_objects
+    def get_meta_information_from_backend(self):
+        """
+        Get meta for objects which don't have it yet.
+        Bases are reconciled concurrently.
+        """
+        bases = [base for base in consts.BASES_ALL if self._objects.pending(base)]
+        if not bases:
+            return
+        with futures.ThreadPoolExecutor(max_workers=len(bases)) as executor:
+            futures_ = {base: executor.submit(self._reconcile_base, base) for base in bases}
+            futures.wait(futures_.values())
+
+        errors = []
+        for base, future in futures_.items():
+            if exc := future.exception():
+                errors.append(exc)
+                if not isinstance(exc, MetaInformationException):
+                    continue
+                for obj in self._objects.pending(base):
+                    log.error(f"{obj}: do not require meta any more")
+                    obj._is_meta_required = False
+                    self._objects.update_meta(obj)
+                    arrival_tracker.forget(obj)
+        if errors:
+            raise errors[0]
 
-    def _wait_objects_are_in_cluster(self, objects_to_cluster):
-        ids = [o.id for o in objects_to_cluster]
-        if not ids:
+    def _reconcile_base(self, base: BaseType) -> None:
+        """
+        Hash join of objects without meta (indexed by correlation keys) and objects from backend.
+        Backend is polled with backoff until all objects arrive (see `tools.arrival`).
+        """
+        matcher = ObjectMatcher(self._objects.pending(base))
+        if not matcher:
             return
-        for _ in range(5):
-            if self._do_objects_are_in_cluster(ids):
-                return
-            time.sleep(20)
-        raise ClusterizationException
-
-    def _do_objects_are_in_cluster(self, ids):
-        cluster_sizes = [get_object(self.client, id).cluster_size for id in ids]
-        log.info(f'Objects {ids} cluster size: {cluster_sizes}')
-        return all(size > 1 for size in cluster_sizes)
-
-    @retry(MetaInformationException, delay=10, tries=5)
-    def _get_unknown_objects_from_backend(self, base):
-        base = parse_object_type(base)[0]
-        unknown_timestamps = set([o.timestamp for o in self._objects if o._is_meta_required is True])
-        if not unknown_timestamps:
-            return []
-        unknown_objects = []
-        for obj in search_api_v2(
-                self.client,
+        log.info(f'Get meta for {len(matcher)} {base} objects')
+
+        def request_page(pgoffset: int, pgsize: int, timestamps: tuple[float, float]) -> Sequence[ObjectData]:
+            return self._request_last_objects(
                 base,
-                consts.API_ANY_QUALITY,
+                pgsize=pgsize,
+                pgoffset=pgoffset,
                 order=consts.API_ORDER_DATE_DESC,
-        ):
-            if obj.timestamp in unknown_timestamps:
-                unknown_objects.append(obj)
-        if not unknown_objects:
-            raise MetaInformationException('No unknown objects')
-        log.info(f'Found {len(unknown_objects)} unknown objects')
-        return unknown_objects
+                timestamps=timestamps,
+            )
 
-    def get_meta_information_from_backend(self):
-        @retry(MetaInformationException, delay=10, tries=4)
-        def _get_meta_for_base(base, objects_to_get_meta):
-            log.info(f'Get meta for {len(objects_to_get_meta)} {base} objects')
-            for obj_from_backend in self._request_last_objects(
-                    base,
-                    pgsize=250,
-                    recursive=False,
-                    filters=consts.API_ORDER_DATE_DESC,
-            ):
-                for obj in filter(lambda x: x._is_meta_required is True, objects_to_get_meta):
-                    if obj.timestamp == obj_from_backend.timestamp:
-                        obj.set_meta(obj_from_backend)
-            objects_to_get_meta = tuple(filter(lambda x: x._is_meta_required is True, objects_to_get_meta))
-            if objects_to_get_meta:
-                raise MetaInformationException(
-                    f"{base}: objects without meta: {len(objects_to_get_meta)}")
-
-        for base in [consts.BASE_FACE, consts.BASE_VEHICLE, consts.BASE_PERSON]:
-            objects_to_get_meta = tuple(filter(lambda x: x._is_meta_required is True and x.base == base, self._objects))
-            if len(objects_to_get_meta) == 0:
-                continue
-            try:
-                _get_meta_for_base(base, objects_to_get_meta)
-            except MetaInformationException:
-                for obj in filter(lambda x: x._is_meta_required is True, objects_to_get_meta):
-                    log.error(f"{obj}: do not require meta any more")
-                    obj._is_meta_required = False
-                raise
+        def on_match(obj: Object, obj_from_backend: ObjectData) -> None:
+            obj.set_meta(obj_from_backend)
+            self._objects.update_meta(obj)
+            arrival_tracker.arrived(obj)
+
+        if not wait_arrival(request_page, matcher, on_match):
+            raise MetaInformationException(f"{base}: objects without meta: {len(matcher)}")
 
     def send_from_dir(
             self,
@@ -732,68 +952,119 @@ class ImageSender:
             cameras: Any = None,
             # get_meta: bool = True,
     ) -> Sequence[ObjectData]:
-        pgsize = 100
         img_dir = Path(img_dir)
         if config.pytest_options.skip_sender_tests:
             pytest.skip('Sending objects is not allowed')
         cameras = self._normalize_cameras(cameras)
-        base = parse_object_type(object_type)[0]
+        rejected = []
+
+        def skip(img_path: Path, reason: str) -> None:
+            log.debug(f"{reason}: {img_path}")
+            if reason == 'unprocessable':
+                rejected.append(img_path)
+
+        sent = self._send_dir(img_dir, object_type, cameras[0], skip)
+        if rejected:
+            raise RuntimeError(
+                f'{len(rejected)} images from {img_dir} have been rejected by meta-receiver '
+                f'(sort them out with check_objects_from_dir): {", ".join(p.name for p in rejected)}')
+        assert sent  # self check
+        # any quality: do not wait for bad quality objects until deadline
+        found, not_found = self._reconcile_dir(sent, object_type, consts.API_ANY_QUALITY)
+        if not_found:
+            raise RuntimeError(f'Wroung objects count: {len(found)}, expected: {len(sent)}')
+        bad_quality = [img_path for image_obj, img_path in sent if not image_obj.has_meta(consts.META_GOOD_QUALITY)]
+        if bad_quality:
+            raise RuntimeError(
+                f'{len(bad_quality)} of {len(sent)} images from {img_dir} have bad quality '
+                f'(sort them out with check_objects_from_dir): {", ".join(p.name for p in bad_quality)}')
+        return found
+
+    @staticmethod
+    def _load_rois(img_dir: Path) -> Mapping[str, Roi]:
         rois_file = img_dir / 'rois_for_images.json'
         if not rois_file.exists():
             log.warning(f"not found {rois_file}")
-            rois = {}
-        else:
-            with open(rois_file, 'r') as f:
-                rois = json.loads(f.read())
+            return {}
+        with open(rois_file, 'r') as f:
+            return json.loads(f.read())
 
-        objects_sent = 0
-        timestamp_from = int(time.time())
-        for img_path in img_dir.iterdir():
+    def _send_dir(
+            self,
+            img_dir: Path,
+            object_type: ImageTemplateType,
+            camera: CameraData,
+            skip: Callable[[Path, str], None],
+    ) -> list[tuple[Object, Path]]:
+        """
+        Send every `.jpg` image from directory concurrently.
+        Listing of directory is taken before sending (`skip` may move files into subdirectories),
+        images are decoded, encoded and sent by sender engine workers,
+        amount of images in flight is bounded by the engine window.
+        `skip` is called for files which aren't images or have been rejected by meta-receiver.
+        """
+        base = parse_object_type(object_type)[0]
+        rois = self._load_rois(img_dir)
+        submitted = []
+        for img_path in sorted(path for path in img_dir.iterdir() if path.is_file()):
             if img_path.suffix != '.jpg':
-                log.debug(f"not an image: {img_path}")
+                skip(img_path, 'not_an_image')
                 continue
             image_obj = Object(
                 path=img_path,
-                camera=cameras[0],
+                camera=camera,
                 client=self.client,
-                timestamp=TimestampType(int(time.time())),
+                timestamp=unique_timestamp(time.time()),
                 base=base,
                 roi=rois.get(img_path.name, DEFAULT_ROI),
+                cache_template=False,
             )
-            self._send_object(image_obj)
-            objects_sent += 1
+            submitted.append((image_obj, img_path, self.engine.submit(self._send_object, image_obj)))
+
+        sent = []
+        for image_obj, img_path, future in submitted:
+            try:
+                future.result()
+            except UnprocessableEntityException:
+                skip(img_path, 'unprocessable')
+            else:
+                sent.append((image_obj, img_path))
+        log.info(f'Sent {len(sent)} images from {img_dir}: {self.engine.stats}')
+        return sent
 
-        assert objects_sent > 0  # self check
-        assert pgsize > objects_sent  # self check
+    def _reconcile_dir(
+            self,
+            sent: Sequence[tuple[Object, Path]],
+            object_type: ImageTemplateType,
+            filters: Mapping[str, Any],
+    ) -> tuple[list[ObjectData], list[Object]]:
+        """
+        Wait sent images appear in search (paged by correlation keys) and get their meta.
+        Returns found objects and sent objects which haven't been found
+        """
+        matcher = ObjectMatcher(obj for obj, _ in sent)
+        found = []
 
-        last_objects = []  # fix reportPossiblyUnboundVariable
-        for _ in range(5):
-            last_objects = search_api_v2(
+        def request_page(pgoffset: int, pgsize: int, timestamps: tuple[float, float]) -> Sequence[ObjectData]:
+            return search_api_v2(
                 self.client,
                 object_type,
-                recursive=True,
-                order=consts.API_ORDER_DATE_DESC,
+                filters,
                 pgsize=pgsize,
+                pgoffset=pgoffset,
+                order=consts.API_ORDER_DATE_DESC,
+                timestamps=timestamps,
             )
-            last_objects = filter_objects_by_timestamps(
-                last_objects,
-                lambda x: getattr(x, 'timestamp'),
-                timestamp_from,
-                time_to=int(time.time()),
-            )
-            if len(last_objects) == objects_sent:
-                break
-            else:
-                log.warning(f'Wroung objects count: {len(last_objects)}, expected: {objects_sent}')
-                time.sleep(10)
-        else:
-            raise RuntimeError(f'Wroung objects count: {len(last_objects)}, expected: {objects_sent}')
 
-        for obj in last_objects:
-            self._objects.append(
-                Object.init_from_dict(self, obj)
-            )
-        return last_objects
+        def on_match(obj: Object, obj_from_backend: ObjectData) -> None:
+            obj.set_meta(obj_from_backend)
+            self._objects.update_meta(obj)
+            arrival_tracker.arrived(obj)
+            found.append(obj_from_backend)
+
+        if not wait_arrival(request_page, matcher, on_match):
+            log.warning(f'{len(matcher)} of {len(sent)} objects have not been found')
+        return found, matcher.remaining()
 
     @allure.step("Wait autorefresh time (30+ sec)")
     def wait_autorefresh_time(self, requests_time_costs: int = 4):
@@ -802,64 +1073,24 @@ class ImageSender:
         return self
 
     def check_objects_from_dir(self, img_dir, object_type, cameras=None):
-        pgsize = 250
+        """
+        Send images from directory and sort out bad ones:
+        not images, rejected by meta-receiver and not found among good quality objects
+        """
         img_dir = Path(img_dir)
         cameras = self._normalize_cameras(cameras)
-        base = parse_object_type(object_type)[0]
-        rois_file = img_dir / 'rois_for_images.json'
-        if not rois_file.exists():
-            log.warning(f"not found {rois_file}")
-            rois = {}
-        else:
-            with open(rois_file, 'r') as f:
-                rois = json.loads(f.read())
-
-        timestamp_to_path = {}
-        timestamp_from = int(time.time())
-        for img_path in img_dir.iterdir():
-            if img_path.suffix != '.jpg':
-                log.warning(
-                    'Not an image: '
-                    f'{shutil.move(img_path, img_path.parent / "not_an_image")}')
-                continue
-            image_obj = Object(
-                path=img_path,
-                camera=cameras[0],
-                client=self.client,
-                timestamp=int(time.time()),
-                base=base,
-                roi=rois.get(img_path.name, DEFAULT_ROI),
-            )
-            try:
-                self._send_object(image_obj)
-            except UnprocessableEntityException:
-                log.warning(
-                    'Invalid image: '
-                    f'{shutil.move(img_path, img_path.parent / "unprocessable")}')
-            else:
-                timestamp_to_path[image_obj.timestamp] = img_path
-            finally:
-                time.sleep(1.1)
 
-        last_objects = search_api_v2(
-            self.client,
-            object_type,
-            recursive=True,
-            order=consts.API_ORDER_DATE_DESC,
-            pgsize=pgsize,
-        )
-        last_objects = filter_objects_by_timestamps(
-            last_objects,
-            lambda x: getattr(x, 'timestamp'),
-            timestamp_from,
-            time_to=int(time.time()),
-        )
+        def move_to(img_path: Path, subdir: str) -> Path:
+            (img_dir / subdir).mkdir(exist_ok=True)
+            return Path(shutil.move(img_path, img_dir / subdir))
 
-        bad_quality_dir = img_dir / "bad_quality/"
-        if not bad_quality_dir.exists():
-            bad_quality_dir.mkdir()
+        def skip(img_path: Path, reason: str) -> None:
+            log.warning(f'{reason}: {move_to(img_path, reason)}')
 
-        for timestamp, img_path in timestamp_to_path.items():
-            if timestamp not in [o.timestamp for o in last_objects]:
-                new_path = shutil.move(img_path, bad_quality_dir)
-                log.warning(f'Bad quality: {new_path}')
+        sent = self._send_dir(img_dir, object_type, cameras[0], skip)
+        # any quality: do not wait for bad quality objects until deadline
+        _, not_found = self._reconcile_dir(sent, object_type, consts.API_ANY_QUALITY)
+        not_found_ids = {id(obj) for obj in not_found}
+        for image_obj, img_path in sent:
+            if id(image_obj) in not_found_ids or not image_obj.has_meta(consts.META_GOOD_QUALITY):
+                log.warning(f'Bad quality: {move_to(img_path, "bad_quality")}')
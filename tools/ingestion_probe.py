@@ -0,0 +1,211 @@
+'''
+End-to-end latency of backend pipeline.
+
+Probe sends tagged objects (unique track id and microsecond timestamp, see `tools.correlation`)
+and polls search to measure for every object time since it has been sent until:
+ - visible: object is returned by `search_api_v2`
+ - meta: backend has populated meta (image quality has been estimated)
+ - cluster: object is in a cluster (`cluster_size > 1`)
+Objects of a base are sent from the same template, so they are expected to be clustered together.
+Latencies are collected into HDR-style histograms (log-linear buckets with bounded relative error)
+per base and per stage. NB: accuracy is limited by polling interval.
+'''
+from __future__ import annotations
+from collections import Counter
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Iterable
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+import logging
+import time
+
+import consts
+from tools import ObjectData
+from tools import config
+from tools.arrival import SEARCH_MAX_PAGES
+from tools.arrival import SEARCH_PAGE_SIZE
+from tools.arrival import backoff_delays
+from tools.correlation import ObjectMatcher
+from tools.histogram import LatencyHistogram
+from tools.types import BaseType
+from tools.types import ImageTemplateType
+if TYPE_CHECKING:
+    from tools.cameras import CameraData
+    from tools.image_sender import ImageSender
+    from tools.image_sender import Object
+
+log = logging.getLogger('tools.ingestion_probe')
+
+STAGE_VISIBLE = 'visible'
+STAGE_META = 'meta'
+STAGE_CLUSTER = 'cluster'
+STAGES = (STAGE_VISIBLE, STAGE_META, STAGE_CLUSTER)
+DEFAULT_PROBE_TIMEOUT = 180.  # seconds
+
+
+@dataclass
+class ProbeReport:
+    environment: Optional[str]
+    app_version: Optional[str]
+    histograms: dict[str, dict[str, LatencyHistogram]] = field(default_factory=dict)   # base -> stage -> histogram
+    missing: dict[str, Counter] = field(default_factory=dict)   # base -> stage -> objects which didn't reach it
+
+    def histogram(self, base: str, stage: str) -> LatencyHistogram:
+        return self.histograms.setdefault(base, {}).setdefault(stage, LatencyHistogram())
+
+    def total(self, stage: str) -> LatencyHistogram:
+        histogram = LatencyHistogram()
+        for stages in self.histograms.values():
+            if stage in stages:
+                histogram.merge(stages[stage])
+        return histogram
+
+    @property
+    def is_complete(self) -> bool:
+        return not any(sum(counter.values()) for counter in self.missing.values())
+
+    def to_dict(self) -> Mapping[str, Any]:
+        return {
+            'environment': self.environment,
+            'app_version': self.app_version,
+            'stages': {
+                base: {stage: histogram.to_dict() for stage, histogram in stages.items()}
+                for base, stages in self.histograms.items()
+            },
+            'missing': {base: dict(counter) for base, counter in self.missing.items() if counter},
+        }
+
+    def __str__(self):
+        lines = [f'Ingestion latency env={self.environment} version={self.app_version}']
+        for base, stages in self.histograms.items():
+            for stage, histogram in stages.items():
+                missing = self.missing.get(base, Counter())[stage]
+                lines.append(f'  {base:<8} {stage:<8} n={histogram.count:<4} {histogram}'
+                             + (f' missing={missing}' if missing else ''))
+        return '\n'.join(lines)
+
+
+@dataclass
+class _Probe:
+    obj: Object
+    stages: dict[str, float] = field(default_factory=dict)   # stage -> latency (seconds)
+
+
+def _has_meta(item: ObjectData) -> bool:
+    return bool(item.meta) and item.meta.get('bad_quality') is not None
+
+
+class IngestionProbe:
+    def __init__(self, sender: ImageSender, timeout: Optional[float] = None):
+        self._sender = sender
+        self._timeout = timeout or config.user_config.get('ingestion_probe_timeout', DEFAULT_PROBE_TIMEOUT)
+
+    def run(
+            self,
+            object_types: Iterable[ImageTemplateType] = consts.BASES_ALL,
+            count: int = 5,
+            camera: Optional[CameraData] = None,
+            stages: Sequence[str] = STAGES,
+    ) -> ProbeReport:
+        '''
+        Send `count` objects of every template and wait until they pass `stages`.
+        Objects which don't pass a stage until timeout are reported as missing.
+        '''
+        if unknown := set(stages) - set(STAGES):
+            raise ValueError(f'Unknown stages: {unknown}')
+        if STAGE_CLUSTER in stages and count < 2:
+            raise ValueError('At least 2 objects are required to measure clusterization')
+        report = ProbeReport(
+            environment=config.environment,
+            app_version=str(config.app_version) if config.app_version else None,
+        )
+        probes: dict[BaseType, list[_Probe]] = {}
+        for object_type in object_types:
+            objects = self._sender.send(object_type, count=count, camera=camera, get_meta=False, remember=False)
+            probes.setdefault(objects[0].base, []).extend(_Probe(obj) for obj in objects)
+        log.info(f'Probe: {sum(map(len, probes.values()))} objects have been sent. Wait for stages {list(stages)}')
+
+        deadline = time.monotonic() + self._timeout
+        matchers = {base: ObjectMatcher([probe.obj for probe in base_probes]) for base, base_probes in probes.items()}
+        by_obj = {id(probe.obj): probe for base_probes in probes.values() for probe in base_probes}
+        by_id: dict[int, _Probe] = {}
+        for delay in backoff_delays(maximum=5.):
+            for base, base_probes in probes.items():
+                if any(len(probe.stages) < len(stages) for probe in base_probes):
+                    self._scan(base, base_probes, matchers[base], by_obj, by_id, stages)
+            if all(len(probe.stages) == len(stages) for probe in by_obj.values()):
+                break
+            delay = min(delay, deadline - time.monotonic())
+            if delay <= 0:
+                log.warning('Probe: timeout')
+                break
+            time.sleep(delay)
+
+        for base, base_probes in probes.items():
+            missing = report.missing.setdefault(base, Counter())
+            for stage in stages:
+                histogram = report.histogram(base, stage)
+                for probe in base_probes:
+                    if stage in probe.stages:
+                        histogram.record(probe.stages[stage])
+                    else:
+                        missing[stage] += 1
+        self._remember(by_id.values())
+        log.info(str(report))
+        return report
+
+    def _scan(
+            self,
+            base: BaseType,
+            probes: Sequence[_Probe],
+            matcher: ObjectMatcher,
+            by_obj: Mapping[int, _Probe],
+            by_id: dict[int, _Probe],
+            stages: Sequence[str],
+    ) -> None:
+        '''
+        One pass over the newest objects of `base` sent since the oldest unfinished probe.
+        The window starts at the whole second: backend may truncate timestamps to seconds (see `tools.arrival`)
+        '''
+        oldest_timestamp = int(min(
+            probe.obj.timestamp for probe in probes if len(probe.stages) < len(stages)))
+        timestamps = float(oldest_timestamp), time.time()
+        for page in range(SEARCH_MAX_PAGES):
+            items = self._sender._request_last_objects(
+                base,
+                pgsize=SEARCH_PAGE_SIZE,
+                pgoffset=page * SEARCH_PAGE_SIZE,
+                order=consts.API_ORDER_DATE_DESC,
+                timestamps=timestamps,
+            )
+            now = time.time()
+            for item in items:
+                probe = by_id.get(item.id)
+                if probe is None and (obj := matcher.match(item)) is not None:
+                    probe = by_id[item.id] = by_obj[id(obj)]
+                if probe is not None:
+                    probe.obj.set_meta(item)
+                    self._update_stages(probe, item, now, stages)
+            if len(items) < SEARCH_PAGE_SIZE or items[-1].timestamp < oldest_timestamp:
+                break
+
+    @staticmethod
+    def _update_stages(probe: _Probe, item: ObjectData, now: float, stages: Sequence[str]) -> None:
+        reached = {
+            STAGE_VISIBLE: True,
+            STAGE_META: _has_meta(item),
+            STAGE_CLUSTER: (item.cluster_size or 0) > 1,
+        }
+        for stage in stages:
+            if stage not in probe.stages and reached[stage]:
+                probe.stages[stage] = now - probe.obj.sent_at
+                log.debug(f'{probe.obj}: {stage} in {probe.stages[stage]:.2f}s')
+
+    def _remember(self, probes: Iterable[_Probe]) -> None:
+        ''' Objects which have been found are real objects of the company: keep counts of sender correct '''
+        for probe in probes:
+            self._sender._objects.append(probe.obj)
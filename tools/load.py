@@ -0,0 +1,269 @@
+'''
+Open-loop load generator for meta-receiver.
+
+Objects are scheduled by the clock (constant or Poisson arrivals) and
+don't wait for the previous request to finish. Latency is measured from
+the scheduled send time, so a saturated sender shows up as growing
+latency and lower achieved rate instead of being hidden.
+'''
+from __future__ import annotations
+from concurrent import futures
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
+from typing import Any
+from typing import Iterator
+from typing import Literal
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+import itertools
+import logging
+import multiprocessing
+import random
+import time
+
+from tools import config
+from tools import parse_object_type
+from tools.correlation import unique_timestamp
+from tools.sender_engine import SendStats
+from tools.synthetic import SyntheticProfile
+from tools.token_refresh import SharedTokens
+from tools.types import ImageTemplateType
+if TYPE_CHECKING:
+    from tools.cameras import CameraData
+    from tools.client import ApiClient
+    from tools.image_sender import ImageSender
+
+log = logging.getLogger('tools.load')
+
+ArrivalType = Literal['constant'] | Literal['poisson']
+DEFAULT_OBJECT_TYPES: Sequence[ImageTemplateType] = ('face', 'vehicle', 'person')
+
+_shared_tokens: Optional[SharedTokens] = None   # access token of the parent (in worker processes)
+
+
+@dataclass
+class LoadProfile:
+    rate: float       # objects per second
+    duration: float   # seconds
+    arrival: ArrivalType = 'constant'
+    object_types: Sequence[ImageTemplateType] = DEFAULT_OBJECT_TYPES
+    cameras: Sequence[CameraData] = field(default_factory=tuple)
+    seed: Optional[int] = None
+    synthetic: Optional[SyntheticProfile] = None
+
+    def __str__(self):
+        return (f'{self.rate}/s during {self.duration}s ({self.arrival} arrivals) '
+                f'templates={list(self.object_types)} cameras={len(self.cameras)}'
+                + (f' {self.synthetic}' if self.synthetic else ''))
+
+
+def arrival_offsets(
+        rate: float,
+        duration: float,
+        arrival: ArrivalType,
+        rng: random.Random) -> Iterator[float]:
+    ''' Offsets (in seconds from the start) when objects should be sent '''
+    if rate <= 0:
+        raise ValueError(f'rate should be positive: {rate}')
+    offset = 0.
+    for ix in itertools.count():
+        if arrival == 'constant':
+            offset = ix / rate
+        elif arrival == 'poisson':
+            offset += rng.expovariate(rate)
+        else:
+            raise ValueError(f'Unknown arrival type: {arrival}')
+        if offset >= duration:
+            return
+        yield offset
+
+
+def make_load_report(profile: LoadProfile, stats: SendStats, scheduled: int, max_lag: float) -> Mapping[str, Any]:
+    report = dict(stats.report())
+    report.update({
+        'target_rate': profile.rate,
+        'achieved_rate': round((stats.count - stats.errors) / stats.duration, 2) if stats.duration else 0.,
+        'scheduled': scheduled,
+        'max_schedule_lag_sec': round(max_lag, 3),
+    })
+    return report
+
+
+def run_open_loop(sender: ImageSender, profile: LoadProfile) -> Mapping[str, Any]:
+    '''
+    Send objects according to `profile` and return report with achieved rate,
+    latency percentiles (from scheduled send time) and errors.
+    Objects are spread over cameras and templates in round-robin manner.
+    '''
+    stats, scheduled, max_lag = _run_open_loop(sender, profile)
+    report = make_load_report(profile, stats, scheduled, max_lag)
+    log.info(f'Open loop load finished: {stats}. '
+             f'Achieved {report["achieved_rate"]}/s of {profile.rate}/s')
+    return report
+
+
+def _run_open_loop(
+        sender: ImageSender,
+        profile: LoadProfile,
+        tokens: Optional[SharedTokens] = None,
+) -> tuple[SendStats, int, float]:
+    from tools.image_sender import Object
+    from tools.image_sender import template_to_roi
+
+    cameras = tuple(profile.cameras) or tuple(sender.cameras)
+    if not cameras:
+        raise RuntimeError('No cameras to send objects')
+    targets = itertools.cycle(itertools.product(profile.object_types, cameras))
+    rng = random.Random(profile.seed)
+    stats = SendStats()
+    futures_ = []
+    scheduled = 0
+    max_lag = 0.
+
+    def _send(obj: Object, scheduled_at: float) -> None:
+        status: Optional[int | str] = 200
+        try:
+            if tokens is not None:
+                tokens.sync(sender.client)
+            sender._send_object(obj, remember=False)
+        except Exception as exc:
+            status = exc.__class__.__name__
+            log.debug(f'Failed to send {obj}: {exc}')
+        finally:
+            stats.record(scheduled_at, time.time() - scheduled_at, status)
+
+    log.info(f'Open loop load: {profile}')
+    time_start = time.time()
+    for offset in arrival_offsets(profile.rate, profile.duration, profile.arrival, rng):
+        scheduled_at = time_start + offset
+        delay = scheduled_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+        object_type, camera = next(targets)
+        obj = Object(
+            path=sender.get_template_path(object_type),
+            camera=camera,
+            client=sender.client,
+            base=parse_object_type(object_type)[0],
+            timestamp=unique_timestamp(scheduled_at),
+            roi=template_to_roi(object_type),
+            variation=profile.synthetic.next_variation() if profile.synthetic else None,
+        )
+        futures_.append(sender.engine.submit(_send, obj, scheduled_at))
+        scheduled += 1
+        if len(futures_) > 10_000:
+            futures_ = [f for f in futures_ if not f.done()]
+
+    for future in futures_:
+        future.result()
+    return stats, scheduled, max_lag
+
+
+def shard_profile(profile: LoadProfile, shards: int) -> Sequence[LoadProfile]:
+    '''
+    Split load between `shards` workers: by cameras if there are enough cameras,
+    otherwise by templates (bases), otherwise every worker sends the same load.
+    Rate of every shard is proportional to its part of (template, camera) pairs.
+    '''
+    def _split(items: Sequence) -> Sequence[Sequence]:
+        return [items[ix::shards] for ix in range(shards)]
+
+    if len(profile.cameras) >= shards:
+        parts = [replace(profile, cameras=cameras) for cameras in _split(tuple(profile.cameras))]
+    elif len(profile.object_types) >= shards:
+        parts = [replace(profile, object_types=types) for types in _split(tuple(profile.object_types))]
+    else:
+        parts = [replace(profile) for _ in range(shards)]
+    total_pairs = sum(len(part.object_types) * len(part.cameras) for part in parts)
+    for ix, part in enumerate(parts):
+        part.rate = profile.rate * len(part.object_types) * len(part.cameras) / total_pairs
+        if profile.seed is not None:
+            part.seed = profile.seed + ix
+        synthetic = profile.synthetic
+        if synthetic and synthetic.identities is None and synthetic.seed is not None:
+            # unique identities: shards must not generate the same ones
+            part.synthetic = replace(synthetic, seed=synthetic.seed + ix)
+    return parts
+
+
+def _init_shard(tokens: SharedTokens) -> None:
+    global _shared_tokens
+    _shared_tokens = tokens
+
+
+def _run_shard(
+        user_config: Mapping[str, Any],
+        environment: str,
+        client: ApiClient,
+        profile: LoadProfile,
+        workers: int,
+        inflight: Optional[int],
+) -> tuple[SendStats, int, float]:
+    '''
+    Entry point of worker process. `client` is already authorized:
+    the parent refreshes the token and the worker adopts it before every packet
+    '''
+    from tools.image_sender import ImageSender
+
+    logging.basicConfig(level=logging.WARNING)
+    config.user_config = user_config
+    config.environment = environment
+    sender = ImageSender(client)
+    sender.configure_engine(workers=workers, inflight=inflight)
+    try:
+        return _run_open_loop(sender, profile, tokens=_shared_tokens)
+    finally:
+        sender.close()
+
+
+def run_sharded(sender: ImageSender, profile: LoadProfile, processes: int) -> Mapping[str, Any]:
+    '''
+    Multi-process version of `run_open_loop`: PIL encoding, msgpack and logging
+    of every shard run in its own interpreter. Stats of all workers are merged.
+    '''
+    profile = replace(profile, cameras=tuple(profile.cameras) or tuple(sender.cameras))
+    if profile.synthetic and profile.synthetic.seed is None:
+        # shards share identities (or split unique ones) only if they know the seed
+        profile.synthetic = replace(profile.synthetic, seed=random.getrandbits(32))
+    shards = shard_profile(profile, processes)
+    log.info(f'Sharded load: {profile} in {processes} processes')
+    stats = SendStats()
+    scheduled = 0
+    max_lag = 0.
+    context = multiprocessing.get_context('spawn')  # do not fork process with running threads
+    tokens = SharedTokens(context)
+    tokens.publish(sender.client.access_token)
+    sender.client.add_token_listener(tokens.publish)
+    try:
+        with futures.ProcessPoolExecutor(
+                max_workers=processes, mp_context=context, initializer=_init_shard, initargs=(tokens,)) as executor:
+            futures_ = [
+                executor.submit(
+                    _run_shard,
+                    config.user_config,
+                    config.environment,
+                    sender.client,
+                    shard,
+                    sender.engine.workers,
+                    sender.engine.inflight,
+                )
+                for shard in shards
+            ]
+            for ix, future in enumerate(futures_):
+                shard_stats, shard_scheduled, shard_lag = future.result()
+                log.info(f'Shard #{ix} ({shards[ix]}): {shard_stats}')
+                stats.merge(shard_stats)
+                scheduled += shard_scheduled
+                max_lag = max(max_lag, shard_lag)
+    finally:
+        sender.client.remove_token_listener(tokens.publish)
+    report = make_load_report(profile, stats, scheduled, max_lag)
+    report['processes'] = processes
+    log.info(f'Sharded load finished: {stats}. '
+             f'Achieved {report["achieved_rate"]}/s of {profile.rate}/s')
+    return report
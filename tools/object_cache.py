@@ -0,0 +1,180 @@
+'''
+On-disk cache of objects from backend (SQLite), shared between test sessions.
+
+Objects are keyed by environment and company. `ImageSender.init_objects` loads cached objects
+and requests from backend only objects newer than the high-water mark (the newest cached timestamp)
+minus refresh window: meta and cluster size of recent objects may still change.
+The cache is trusted only if backend still has the newest cached object of every base
+(otherwise backend data has been reset and cached objects are dropped).
+Objects older than retention period are dropped when the cache is opened.
+Config:
+    object_cache: false               # disable cache
+    object_cache_path: path/to.db     # DEFAULT_CACHE_PATH by default
+    object_cache_refresh: 600         # refresh window (seconds)
+    object_cache_retention: 604800    # retention period (seconds)
+'''
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable
+from typing import Optional
+from typing import TYPE_CHECKING
+import json
+import logging
+import sqlite3
+import time
+
+from tools import ObjectData
+from tools import config
+from tools import json_to_object
+from tools.correlation import timestamp_key
+if TYPE_CHECKING:
+    from tools.client import ApiClient
+
+log = logging.getLogger('tools.object_cache')
+
+DEFAULT_CACHE_PATH = Path('.cache') / 'objects.sqlite'
+DEFAULT_REFRESH_WINDOW = 600.  # seconds
+DEFAULT_RETENTION = 7 * 24 * 3600.  # seconds
+SCHEMA_VERSION = 1
+
+_COLUMNS = ('id', 'base', 'cluster_size', 'camera_id', 'timestamp', 'roi', 'meta', 'is_reference', 'parent_id',
+            'image_url', 'track_id')
+
+
+class ObjectCache:
+    def __init__(self, path: str | Path, environment: str, company_id: int):
+        self._path = Path(path)
+        self._environment = environment
+        self._company_id = company_id
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                log.info(f'{self}: schema version {version} -> {SCHEMA_VERSION}. Drop cached objects')
+                connection.execute('DROP TABLE IF EXISTS objects')
+                connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS objects ('
+                ' environment TEXT NOT NULL, company_id INTEGER NOT NULL, id INTEGER NOT NULL,'
+                ' base TEXT NOT NULL, cluster_size INTEGER, camera_id TEXT, timestamp REAL NOT NULL,'
+                ' roi TEXT, meta TEXT, is_reference INTEGER, parent_id INTEGER, image_url TEXT, track_id TEXT,'
+                ' PRIMARY KEY (environment, company_id, id))'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS objects_by_time ON objects (environment, company_id, base, timestamp)')
+
+    def __str__(self):
+        return f'ObjectCache {self._path} ({self._environment}, company {self._company_id})'
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._path, timeout=30)
+
+    def load(self, base: str, since: Optional[float] = None, limit: Optional[int] = None) -> list[ObjectData]:
+        ''' The newest `limit` objects of `base` not older than `since` (ordered by timestamp) '''
+        with self._connect() as connection:
+            rows = connection.execute(
+                f'SELECT {", ".join(_COLUMNS)} FROM objects WHERE environment = ? AND company_id = ? AND base = ? '
+                'AND timestamp >= ? ORDER BY timestamp DESC LIMIT ?',
+                (self._environment, self._company_id, base, since if since is not None else float('-inf'),
+                 limit if limit is not None else -1),
+            ).fetchall()
+        items = [
+            ObjectData(
+                id=id_,
+                base=base,
+                cluster_size=cluster_size,
+                camera_id=camera_id,
+                timestamp=timestamp,
+                roi=json.loads(roi),
+                meta=json.loads(meta),
+                is_reference=bool(is_reference),
+                parent_id=parent_id,
+                image_url=image_url,
+                track_id=track_id,
+            ) for id_, base, cluster_size, camera_id, timestamp, roi, meta, is_reference, parent_id, image_url, track_id
+            in reversed(rows)
+        ]
+        log.info(f'{self}: {len(items)} {base} objects loaded')
+        return items
+
+    def high_water_mark(self, base: str) -> Optional[float]:
+        ''' Timestamp of the newest cached object '''
+        with self._connect() as connection:
+            return connection.execute(
+                'SELECT MAX(timestamp) FROM objects WHERE environment = ? AND company_id = ? AND base = ?',
+                (self._environment, self._company_id, base),
+            ).fetchone()[0]
+
+    def validate(self, client: ApiClient) -> bool:
+        '''
+        Check that backend has the newest cached object of every base with the same timestamp.
+        Otherwise cached objects are dropped (e.g. backend data has been reset) and False is returned
+        '''
+        with self._connect() as connection:
+            newest = connection.execute(
+                'SELECT base, id, MAX(timestamp) FROM objects WHERE environment = ? AND company_id = ? GROUP BY base',
+                (self._environment, self._company_id),
+            ).fetchall()
+        for base, object_id, timestamp in newest:
+            response = client.request('get', f'/object-manager/objects/{object_id}')
+            if response.status_code != 200:
+                reason = f'status code {response.status_code}'
+            elif timestamp_key(json_to_object(response.json(), camera_id_field='camera').timestamp) \
+                    != timestamp_key(timestamp):
+                reason = 'timestamp has changed'
+            else:
+                continue
+            log.warning(f'{self}: the newest {base} object {object_id} is not valid ({reason}). Drop cached objects')
+            self.clear()
+            return False
+        return True
+
+    def prune(self, before: float) -> None:
+        ''' Drop objects older than `before` timestamp '''
+        with self._connect() as connection:
+            deleted = connection.execute(
+                'DELETE FROM objects WHERE environment = ? AND company_id = ? AND timestamp < ?',
+                (self._environment, self._company_id, before),
+            ).rowcount
+        if deleted:
+            log.info(f'{self}: {deleted} objects older than retention period are dropped')
+
+    def store(self, items: Iterable[ObjectData]) -> None:
+        ''' Insert new objects and update already cached ones '''
+        rows = [
+            (self._environment, self._company_id, item.id, item.base, item.cluster_size, item.camera_id,
+             float(item.timestamp), json.dumps(item.roi), json.dumps(item.meta), int(bool(item.is_reference)),
+             item.parent_id, item.image_url, item.track_id)
+            for item in items
+        ]
+        with self._connect() as connection:
+            connection.executemany(
+                f'INSERT OR REPLACE INTO objects (environment, company_id, {", ".join(_COLUMNS)}) '
+                f'VALUES ({", ".join("?" * (len(_COLUMNS) + 2))})',
+                rows,
+            )
+        log.info(f'{self}: {len(rows)} objects stored')
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                'DELETE FROM objects WHERE environment = ? AND company_id = ?',
+                (self._environment, self._company_id),
+            )
+
+
+def open_object_cache(client: ApiClient) -> Optional[ObjectCache]:
+    ''' Cache for the current environment and active company of `client` (None if cache is disabled) '''
+    if not config.user_config.get('object_cache', True):
+        return None
+    if client.company is None:
+        log.warning(f'{client}: no active company. Object cache is disabled')
+        return None
+    path = config.user_config.get('object_cache_path', DEFAULT_CACHE_PATH)
+    try:
+        cache = ObjectCache(path, config.environment, client.company.id)
+        cache.prune(time.time() - config.user_config.get('object_cache_retention', DEFAULT_RETENTION))
+    except sqlite3.Error as exc:
+        log.warning(f'Object cache {path} is not available: {exc}')
+        return None
+    return cache
@@ -0,0 +1,84 @@
+'''
+Concurrent paginated fetching of the newest objects of several bases.
+
+Pages of all bases are requested by a bounded pool of workers (bases take turns),
+pages are yielded as soon as they arrive. Paging of a base stops at the first page which is
+incomplete, older than `since` or beyond `depth` objects.
+NB: pages which have been requested before paging stopped are yielded too
+and objects may be repeated if new objects arrive during paging: dedup them by id.
+'''
+from __future__ import annotations
+from concurrent import futures
+from dataclasses import dataclass
+from typing import Callable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+import logging
+
+from tools import ObjectData
+from tools.types import BaseType
+
+log = logging.getLogger('tools.object_fetch')
+
+DEFAULT_FETCH_WORKERS = 6
+DEFAULT_PAGE_SIZE = 250
+
+PageRequest = Callable[[BaseType, int, int], Sequence[ObjectData]]   # (base, pgoffset, pgsize) -> the newest first
+
+
+@dataclass
+class FetchBound:
+    since: Optional[float] = None   # don't request pages older than the timestamp
+    depth: Optional[int] = None     # max amount of objects
+
+    def reached(self, page: Sequence[ObjectData], pgoffset: int, pgsize: int) -> bool:
+        if len(page) < pgsize:
+            return True
+        if self.since is not None and page[-1].timestamp < self.since:
+            return True
+        return self.depth is not None and pgoffset + pgsize >= self.depth
+
+
+def fetch_pages(
+        request_page: PageRequest,
+        bounds: Mapping[BaseType, FetchBound],
+        pgsize: int = DEFAULT_PAGE_SIZE,
+        workers: int = DEFAULT_FETCH_WORKERS,
+) -> Iterator[tuple[BaseType, Sequence[ObjectData]]]:
+    next_offset = {base: 0 for base in bounds}
+    stopped = {base: False for base in bounds}
+    inflight: dict[futures.Future, tuple[BaseType, int]] = {}
+
+    def _inflight_count(base: BaseType) -> int:
+        return sum(1 for inflight_base, _ in inflight.values() if inflight_base == base)
+
+    def _schedule(executor: futures.Executor) -> None:
+        while len(inflight) < workers:
+            candidates = [
+                base for base, bound in bounds.items()
+                if not stopped[base] and (bound.depth is None or next_offset[base] < bound.depth)
+            ]
+            if not candidates:
+                return
+            base = min(candidates, key=_inflight_count)
+            pgoffset = next_offset[base]
+            next_offset[base] += pgsize
+            inflight[executor.submit(request_page, base, pgoffset, pgsize)] = (base, pgoffset)
+
+    executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+    try:
+        _schedule(executor)
+        while inflight:
+            done, _ = futures.wait(inflight, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                base, pgoffset = inflight.pop(future)
+                page = future.result()
+                if not stopped[base] and bounds[base].reached(page, pgoffset, pgsize):
+                    log.debug(f'{base}: the last page is at {pgoffset=}')
+                    stopped[base] = True
+                yield base, page
+            _schedule(executor)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
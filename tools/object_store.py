@@ -0,0 +1,234 @@
+from __future__ import annotations
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+from collections import defaultdict
+from datetime import datetime
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import TYPE_CHECKING
+import logging
+import threading
+
+import consts
+if TYPE_CHECKING:
+    from tools.image_sender import Object
+
+log = logging.getLogger('tools.object_store')
+
+TimeBoundType = datetime | float | int | None
+ObjectPredicate = Callable[['Object'], bool]
+
+
+def to_timestamp(value: TimeBoundType) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _iter_bits(mask: int) -> Iterator[int]:
+    ''' Positions of set bits in ascending order '''
+    for byte_ix, byte in enumerate(mask.to_bytes((mask.bit_length() + 7) // 8, 'little')):
+        while byte:
+            lowest = byte & -byte
+            yield byte_ix * 8 + lowest.bit_length() - 1
+            byte ^= lowest
+
+
+def _mask_from_positions(positions: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def _meta_index_keys(meta: Mapping[str, Any]) -> list[tuple[str, Hashable]]:
+    keys = []
+    for key, value in meta.items():
+        try:
+            hash(value)
+        except TypeError:
+            continue
+        keys.append((key, value))
+    return keys
+
+
+class ObjectStore:
+    '''
+    Objects known by `ImageSender` with indexes:
+     - bitsets by base, camera id and (meta attribute, value)
+     - timeline sorted by timestamp (bisect)
+     - set of objects which still require meta from backend
+    Every object has a sequential number which is used as bit position.
+    NB: call `update_meta` after changing object meta (otherwise meta index becomes stale).
+    '''
+    def __init__(self, objects: Iterable[Object] = ()):
+        self._lock = threading.RLock()
+        self._items: list[Object] = []
+        self._seq: dict[int, int] = {}    # id(obj) -> position
+        self._by_base: dict[str, int] = defaultdict(int)
+        self._by_camera: dict[str, int] = defaultdict(int)
+        self._by_meta: dict[tuple[str, Hashable], int] = defaultdict(int)
+        self._meta_keys: dict[int, list[tuple[str, Hashable]]] = {}
+        self._timeline: list[tuple[float, int]] = []
+        self._pending: dict[int, None] = {}   # ordered set of positions
+        for obj in objects:
+            self.append(obj)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Object]:
+        return iter(self._items.copy())
+
+    def __getitem__(self, ix: int) -> Object:
+        return self._items[ix]
+
+    def __str__(self):
+        return f'ObjectStore with {len(self)} objects ({len(self._pending)} without meta)'
+
+    def append(self, obj: Object) -> None:
+        with self._lock:
+            if id(obj) in self._seq:
+                return
+            position = len(self._items)
+            bit = 1 << position
+            self._items.append(obj)
+            self._seq[id(obj)] = position
+            self._by_base[obj.base] |= bit
+            self._by_camera[obj.camera.id] |= bit
+            insort(self._timeline, (float(obj.timestamp), position))
+            self._index_meta(position, obj)
+            if obj._is_meta_required:
+                self._pending[position] = None
+
+    def extend(self, objects: Iterable[Object]) -> None:
+        for obj in objects:
+            self.append(obj)
+
+    def update_meta(self, obj: Object) -> None:
+        ''' Reindex meta of the object and update "requires meta" state '''
+        with self._lock:
+            position = self._seq[id(obj)]
+            bit = 1 << position
+            for key in self._meta_keys.pop(position, []):
+                self._by_meta[key] &= ~bit
+            self._index_meta(position, obj)
+            if obj._is_meta_required:
+                self._pending[position] = None
+            else:
+                self._pending.pop(position, None)
+
+    def pending(self, base: Optional[str] = None) -> tuple[Object, ...]:
+        ''' Objects which still require meta information from backend '''
+        with self._lock:
+            objects = (self._items[position] for position in self._pending)
+            return tuple(obj for obj in objects if base is None or obj.base == base)
+
+    def find(
+            self,
+            base: Optional[str] = None,
+            camera_ids: Optional[Iterable[str]] = None,
+            time_from: TimeBoundType = None,
+            time_to: TimeBoundType = None,
+            meta: Optional[Mapping[str, Any]] = None,
+            predicate: Optional[ObjectPredicate] = None,
+    ) -> tuple[Object, ...]:
+        with self._lock:
+            mask, exact = self._select(base, camera_ids, time_from, time_to, meta)
+            objects = tuple(self._items[position] for position in _iter_bits(mask))
+        if not exact:
+            objects = tuple(obj for obj in objects if obj.has_meta(meta))
+        if predicate:
+            objects = tuple(filter(predicate, objects))
+        return objects
+
+    def count(
+            self,
+            base: Optional[str] = None,
+            camera_ids: Optional[Iterable[str]] = None,
+            time_from: TimeBoundType = None,
+            time_to: TimeBoundType = None,
+            meta: Optional[Mapping[str, Any]] = None,
+            predicate: Optional[ObjectPredicate] = None,
+    ) -> int:
+        with self._lock:
+            mask, exact = self._select(base, camera_ids, time_from, time_to, meta)
+        if exact and predicate is None:
+            return mask.bit_count()
+        return len(self.find(base, camera_ids, time_from, time_to, meta, predicate))
+
+    def _index_meta(self, position: int, obj: Object) -> None:
+        bit = 1 << position
+        keys = _meta_index_keys(obj.meta)
+        for key in keys:
+            self._by_meta[key] |= bit
+        self._meta_keys[position] = keys
+
+    def _select(
+            self,
+            base: Optional[str],
+            camera_ids: Optional[Iterable[str]],
+            time_from: TimeBoundType,
+            time_to: TimeBoundType,
+            meta: Optional[Mapping[str, Any]],
+    ) -> tuple[int, bool]:
+        '''
+        Returns bitset of suitable objects and flag whether the bitset is exact.
+        Not exact bitset is a superset: `Object.has_meta` should be checked.
+        '''
+        mask = (1 << len(self._items)) - 1
+        exact = True
+        if base is not None:
+            mask &= self._by_base.get(base, 0)
+        if camera_ids is not None:
+            cameras_mask = 0
+            for camera_id in camera_ids:
+                cameras_mask |= self._by_camera.get(camera_id, 0)
+            mask &= cameras_mask
+        if meta:
+            mask, exact = self._select_meta(mask, meta)
+        if time_from is not None or time_to is not None:
+            mask = self._select_time(mask, to_timestamp(time_from), to_timestamp(time_to))
+        return mask, exact
+
+    def _select_meta(self, mask: int, meta: Mapping[str, Any]) -> tuple[int, bool]:
+        # the same rules as `Object.has_meta` has
+        if meta.get(consts.META_LIC_PLATE) == '*':
+            # "any license plate" makes `has_meta` skip other attributes
+            return mask, False
+        exact = True
+        for key, value in meta.items():
+            if key == consts.AGE_RANGE_STUB:
+                continue
+            try:
+                mask &= self._by_meta.get((key, value), 0)
+            except TypeError:   # unhashable value
+                exact = False
+        return mask, exact
+
+    def _select_time(self, mask: int, time_from: Optional[float], time_to: Optional[float]) -> int:
+        left = 0 if time_from is None else bisect_left(self._timeline, (time_from, -1))
+        right = len(self._timeline) if time_to is None else bisect_right(self._timeline, (time_to, len(self._items)))
+        if right - left > mask.bit_count():
+            # it is cheaper to check timestamps of already selected objects
+            return _mask_from_positions(
+                (
+                    position for position in _iter_bits(mask)
+                    if (time_from is None or float(self._items[position].timestamp) >= time_from)
+                    and (time_to is None or float(self._items[position].timestamp) <= time_to)
+                ),
+                len(self._items),
+            )
+        time_mask = _mask_from_positions(
+            (position for _, position in self._timeline[left:right]),
+            len(self._items),
+        )
+        return mask & time_mask
@@ -0,0 +1,179 @@
+'''
+Record and replay of packets sent to meta-receiver.
+
+File format (append-only):
+    MAGIC
+    [send time: double][packet length: uint32][msgpack packet] ...
+Access token isn't recorded (it's blank in recorded packets).
+Replay rewrites access token, track id, timestamps (shifted to the replay time)
+and optionally camera ids, so a recording can be replayed against any environment
+without selecting and encoding templates again.
+'''
+from __future__ import annotations
+from concurrent import futures
+from pathlib import Path
+from typing import Any
+from typing import BinaryIO
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+import logging
+import struct
+import threading
+import time
+import uuid
+
+import msgpack
+
+from tools.correlation import MICROSECONDS
+from tools.sender_engine import SendStats
+if TYPE_CHECKING:
+    from tools.client import ApiClient
+    from tools.sender_engine import SenderEngine
+
+log = logging.getLogger('tools.packet_log')
+
+MAGIC = b'METAPIX-PACKETS\x01'
+RECORD_HEADER = struct.Struct('>dI')
+
+
+class PacketLogError(Exception):
+    pass
+
+
+class PacketRecorder:
+    ''' Thread safe writer of packets. Every packet is flushed right away (the file is valid at any moment) '''
+    def __init__(self, path: str | Path):
+        self._path = Path(path)
+        self._lock = threading.Lock()
+        self._file: BinaryIO = open(self._path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self.count = 0
+        log.info(f'Record packets to {self._path}')
+
+    def __str__(self):
+        return f'PacketRecorder {self._path} ({self.count} packets)'
+
+    def write(self, packet: bytes, sent_at: Optional[float] = None) -> None:
+        header = RECORD_HEADER.pack(sent_at or time.time(), len(packet))
+        with self._lock:
+            self._file.write(header)
+            self._file.write(packet)
+            self._file.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+        log.info(f'{self} closed')
+
+
+def read_packets(path: str | Path) -> Iterator[tuple[float, bytes]]:
+    ''' (send time, packet) pairs. Truncated last record (e.g. recorder was killed) is skipped '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise PacketLogError(f'{path} is not a packet log')
+        while header := f.read(RECORD_HEADER.size):
+            if len(header) < RECORD_HEADER.size:
+                log.warning(f'{path}: truncated record header')
+                return
+            sent_at, size = RECORD_HEADER.unpack(header)
+            packet = f.read(size)
+            if len(packet) < size:
+                log.warning(f'{path}: truncated packet')
+                return
+            yield sent_at, packet
+
+
+class PacketRewriter:
+    '''
+    Makes recorded packet valid for the current run:
+     - the current access token
+     - new track id (every replay sends new objects)
+     - timestamp is shifted by the difference between replay and recorded send time
+     - camera ids are mapped to `cameras` (in order of appearance), if they are specified
+    '''
+    def __init__(self, client: ApiClient, cameras: Sequence[str] = ()):
+        self._client = client
+        self._lock = threading.Lock()
+        self._cameras = tuple(cameras)
+        self._camera_map: dict[str, str] = {}
+
+    def _camera_id(self, recorded_camera_id: str) -> str:
+        if not self._cameras:
+            return recorded_camera_id
+        with self._lock:
+            if recorded_camera_id not in self._camera_map:
+                self._camera_map[recorded_camera_id] = self._cameras[len(self._camera_map) % len(self._cameras)]
+            return self._camera_map[recorded_camera_id]
+
+    def __call__(self, packet: bytes, time_shift: float) -> bytes:
+        data = msgpack.unpackb(packet)
+        data['access_token'] = self._client.access_token
+        data['track_id'] = str(uuid.uuid4())
+        data['timestamp'] += round(time_shift * MICROSECONDS)
+        data['camera_id'] = self._camera_id(data['camera_id'])
+        return msgpack.packb(data)
+
+
+def replay(
+        engine: SenderEngine,
+        client: ApiClient,
+        path: str | Path,
+        speed: float = 1.,
+        cameras: Sequence[str] = ()) -> Mapping[str, Any]:
+    '''
+    Send recorded packets keeping the recorded intervals divided by `speed`.
+    speed=0 means as fast as possible (limited by the engine window).
+    Latency is measured from the scheduled send time (as in open loop load mode).
+    '''
+    if speed < 0:
+        raise ValueError(f'speed should not be negative: {speed}')
+    stats = SendStats()
+    scheduled = 0
+    max_lag = 0.
+    futures_: list[futures.Future] = []
+    rewrite = PacketRewriter(client, cameras)
+    first_sent_at: Optional[float] = None
+    time_start = time.time()
+
+    def _send(packet: bytes, sent_at: float, scheduled_at: float) -> None:
+        status: Optional[int | str] = None
+        try:
+            status = engine.post(rewrite(packet, scheduled_at - sent_at)).status_code
+        except Exception as exc:
+            status = exc.__class__.__name__
+            log.debug(f'Failed to replay packet: {exc}')
+        finally:
+            stats.record(scheduled_at, time.time() - scheduled_at, status)
+
+    log.info(f'Replay {path} at {"max" if not speed else speed}x speed')
+    for sent_at, packet in read_packets(path):
+        if first_sent_at is None:
+            first_sent_at = sent_at
+        scheduled_at = time.time()
+        if speed:
+            scheduled_at = time_start + (sent_at - first_sent_at) / speed
+            delay = scheduled_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        futures_.append(engine.submit(_send, packet, sent_at, scheduled_at))
+        scheduled += 1
+        if len(futures_) > 10_000:
+            futures_ = [f for f in futures_ if not f.done()]
+
+    for future in futures_:
+        future.result()
+    report = dict(stats.report())
+    report.update({
+        'speed': speed,
+        'scheduled': scheduled,
+        'max_schedule_lag_sec': round(max_lag, 3),
+    })
+    log.info(f'Replay finished: {stats}')
+    return report
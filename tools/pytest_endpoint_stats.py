@@ -0,0 +1,82 @@
+'''
+pytest plugin: report of backend endpoints (see `tools.endpoint_stats`) at the end of session.
+
+ - table of the top endpoints in terminal summary
+ - JSON attachment to allure report (teardown of session)
+ - Prometheus text file for CI trend graphs
+Stats of pytest-xdist workers are merged by the controller.
+'''
+from pathlib import Path
+import json
+import logging
+
+import allure
+import pytest
+
+from tools.endpoint_stats import SORT_KEYS
+from tools.endpoint_stats import endpoint_stats
+
+log = logging.getLogger('tools.pytest_endpoint_stats')
+
+DEFAULT_TOP = 20
+DEFAULT_PROMETHEUS_PATH = Path('logs') / 'endpoint_stats.prom'
+WORKER_OUTPUT_KEY = 'endpoint_stats'
+
+
+def _is_xdist_worker(config) -> bool:
+    return hasattr(config, 'workerinput')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('endpoint-stats', 'per-endpoint stats of backend requests')
+    group.addoption('--endpoint-stats-top', type=int, default=DEFAULT_TOP,
+                    help=f'Amount of endpoints in the summary table (0 to disable). Default: {DEFAULT_TOP}')
+    group.addoption('--endpoint-stats-sort', choices=SORT_KEYS, default='total',
+                    help='Sort key of the summary table. Default: total time')
+    group.addoption('--endpoint-stats-prometheus', default=str(DEFAULT_PROMETHEUS_PATH),
+                    help=f'Prometheus text file ("" to disable). Default: {DEFAULT_PROMETHEUS_PATH}')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def endpoint_stats_report():
+    ''' Attach stats of the session (of the worker with pytest-xdist) to allure report '''
+    yield endpoint_stats
+    if endpoint_stats:
+        allure.attach(
+            json.dumps(endpoint_stats.to_dict(), indent=2),
+            name='endpoint stats',
+            attachment_type=allure.attachment_type.JSON,
+        )
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    ''' pytest-xdist controller: merge stats of finished worker '''
+    if data := getattr(node, 'workeroutput', {}).get(WORKER_OUTPUT_KEY):
+        endpoint_stats.load(data)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    if _is_xdist_worker(config):
+        config.workeroutput[WORKER_OUTPUT_KEY] = endpoint_stats.to_dict()
+        return
+    if not endpoint_stats or not (path := config.getoption('endpoint_stats_prometheus')):
+        return
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(endpoint_stats.to_prometheus())
+    except OSError as exc:
+        log.warning(f'Unable to write endpoint stats to {path}: {exc}')
+        return
+    log.info(f'Endpoint stats of {len(endpoint_stats)} endpoints are written to {path}')
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    top = config.getoption('endpoint_stats_top')
+    if _is_xdist_worker(config) or not top or not endpoint_stats:
+        return
+    sort_key = config.getoption('endpoint_stats_sort')
+    terminalreporter.write_sep('=', f'top {top} backend endpoints by {sort_key}')
+    terminalreporter.write_line(endpoint_stats.format_table(top, sort_key))
@@ -0,0 +1,189 @@
+'''
+Opt-in cache of GET responses for read-mostly endpoints of `ApiClient`.
+
+ - every rule has its own TTL
+ - stale responses with ETag/Last-Modified are revalidated with a conditional request (304 -> cached response)
+ - memory is bounded: the least recently used responses are evicted
+ - mutating request (POST/PUT/PATCH/DELETE) of the same client invalidates rules of the resource
+Responses are cached per client and active company. Changes made by others (e.g. via web UI)
+are visible after TTL expires: that's why the cache is disabled by default.
+Config:
+    response_cache: true
+    response_cache_size: 8388608   # bytes
+'''
+from __future__ import annotations
+from collections import Counter
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+import logging
+import re
+import threading
+import time
+
+from requests.models import Response
+
+log = logging.getLogger('tools.response_cache')
+
+DEFAULT_CACHE_SIZE = 8 * 1024 * 1024  # bytes
+
+
+@dataclass(frozen=True)
+class CacheRule:
+    name: str
+    pattern: re.Pattern          # GET paths which are cached
+    ttl: float                   # seconds
+    invalidated_by: re.Pattern   # paths of mutating requests which invalidate cached responses
+
+
+DEFAULT_RULES: Sequence[CacheRule] = (
+    CacheRule('cameras', re.compile(r'^/device-manager/cameras'), 30.,
+              re.compile(r'^/device-manager/cameras')),
+    CacheRule('locations', re.compile(r'^/device-manager/locations'), 60.,
+              re.compile(r'^/device-manager/')),
+    CacheRule('layouts', re.compile(r'^/layout-manager/v\d+/layouts'), 60.,
+              re.compile(r'^/layout-manager/')),
+    CacheRule('companies', re.compile(r'^/auth-manager/(context/available-companies|v1/user/compan)'), 60.,
+              re.compile(r'^/auth-manager/(context/|v\d+/user/compan|v\d+/company|v\d+/register)')),
+    CacheRule('user', re.compile(r'^/auth-manager/v1/user/?$'), 60.,
+              re.compile(r'^/auth-manager/(auth/|users/|v\d+/users?\b|user-photo)')),
+    CacheRule('watchlists', re.compile(r'^/watchlist-manager/v1/(company-)?watchlists'), 60.,
+              re.compile(r'^/watchlist-manager/')),
+)
+
+
+@dataclass
+class _Entry:
+    rule: CacheRule
+    response: Response
+    expires: float
+    size: int
+
+    @property
+    def validators(self) -> Mapping[str, str]:
+        ''' Headers of conditional request '''
+        headers = {}
+        if etag := self.response.headers.get('ETag'):
+            headers['If-None-Match'] = etag
+        if last_modified := self.response.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+
+class ResponseCacheStats:
+    ''' Hits and misses per rule. One instance is shared by all caches of the run '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, Counter] = {}
+
+    def add(self, rule: str, event: str) -> None:
+        with self._lock:
+            self.counters.setdefault(rule, Counter())[event] += 1
+
+    def __bool__(self):
+        return bool(self.counters)
+
+    def __str__(self):
+        with self._lock:
+            counters = {rule: dict(counter) for rule, counter in self.counters.items()}
+        lines = []
+        for rule, counter in sorted(counters.items()):
+            hits = counter.get('hit', 0) + counter.get('revalidated', 0)
+            total = counter.get('hit', 0) + counter.get('conditional', 0) + counter.get('miss', 0)
+            ratio = f'{hits / total:.0%}' if total else '-'
+            lines.append(f'{rule}: hit ratio {ratio} ' + ' '.join(f'{k}={v}' for k, v in sorted(counter.items())))
+        return '; '.join(lines) or 'no requests'
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+class ResponseCache:
+    def __init__(self, rules: Sequence[CacheRule] = DEFAULT_RULES, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self._rules = tuple(rules)
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return f'ResponseCache {len(self)} responses {self._bytes}/{self._max_bytes} bytes'
+
+    def rule(self, path: str) -> Optional[CacheRule]:
+        for rule in self._rules:
+            if rule.pattern.search(path):
+                return rule
+        return None
+
+    def lookup(self, key: Hashable, path: str) -> tuple[Optional[Response], Mapping[str, str]]:
+        '''
+        Fresh cached response or headers for conditional request (empty if no validators).
+        Returns (None, {}) for paths which aren't cached.
+        '''
+        if (rule := self.rule(path)) is None:
+            return None, {}
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                response_cache_stats.add(rule.name, 'miss')
+                return None, {}
+            self._entries.move_to_end(key)
+            if entry.expires > time.monotonic():
+                response_cache_stats.add(rule.name, 'hit')
+                return entry.response, {}
+            if not entry.validators:
+                self._drop(key)
+                response_cache_stats.add(rule.name, 'miss')
+                return None, {}
+            response_cache_stats.add(rule.name, 'conditional')
+            return None, entry.validators
+
+    def store(self, key: Hashable, path: str, response: Response) -> None:
+        if (rule := self.rule(path)) is None:
+            return
+        size = len(response.content) + len(path)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(rule, response, time.monotonic() + rule.ttl, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                evicted_key, evicted = next(iter(self._entries.items()))
+                self._drop(evicted_key)
+                response_cache_stats.add(evicted.rule.name, 'evicted')
+
+    def revalidated(self, key: Hashable) -> Optional[Response]:
+        ''' Server has replied "304 Not Modified": cached response is fresh again '''
+        with self._lock:
+            if (entry := self._entries.get(key)) is None:
+                return None
+            entry.expires = time.monotonic() + entry.rule.ttl
+            response_cache_stats.add(entry.rule.name, 'revalidated')
+            return entry.response
+
+    def invalidate(self, path: str) -> None:
+        ''' Drop responses of rules which are invalidated by mutating request to `path` '''
+        rules = {rule for rule in self._rules if rule.invalidated_by.search(path)}
+        if not rules:
+            return
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.rule in rules:
+                    self._drop(key)
+                    response_cache_stats.add(entry.rule.name, 'invalidated')
+
+    def _drop(self, key: Hashable) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self._bytes -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
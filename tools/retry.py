@@ -1,28 +1,287 @@
+'''
+Retries of flaky calls and per-host circuit breakers.
+
+`retry` / `async_retry`:
+ - constant `delay` by default; opt-in exponential backoff with jitter: `delay`, `delay * backoff`, ...
+   up to `max_delay`, every sleep is randomized by +-`jitter` (concurrent workers don't retry in lockstep).
+   Backend clients use `NETWORK_BACKOFF` and `NETWORK_JITTER`
+ - optional overall `timeout`: no retry is started after the time budget is spent
+ - the original exception instance (with its traceback) is raised when retries are over
+Stacked decorators multiply attempts (3 x 2 x 2 x 2 for four stacked decorators).
+The outermost `retry_budget` limits the amount of retries and time of all `retry` decorators
+beneath it, for the current call only.
+
+`CircuitBreaker` (one per service and host:port, see `circuit_breaker`): after `failure_threshold`
+consecutive failures the circuit opens and calls fail fast (`CircuitOpenError`, never retried)
+for `reset_timeout` seconds; then one trial call is let through: success closes the circuit,
+failure opens it again.
+Config:
+    circuit_breaker_threshold: 5   # consecutive failures (0 to disable circuit breakers)
+    circuit_breaker_reset: 30      # seconds
+'''
+from __future__ import annotations
+from contextvars import ContextVar
+from dataclasses import dataclass
 from functools import wraps
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+import asyncio
+import random
+import threading
 import time
 import logging
 
+from tools import config
+
 log = logging.getLogger('tools.retry')
 
+DEFAULT_BACKOFF = 1.          # constant delay
+DEFAULT_MAX_DELAY = 30.       # seconds
+DEFAULT_JITTER = 0.
+NETWORK_BACKOFF = 2.          # requests to backend
+NETWORK_JITTER = 0.2          # +-20% of delay
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.   # seconds
+UNAVAILABLE_STATUS_CODES = (502, 503, 504)   # service is down: failures of circuit breaker
+
+
+class CircuitOpenError(Exception):
+    ''' Call is rejected by an open circuit breaker. Isn't retried by `retry` '''
+
+
+def retry_delays(
+        delay: float = 1.,
+        backoff: float = DEFAULT_BACKOFF,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        jitter: float = DEFAULT_JITTER,
+) -> Iterator[float]:
+    ''' Infinite sequence of sleeps between attempts '''
+    while True:
+        yield max(0., delay * random.uniform(1 - jitter, 1 + jitter))
+        delay = min(delay * backoff, max_delay)
+
+
+@dataclass
+class RetryBudget:
+    retries: Optional[int]       # retries left (None: unlimited)
+    deadline: Optional[float]    # time.monotonic()
+
+    def spend(self, sleep: float) -> bool:
+        ''' Take one retry which starts after `sleep` seconds. False if the budget is exhausted '''
+        if self.retries is not None and self.retries <= 0:
+            return False
+        if self.deadline is not None and time.monotonic() + sleep > self.deadline:
+            return False
+        if self.retries is not None:
+            self.retries -= 1
+        return True
+
+
+_budget: ContextVar[Optional[RetryBudget]] = ContextVar('retry_budget', default=None)
+
+
+def retry_budget(retries: Optional[int] = None, timeout: Optional[float] = None):
+    '''
+    Budget shared by all `retry`/`async_retry` decorators beneath (put it outermost):
+    at most `retries` retries in total and no retry after `timeout` seconds since the call.
+    Every call gets a new budget (nested calls of decorated functions too).
+    '''
+    def _new_budget() -> RetryBudget:
+        return RetryBudget(retries, time.monotonic() + timeout if timeout is not None else None)
+
+    def deco_budget(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_func_budget(*args, **kwargs):
+                token = _budget.set(_new_budget())
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _budget.reset(token)
+            return async_func_budget
+
+        @wraps(func)
+        def func_budget(*args, **kwargs):
+            token = _budget.set(_new_budget())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _budget.reset(token)
+        return func_budget
+
+    return deco_budget
+
+
+class _Attempts:
+    ''' Retry decision of one decorated call (shared by `retry` and `async_retry`) '''
+    def __init__(self, func, tries, delay, backoff, max_delay, jitter, timeout):
+        self._func_name = func.__name__
+        self._tries = tries
+        self._delays = retry_delays(delay, backoff, max_delay, jitter)
+        self._deadline = time.monotonic() + timeout if timeout is not None else None
+        self.used = 0
+
+    def next_sleep(self, exc: Exception) -> Optional[float]:
+        ''' Sleep before the next attempt or None if the call shouldn't be retried '''
+        self.used += 1
+        log.warning(f"{exc.__class__.__name__}: {exc} occured in {self._func_name}. "
+                    f"used attempts: {self.used} of {self._tries}")
+        if isinstance(exc, CircuitOpenError) or self.used >= self._tries:
+            return None
+        sleep = next(self._delays)
+        if self._deadline is not None and time.monotonic() + sleep > self._deadline:
+            log.warning(f'{self._func_name}: retry timeout is exceeded')
+            return None
+        if (budget := _budget.get()) is not None and not budget.spend(sleep):
+            log.warning(f'{self._func_name}: retry budget is exhausted')
+            return None
+        return sleep
+
 
 def retry(
         exception_to_check,
         tries: int = 2,
         delay: float = 1.,
+        backoff: float = DEFAULT_BACKOFF,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        jitter: float = DEFAULT_JITTER,
+        timeout: Optional[float] = None,
+        on_retry: Optional[Callable[..., None]] = None,
 ):
+    '''
+    tries: attempts in total
+    timeout: time budget (seconds since the first attempt) of the call
+    on_retry: called with arguments of `func` before every retry (e.g. to count retries)
+    '''
     def deco_retry(func):
         @wraps(func)
         def func_retry(*args, **kwargs):
-            last_exception = None
-            for try_number in range(tries):
+            attempts = _Attempts(func, tries, delay, backoff, max_delay, jitter, timeout)
+            while True:
                 try:
                     return func(*args, **kwargs)
                 except exception_to_check as exc:
-                    last_exception = exc
-                    log.warning(f"{exc.__class__.__name__}: {exc} occured in {func.__name__}. used attempts: {try_number+1} of {tries}")
-                    time.sleep(delay)
-            # TODO: print exception message
-            raise exception_to_check from last_exception
+                    if (sleep := attempts.next_sleep(exc)) is None:
+                        raise
+                if on_retry is not None:
+                    on_retry(*args, **kwargs)
+                time.sleep(sleep)
         return func_retry
 
     return deco_retry
+
+
+def async_retry(
+        exception_to_check,
+        tries: int = 2,
+        delay: float = 1.,
+        backoff: float = DEFAULT_BACKOFF,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        jitter: float = DEFAULT_JITTER,
+        timeout: Optional[float] = None,
+        on_retry: Optional[Callable[..., None]] = None,
+):
+    ''' `retry` for coroutine functions '''
+    def deco_retry(func):
+        @wraps(func)
+        async def func_retry(*args, **kwargs):
+            attempts = _Attempts(func, tries, delay, backoff, max_delay, jitter, timeout)
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except exception_to_check as exc:
+                    if (sleep := attempts.next_sleep(exc)) is None:
+                        raise
+                if on_retry is not None:
+                    on_retry(*args, **kwargs)
+                await asyncio.sleep(sleep)
+        return func_retry
+
+    return deco_retry
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+            reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._changed_at = time.monotonic()   # time of the last transition (or of the trial call)
+
+    def __str__(self):
+        return f'Circuit {self.name} {self._state} ({self._failures} failures)'
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        ''' May the call be made now? One trial call is allowed when the reset timeout is over '''
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if time.monotonic() - self._changed_at < self._reset_timeout:
+                return False
+            # open circuit after reset timeout or half-open one with trial call which never reported
+            self._set_state(self.HALF_OPEN)
+            return True
+
+    def check(self) -> None:
+        ''' Raise `CircuitOpenError` if the call isn't allowed '''
+        if not self.allow():
+            raise CircuitOpenError(f'{self}: fail fast')
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                    self._state == self.CLOSED and self._failures >= self._failure_threshold):
+                self._set_state(self.OPEN)
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            log_method = log.warning if state == self.OPEN else log.info
+            log_method(f'Circuit {self.name}: {self._state} -> {state} after {self._failures} failures')
+        self._state = state
+        self._changed_at = time.monotonic()
+
+
+_breakers: dict[tuple[str, str], CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(service: str, netloc: str) -> Optional[CircuitBreaker]:
+    '''
+    Circuit breaker shared by all clients of `service` (e.g. "api", "meta-receiver") at `netloc` (host:port).
+    Services behind one host don't open circuits of each other. None if circuit breakers are disabled
+    '''
+    threshold = config.user_config.get('circuit_breaker_threshold', DEFAULT_FAILURE_THRESHOLD)
+    if not threshold:
+        return None
+    key = service, netloc
+    with _breakers_lock:
+        if (breaker := _breakers.get(key)) is None:
+            breaker = _breakers[key] = CircuitBreaker(
+                f'{service}@{netloc}',
+                failure_threshold=threshold,
+                reset_timeout=config.user_config.get('circuit_breaker_reset', DEFAULT_RESET_TIMEOUT),
+            )
+        return breaker
@@ -1,5 +1,8 @@
 import logging
+import math
 from copy import deepcopy
+from typing import Any
+from typing import Mapping
 from typing import Sequence
 from typing import Optional
 
@@ -11,6 +14,7 @@ from tools import ObjectData
 from tools import json_to_object
 from tools import parse_object_type
 from tools.client import ApiClient
+from tools.types import BaseType
 from tools.types import IdStrType
 from tools.types import ImageTemplateType
 from tools.types import FiltersType
@@ -46,27 +50,20 @@ def _parse_template(object_type: ImageTemplateType, **kwargs) -> FiltersType:
     return filters
 
 
-def search_api_v2(
-        client: ApiClient,
+def make_search_request(
         object_type: ImageTemplateType,
-        filters: FiltersType = consts.API_GOOD_QUALITY,
-        pgsize: int = 100,
-        pgoffset: int = 0,
-        order: Optional[FiltersType] = None,
-        camera_id: Optional[Sequence[IdStrType]] = None,
-        location_id: Optional[Sequence[IdStrType]] = None,
-        recursive: bool = False,
-) -> GetList[ObjectData]:
-    # TODO: improve type hints (more strict)
-    def _repr_filters(filters):
-        filters = deepcopy(filters)
-        for key in filters.copy():
-            if isinstance(filters[key], dict):
-                filters[key] = _repr_filters(filters[key])
-            if not filters[key]:
-                del filters[key]
-        return filters
-
+        filters: FiltersType,
+        pgsize: int,
+        pgoffset: int,
+        order: Optional[FiltersType],
+        camera_id: Optional[Sequence[IdStrType]],
+        location_id: Optional[Sequence[IdStrType]],
+        timestamps: Optional[tuple[float, float]] = None,
+) -> tuple[BaseType, Mapping[str, Any]]:
+    '''
+    Base and body of v2 search request.
+    timestamps: (start, end) in seconds, both inclusive
+    '''
     base = parse_object_type(object_type)[0]
     filters = dict(filters)
     order = order or {}  # or consts.API_ORDER_DATE_DESC
@@ -87,7 +84,6 @@ def search_api_v2(
 
     data = {
         'common_filters': filters,
-        # TODO: 'timestamp_filters': timestamp_filters,
         'orderings': order,
         'pagination': {
             'pgoffset': pgoffset,
@@ -95,6 +91,13 @@ def search_api_v2(
         },
     } | type_filters
 
+    if timestamps is not None:
+        # milliseconds (like web UI sends)
+        data['timestamp_filters'] = {
+            'timestamp_start': math.floor(timestamps[0] * 1000),
+            'timestamp_end': math.ceil(timestamps[1] * 1000),
+        }
+
     # FYI https://metapix-workspace.slack.com/archives/C03L8340TBJ/p1724750942554269?thread_ts=1724698817.922119&cid=C03L8340TBJ
     if camera_id or location_id:
         data['camera_filters'] = {}
@@ -103,6 +106,34 @@ def search_api_v2(
         if location_id:
             data['camera_filters']['location'] = camera_id
 
+    return base, data
+
+
+def search_api_v2(
+        client: ApiClient,
+        object_type: ImageTemplateType,
+        filters: FiltersType = consts.API_GOOD_QUALITY,
+        pgsize: int = 100,
+        pgoffset: int = 0,
+        order: Optional[FiltersType] = None,
+        camera_id: Optional[Sequence[IdStrType]] = None,
+        location_id: Optional[Sequence[IdStrType]] = None,
+        recursive: bool = False,
+        timestamps: Optional[tuple[float, float]] = None,
+) -> GetList[ObjectData]:
+    # TODO: improve type hints (more strict)
+    def _repr_filters(filters):
+        filters = deepcopy(filters)
+        for key in filters.copy():
+            if isinstance(filters[key], dict):
+                filters[key] = _repr_filters(filters[key])
+            if not filters[key]:
+                del filters[key]
+        return filters
+
+    base, data = make_search_request(
+        object_type, filters, pgsize, pgoffset, order, camera_id, location_id, timestamps)
+
     items = GetList([
         json_to_object(data, camera_id_field='camera_id')
         for data in client.request(
@@ -130,6 +161,7 @@ def search_api_v2(
             camera_id=camera_id,
             location_id=location_id,
             recursive=recursive,
+            timestamps=timestamps,
         )
     return items
 
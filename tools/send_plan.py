@@ -0,0 +1,196 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Iterable
+from typing import Mapping
+from typing import Optional
+from typing import Sequence
+from typing import TYPE_CHECKING
+import logging
+import time
+
+import pytest
+
+import consts
+from tools import PreconditionException
+from tools import config
+from tools import parse_object_type
+from tools.cameras import CameraData
+from tools.object_store import TimeBoundType
+from tools.object_store import to_timestamp
+from tools.types import ImageTemplateType
+if TYPE_CHECKING:
+    from tools.image_sender import ImageSender
+    from tools.image_sender import MetaType
+
+log = logging.getLogger('tools.send_plan')
+
+MAX_TOP_UPS = 2   # extra sends if objects haven't got expected meta (e.g. bad quality)
+
+
+@dataclass
+class PlannedSend:
+    object_type: ImageTemplateType
+    camera: CameraData
+    count: int
+    meta: MetaType
+    expected_meta: MetaType = field(default_factory=dict)   # meta which backend is expected to set
+    timestamp: float = field(default_factory=time.time)
+
+    def __str__(self):
+        return f'{self.count} x {self.object_type} to {self.camera}'
+
+    @property
+    def base(self) -> str:
+        return parse_object_type(self.object_type)[0]
+
+    def matching_count(
+            self,
+            base: Optional[str] = None,
+            camera_ids: Optional[Iterable[str]] = None,
+            time_from: TimeBoundType = None,
+            time_to: TimeBoundType = None,
+            meta: Optional[Mapping[str, Any]] = None,
+            predicate=None,
+    ) -> int:
+        '''
+        Amount of planned objects which match `ObjectStore` query.
+        `predicate` (age range) isn't called: the age range is checked against expected meta
+        '''
+        from tools.image_sender import has_meta
+
+        if base is not None and base != self.base:
+            return 0
+        if camera_ids is not None and self.camera.id not in camera_ids:
+            return 0
+        if time_from is not None and self.timestamp < to_timestamp(time_from):
+            return 0
+        if time_to is not None and self.timestamp > to_timestamp(time_to):
+            return 0
+        meta = meta or {}
+        expected_meta = self.expected_meta | consts.META_ANY_QUALITY   # as `Object` has
+        if not has_meta(expected_meta, meta):
+            return 0
+        if consts.AGE_RANGE_STUB in meta:
+            age_from, age_to = meta[consts.AGE_RANGE_STUB]
+            if not age_from <= (expected_meta.get('age') or -1) <= age_to:
+                return 0
+        return self.count
+
+
+@dataclass
+class MinCount:
+    object_type: ImageTemplateType
+    min_count: int
+    cameras: Sequence[CameraData]
+    kwargs: Mapping[str, Any]
+
+
+class SendPlan:
+    '''
+    Deficits of several "min objects count" conditions.
+    Counts take into account objects which are planned but not sent yet,
+    so dependent conditions (e.g. "different objects count in camera sets") are planned in one pass.
+    `execute` sends everything in one burst and gets meta once. Then conditions are checked
+    against objects with actual meta: deficits are sent again (at most `MAX_TOP_UPS` times).
+    '''
+    def __init__(self, sender: ImageSender):
+        self._sender = sender
+        self._conditions: list[MinCount] = []
+        self.sends: list[PlannedSend] = []
+
+    def __len__(self):
+        return sum(send.count for send in self.sends)
+
+    def count(
+            self,
+            object_type: ImageTemplateType,
+            cameras: Sequence[CameraData],
+            meta: Optional[MetaType] = None,
+            timeslice=consts.DEFAULT_TIMESLICE,
+            date_from=None,
+            date_to=None,
+            **kwargs) -> int:
+        ''' Objects count as it will be after the plan is executed '''
+        query, _ = self._sender._make_query(object_type, meta, cameras, timeslice, date_from, date_to)
+        return self._sender._objects.count(**query) + sum(send.matching_count(**query) for send in self.sends)
+
+    def require_min(
+            self,
+            object_type: ImageTemplateType,
+            min_count: int,
+            cameras: Sequence[CameraData],
+            **kwargs) -> int:
+        ''' Plan sending of missing objects. Returns amount of planned objects '''
+        self._conditions.append(MinCount(object_type, min_count, cameras, kwargs))
+        actual_count = self.count(object_type, cameras, **kwargs)
+        condition_str = (f"min condition object_type:{object_type} {self._sender._repr_meta(kwargs.get('meta'))}: "
+                         f"{actual_count} >= {min_count}")
+        objects_amount_required = min_count - actual_count
+        if objects_amount_required <= 0:
+            log.info(f"{condition_str} OK!")
+            return 0
+        log.info(f"{condition_str}: need {objects_amount_required} more objects")
+        self.add(object_type, cameras[0], objects_amount_required, kwargs.get('meta'))
+        return objects_amount_required
+
+    def add(
+            self,
+            object_type: ImageTemplateType,
+            camera: CameraData,
+            count: int,
+            meta: Optional[MetaType] = None) -> None:
+        from tools.image_sender import parse_template
+
+        meta = meta or {}
+        expected_meta = self._expected_meta(parse_template(object_type, meta=meta)['meta'])
+        self.sends.append(PlannedSend(object_type, camera, count, meta, expected_meta))
+
+    def execute(self) -> None:
+        for top_up in range(MAX_TOP_UPS + 1):
+            self._send()
+            self._sender.get_meta_information_from_backend()
+            self.sends = []
+            if not self._plan_deficits():
+                return
+            if top_up == MAX_TOP_UPS:
+                break
+            log.warning(f'Top up {len(self)} objects which have not got expected meta')
+        raise PreconditionException(
+            f'Objects count conditions are not met after {MAX_TOP_UPS} top ups: {", ".join(map(str, self.sends))}')
+
+    def _send(self) -> None:
+        if not self.sends:
+            return
+        if config.pytest_options and config.pytest_options.skip_sender_tests:
+            pytest.skip('Sending objects is not allowed')
+        log.info(f'Send {len(self)} objects: {", ".join(map(str, self.sends))}')
+        futures_ = []
+        for send in self.sends:
+            _, send_futures = self._sender._submit_objects(
+                send.object_type, send.count, send.camera, meta=send.meta)
+            futures_.extend(send_futures)
+        self._sender._wait_sent(futures_)
+
+    def _plan_deficits(self) -> int:
+        ''' Plan objects which are missing according to actual objects. Returns amount of planned objects '''
+        planned = 0
+        for condition in self._conditions:
+            missing = condition.min_count - self.count(condition.object_type, condition.cameras, **condition.kwargs)
+            if missing > 0:
+                log.info(f'{condition.object_type}: {missing} objects are missing after sending')
+                self.add(condition.object_type, condition.cameras[0], missing, condition.kwargs.get('meta'))
+                planned += missing
+        return planned
+
+    @staticmethod
+    def _expected_meta(meta: MetaType) -> MetaType:
+        ''' Meta which backend is expected to set for template with `meta` '''
+        expected_meta = dict(meta)
+        if consts.AGE_RANGE_STUB in expected_meta:
+            age_from, _ = expected_meta.pop(consts.AGE_RANGE_STUB)
+            expected_meta['age'] = age_from
+        if 'bad_quality' not in expected_meta:
+            expected_meta.update(consts.META_GOOD_QUALITY)
+        return expected_meta
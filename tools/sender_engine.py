@@ -0,0 +1,208 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from concurrent import futures
+from typing import Any
+from typing import Callable
+from typing import Mapping
+from typing import Optional
+from urllib.parse import urlsplit
+
+from requests.models import Response
+
+from tools.endpoint_stats import endpoint_stats
+from tools.retry import UNAVAILABLE_STATUS_CODES
+from tools.retry import circuit_breaker
+from tools.sessions import PooledSession
+
+log = logging.getLogger('tools.sender_engine')
+
+DEFAULT_WORKERS = 10
+META_RECEIVER_SERVICE = 'meta-receiver'   # circuit breaker of meta-receiver (see `tools.retry.circuit_breaker`)
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    ''' Nearest-rank percentile. `sorted_values` must be sorted '''
+    if not sorted_values:
+        return 0.
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+class SendStats:
+    ''' Per-request latency and throughput of meta-receiver requests '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latencies: list[float] = []
+            self.status_codes: Counter = Counter()
+            self.errors = 0
+            self.started: Optional[float] = None
+            self.finished: Optional[float] = None
+
+    def record(self, started: float, latency: float, status_code: Optional[int | str]) -> None:
+        ''' `status_code` is either HTTP status code or name of exception (None for unknown error) '''
+        with self._lock:
+            if self.started is None or started < self.started:
+                self.started = started
+            finished = started + latency
+            if self.finished is None or finished > self.finished:
+                self.finished = finished
+            self.latencies.append(latency)
+            if status_code is None or status_code != 200:
+                self.errors += 1
+            self.status_codes[status_code or 'error'] += 1
+
+    def merge(self, other: 'SendStats') -> None:
+        ''' Add results collected by another sender (e.g. in another process) '''
+        with self._lock:
+            self.latencies.extend(other.latencies)
+            self.status_codes.update(other.status_codes)
+            self.errors += other.errors
+            if other.started is not None and (self.started is None or other.started < self.started):
+                self.started = other.started
+            if other.finished is not None and (self.finished is None or other.finished > self.finished):
+                self.finished = other.finished
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.
+        return self.finished - self.started
+
+    @property
+    def throughput(self) -> float:
+        ''' Requests per second '''
+        if not self.duration:
+            return 0.
+        return self.count / self.duration
+
+    def report(self) -> Mapping[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            status_codes = dict(self.status_codes)
+        return {
+            'count': len(latencies),
+            'errors': self.errors,
+            'duration_sec': round(self.duration, 3),
+            'throughput_rps': round(self.throughput, 2),
+            'latency_ms': {
+                'mean': round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.,
+                'p50': round(1000 * percentile(latencies, 50), 2),
+                'p95': round(1000 * percentile(latencies, 95), 2),
+                'p99': round(1000 * percentile(latencies, 99), 2),
+                'max': round(1000 * latencies[-1], 2) if latencies else 0.,
+            },
+            'status_codes': {str(code): amount for code, amount in status_codes.items()},
+        }
+
+    def __str__(self):
+        report = self.report()
+        latency = report['latency_ms']
+        return (f'sent={report["count"]} errors={report["errors"]} '
+                f'throughput={report["throughput_rps"]}/s '
+                f'latency p50={latency["p50"]}ms p95={latency["p95"]}ms p99={latency["p99"]}ms')
+
+
+class SenderEngine:
+    '''
+    Long-lived engine for meta-receiver requests:
+     - persistent keep-alive connection pool
+     - fixed pool of worker threads
+     - bounded amount of requests in flight (`submit` blocks when the window is full)
+    '''
+    def __init__(
+            self,
+            url: str,
+            timeout: tuple[int, int],
+            workers: int = DEFAULT_WORKERS,
+            inflight: Optional[int] = None,
+    ):
+        self._url = url
+        self._host = urlsplit(url).netloc
+        self._path = urlsplit(url).path or '/'
+        self._timeout = timeout
+        self._workers = workers
+        self._inflight = inflight or workers * 2
+        self._session = PooledSession(pool_size=workers)
+        self._session.headers['Content-Type'] = 'application/msgpack'
+        self._executor = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sender')
+        self._window = threading.BoundedSemaphore(self._inflight)
+        self.stats = SendStats()
+        log.info(f'Sender engine: {workers=} inflight={self._inflight} url={url}')
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def path(self) -> str:
+        ''' Path of meta-receiver endpoint (see `tools.endpoint_stats`) '''
+        return self._path
+
+    @property
+    def session(self) -> PooledSession:
+        return self._session
+
+    def post(self, data: bytes) -> Response:
+        '''
+        Synchronous POST to meta-receiver.
+        Latency is recorded (into `stats` and `tools.endpoint_stats`) even if request failed.
+        Raises `tools.retry.CircuitOpenError` without sending if meta-receiver has been failing
+        '''
+        breaker = circuit_breaker(META_RECEIVER_SERVICE, self._host)
+        if breaker is not None:
+            breaker.check()
+        started = time.time()
+        time_start = time.perf_counter()
+        status_code = None
+        try:
+            response = self._session.post(self._url, data=data, timeout=self._timeout)
+            status_code = response.status_code
+            return response
+        finally:
+            latency = time.perf_counter() - time_start
+            self.stats.record(started, latency, status_code)
+            endpoint_stats.record('post', self._path, status_code, latency)
+            if breaker is not None:
+                if status_code is None or status_code in UNAVAILABLE_STATUS_CODES:
+                    breaker.failure()
+                else:
+                    breaker.success()
+
+    def submit(self, func: Callable, *args, **kwargs) -> futures.Future:
+        self._window.acquire()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._window.release()
+            raise
+        future.add_done_callback(lambda _: self._window.release())
+        return future
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        log.info(f'Sender engine closed: {self.stats}. Connections: {self._session.stats()}')
+        self._session.close()
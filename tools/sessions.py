@@ -0,0 +1,74 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger('tools.sessions')
+
+DEFAULT_POOL_SIZE = 10
+
+
+@dataclass
+class ConnectionStats:
+    requests: int
+    connections: int
+    pools: int
+
+    @property
+    def reused(self) -> int:
+        ''' Amount of requests which didn't open a new TCP+TLS connection '''
+        return max(self.requests - self.connections, 0)
+
+    @property
+    def reuse_ratio(self) -> float:
+        if not self.requests:
+            return 0.
+        return self.reused / self.requests
+
+    def __str__(self):
+        return (f'requests={self.requests} connections={self.connections} '
+                f'reused={self.reused} ({self.reuse_ratio:.1%}) pools={self.pools}')
+
+
+class PooledSession(requests.Session):
+    '''
+    `requests.Session` with keep-alive connection pool of configurable size.
+    One instance is supposed to be shared between threads:
+    urllib3 connection pools are thread-safe, `requests.Session` itself doesn't keep
+    any state we change after initialization.
+    '''
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        super().__init__()
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        self.headers['Connection'] = 'keep-alive'
+        for prefix in ('http://', 'https://'):
+            self.mount(
+                prefix,
+                HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False),
+            )
+
+    @property
+    def pool_size(self) -> int:
+        return self._pool_size
+
+    def stats(self) -> ConnectionStats:
+        ''' Collect connection reuse counters from urllib3 pools '''
+        requests_count = connections_count = pools_count = 0
+        with self._lock:
+            for adapter in self.adapters.values():
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_count += pool.num_requests
+                    connections_count += pool.num_connections
+                    pools_count += 1
+        return ConnectionStats(
+            requests=requests_count,
+            connections=connections_count,
+            pools=pools_count,
+        )
@@ -0,0 +1,327 @@
+'''
+Local stand-in for meta-receiver and object-manager search.
+
+Speaks the same protocol as the cloud (as far as `ImageSender` and `tools.search` use it):
+ - POST /meta-receiver/                        msgpack packet -> object is stored in memory
+ - POST /object-manager/v2/search/<base>       pagination, ordering by timestamp, image quality, camera
+                                               and timestamp filters
+ - GET  /object-manager/objects/<id>
+Latency, ingestion delay and errors can be injected. Runs asyncio HTTP/1.1 server (keep-alive)
+in a background thread, so it can be used from tests and benchmarks:
+
+    with StandIn(latency=0.01) as standin:
+        config.user_config[config.environment]['url'] = standin.url
+
+or standalone: python -m tools.standin --port 8080
+'''
+from __future__ import annotations
+from bisect import insort
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+import msgpack
+
+import consts
+from tools.correlation import MICROSECONDS
+
+log = logging.getLogger('tools.standin')
+
+ID_TO_BASE = {0: consts.BASE_FACE, 1: consts.BASE_VEHICLE, 2: consts.BASE_PERSON}   # see `tools.image_sender.BASE_TO_ID`
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+@dataclass
+class StandInObject:
+    id: int
+    base: str
+    camera_id: str
+    timestamp: float
+    roi: Any
+    meta: Mapping[str, Any]
+    track_id: Optional[str]
+    visible_at: float
+    cluster_size: int = 1
+
+    def to_json(self, camera_id_field: str = 'camera_id') -> Mapping[str, Any]:
+        return {
+            'id': self.id,
+            'cluster_size': self.cluster_size,
+            'type': self.base,
+            camera_id_field: self.camera_id,
+            'timestamp': self.timestamp,
+            'roi': self.roi,
+            'is_reference': False,
+            'meta': self.meta,
+            'parent_id': None,
+            'image_url': f'/object-manager/objects/{self.id}/image',
+            'track_id': self.track_id,
+        }
+
+
+@dataclass
+class Response:
+    status: int
+    body: Mapping[str, Any] = field(default_factory=lambda: {'message': 'OK'})
+
+    def encode(self) -> bytes:
+        return json.dumps(self.body).encode()
+
+
+class ObjectDatabase:
+    ''' Objects by base sorted by timestamp. Not thread safe: used from the event loop only '''
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._by_base: dict[str, list[tuple[float, int, StandInObject]]] = {base: [] for base in ID_TO_BASE.values()}
+        self._by_id: dict[int, StandInObject] = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, packet: Mapping[str, Any], visible_at: float) -> StandInObject:
+        obj = StandInObject(
+            id=next(self._ids),
+            base=ID_TO_BASE[packet['label']],
+            camera_id=packet['camera_id'],
+            timestamp=packet['timestamp'] / MICROSECONDS,
+            roi=packet.get('roi'),
+            meta={'bad_quality': 'good'} | {
+                key: value for key, value in (packet.get('meta') or {}).items() if not key.startswith('_')},
+            track_id=packet.get('track_id'),
+            visible_at=visible_at,
+        )
+        insort(self._by_base[obj.base], (obj.timestamp, obj.id, obj))
+        self._by_id[obj.id] = obj
+        return obj
+
+    def get(self, object_id: int) -> Optional[StandInObject]:
+        return self._by_id.get(object_id)
+
+    def search(
+            self,
+            base: str,
+            now: float,
+            descending: bool,
+            quality: Optional[str],
+            cameras: Optional[set[str]],
+            since: float = float('-inf'),
+            until: float = float('inf')) -> Iterator[StandInObject]:
+        items = self._by_base[base]
+        for _, _, obj in (reversed(items) if descending else items):
+            if not since <= obj.timestamp <= until:
+                continue
+            if obj.visible_at > now:
+                continue
+            if quality and obj.meta.get('bad_quality') != quality:
+                continue
+            if cameras and obj.camera_id not in cameras:
+                continue
+            yield obj
+
+
+class StandIn:
+    '''
+    latency: delay of every response (seconds), `jitter` is added uniformly
+    ingest_delay: objects appear in search after this delay
+    error_rate: part of requests which fail with 500
+    reject_rate: part of meta-receiver packets which are rejected with 422 "Unprocessable entity"
+    expired_tokens: packets with these access tokens are rejected with 403 "Token is expired"
+    '''
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            latency: float = 0.,
+            jitter: float = 0.,
+            ingest_delay: float = 0.,
+            error_rate: float = 0.,
+            reject_rate: float = 0.,
+            seed: Optional[int] = None,
+    ):
+        self._host = host
+        self._port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.ingest_delay = ingest_delay
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self._rng = random.Random(seed)
+        self.db = ObjectDatabase()
+        self.expired_tokens: set[str] = set()
+        self.requests = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __str__(self):
+        return f'StandIn {self.url} objects={len(self.db)} requests={self.requests}'
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._host}:{self._port}'
+
+    def start(self) -> StandIn:
+        self._thread = threading.Thread(target=self._run, name='standin', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        log.info(f'{self} started')
+        return self
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        log.info(f'{self} stopped')
+        self._loop = None
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self._host, self._port))
+        self._port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _shutdown(self) -> None:
+        ''' Close listening socket and keep-alive connections '''
+        self._server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ConnectionError:
+                    return
+                if not request_line:
+                    return
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                size = int(headers.get('content-length', 0))
+                if size > MAX_BODY_SIZE:
+                    return
+                body = await reader.readexactly(size) if size else b''
+                response = await self._respond(method, path, headers, body)
+                payload = response.encode()
+                writer.write(
+                    f'HTTP/1.1 {response.status} -\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload
+                )
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as exc:
+            log.debug(f'Connection dropped: {exc}')
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, path: str, headers: Mapping[str, str], body: bytes) -> Response:
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._rng.uniform(0, self.jitter))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            return Response(500, {'message': 'Injected error'})
+        try:
+            if method == 'POST' and path.rstrip('/') == '/meta-receiver':
+                return self._receive(body)
+            if method == 'POST' and path.startswith('/object-manager/v2/search/'):
+                return self._search(path.rsplit('/', 1)[-1], json.loads(body or b'{}'))
+            if method == 'GET' and path.startswith('/object-manager/objects/'):
+                return self._get_object(int(path.rsplit('/', 1)[-1]))
+        except (KeyError, ValueError, TypeError) as exc:
+            return Response(400, {'message': f'Bad request: {exc!r}'})
+        return Response(404, {'message': f'Not found: {method} {path}'})
+
+    def _receive(self, body: bytes) -> Response:
+        packet = msgpack.unpackb(body)
+        if not packet.get('access_token'):
+            return Response(401, {'message': 'No access token'})
+        if packet['access_token'] in self.expired_tokens:
+            return Response(403, {'message': 'Token is expired'})
+        if not packet.get('im_bytes') or (self.reject_rate and self._rng.random() < self.reject_rate):
+            return Response(422, {'message': 'Unprocessable entity'})
+        obj = self.db.add(packet, visible_at=time.time() + self.ingest_delay)
+        return Response(200, {'message': 'OK', 'id': obj.id})
+
+    def _search(self, base: str, query: Mapping[str, Any]) -> Response:
+        if base not in ID_TO_BASE.values():
+            return Response(404, {'message': f'Unknown base: {base}'})
+        pagination = query.get('pagination', {})
+        pgoffset = pagination.get('pgoffset', 0)
+        pgsize = pagination.get('pgsize', 100)
+        quality = {0: 'good', 1: 'bad'}.get(query.get('common_filters', {}).get('image_quality'))
+        cameras = set(query.get('camera_filters', {}).get('camera') or []) or None
+        descending = 'desc' in query.get('orderings', {}).get('timestamp', '')
+        timestamps = query.get('timestamp_filters', {})   # milliseconds
+        since = timestamps.get('timestamp_start', float('-inf')) / 1000
+        until = timestamps.get('timestamp_end', float('inf')) / 1000
+        items = itertools.islice(
+            self.db.search(base, time.time(), descending, quality, cameras, since, until), pgoffset, pgoffset + pgsize)
+        return Response(200, {'items': [obj.to_json() for obj in items]})
+
+    def _get_object(self, object_id: int) -> Response:
+        obj = self.db.get(object_id)
+        if obj is None:
+            return Response(404, {'message': f'Object {object_id} not found'})
+        return Response(200, obj.to_json(camera_id_field='camera'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local meta-receiver and object-manager stand-in')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0., help='Delay of every response (seconds)')
+    parser.add_argument('--jitter', type=float, default=0., help='Random extra delay (seconds)')
+    parser.add_argument('--ingest-delay', type=float, default=0., help='Objects appear in search after the delay')
+    parser.add_argument('--error-rate', type=float, default=0., help='Part of requests which fail with 500')
+    parser.add_argument('--reject-rate', type=float, default=0., help='Part of packets rejected with 422')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    standin = StandIn(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        ingest_delay=args.ingest_delay,
+        error_rate=args.error_rate,
+        reject_rate=args.reject_rate,
+    ).start()
+    try:
+        while True:
+            time.sleep(60)
+            log.info(standin)
+    except KeyboardInterrupt:
+        standin.stop()
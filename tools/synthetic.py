@@ -0,0 +1,164 @@
+'''
+Synthetic images: distinct but valid variations of base templates.
+
+Every variation has an identity and a sample number:
+ - identity defines strong perturbations (affine transform, colour shift, texture),
+   so images of different identities are not expected to be clustered together
+ - sample defines weak perturbations (pixel noise, small jitter),
+   so images of the same identity are expected to be clustered together
+Images are generated in memory with vectorized NumPy operations (nothing is written to disk).
+NumPy is imported on demand: it is required only if synthetic images are used
+(`SyntheticProfile` checks it is installed, so a run fails before sending anything).
+'''
+from __future__ import annotations
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Iterator
+from typing import Optional
+from typing import TYPE_CHECKING
+import importlib
+import itertools
+import math
+import random
+
+from PIL import Image
+if TYPE_CHECKING:
+    import numpy as np
+
+IDENTITY_JITTER = (6., 0.05, 0.04)   # max rotation (degrees), max scale change, max shift (part of size)
+SAMPLE_JITTER = (1., 0.01, 0.01)
+IDENTITY_COLOR_GAIN = 0.15
+IDENTITY_COLOR_SHIFT = 20.
+IDENTITY_TEXTURE = 12.
+SAMPLE_NOISE = 3.
+
+_samples = itertools.count()
+
+
+def require_numpy() -> None:
+    try:
+        importlib.import_module('numpy')
+    except ImportError as exc:
+        raise RuntimeError('Synthetic images require NumPy: pip install -r requirements.txt') from exc
+
+
+@dataclass(frozen=True)
+class Variation:
+    identity: int
+    sample: int = 0
+
+
+@dataclass
+class SyntheticProfile:
+    '''
+    How synthetic images are spread over identities:
+     - identities=None: every image has its own identity (nothing should be clustered)
+     - identities=N: images are spread over N identities in round-robin manner
+       (every identity is expected to become a cluster)
+    The same `seed` gives the same identities.
+    Round-robin continues between calls of `next_variation` (e.g. between several `ImageSender.send`).
+    '''
+    identities: Optional[int] = None
+    seed: Optional[int] = None
+    _variations: Optional[Iterator[Variation]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.identities is not None and self.identities <= 0:
+            raise ValueError(f'identities should be positive: {self.identities}')
+        require_numpy()
+
+    def __str__(self):
+        return f'synthetic images: identities={self.identities or "unique"} seed={self.seed}'
+
+    def next_variation(self) -> Variation:
+        if self._variations is None:
+            self._variations = self._generate()
+        return next(self._variations)
+
+    def _generate(self) -> Iterator[Variation]:
+        rng = random.Random(self.seed)
+        if self.identities is None:
+            while True:
+                yield Variation(identity=rng.getrandbits(63), sample=next(_samples))
+        identities = [rng.getrandbits(63) for _ in range(self.identities)]
+        for identity in itertools.cycle(identities):
+            yield Variation(identity=identity, sample=next(_samples))
+
+
+def synthesize(image: Image.Image, variation: Variation) -> Image.Image:
+    import numpy as np
+
+    identity_rng = np.random.default_rng(variation.identity)
+    sample_rng = np.random.default_rng([variation.identity, variation.sample])
+    pixels = np.asarray(image.convert('RGB'), dtype=np.float32)
+    height, width, _ = pixels.shape
+
+    matrix = _random_affine(identity_rng, *IDENTITY_JITTER, width, height) \
+        @ _random_affine(sample_rng, *SAMPLE_JITTER, width, height)
+    pixels = _warp(pixels, matrix)
+    pixels = pixels * identity_rng.uniform(1 - IDENTITY_COLOR_GAIN, 1 + IDENTITY_COLOR_GAIN, 3) \
+        + identity_rng.uniform(-IDENTITY_COLOR_SHIFT, IDENTITY_COLOR_SHIFT, 3)
+    pixels += _smooth_noise(identity_rng, height, width, cells=8, amplitude=IDENTITY_TEXTURE)
+    pixels += sample_rng.normal(0, SAMPLE_NOISE, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+
+def _random_affine(
+        rng: np.random.Generator,
+        max_angle: float,
+        max_scale: float,
+        max_shift: float,
+        width: int,
+        height: int) -> np.ndarray:
+    ''' 3x3 matrix: rotation and scale around the image center + shift '''
+    import numpy as np
+
+    angle = math.radians(rng.uniform(-max_angle, max_angle))
+    scale = 1 + rng.uniform(-max_scale, max_scale)
+    shift_x, shift_y = rng.uniform(-max_shift, max_shift, 2) * (width, height)
+    cos, sin = math.cos(angle) * scale, math.sin(angle) * scale
+    return np.array([
+        [cos, -sin, shift_x],
+        [sin, cos, shift_y],
+        [0., 0., 1.],
+    ])
+
+
+def _warp(pixels: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    ''' Inverse mapping with bilinear interpolation. Border pixels are replicated '''
+    import numpy as np
+
+    height, width, _ = pixels.shape
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    xs -= width / 2
+    ys -= height / 2
+    src_x = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2] + width / 2
+    src_y = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2] + height / 2
+
+    x0 = np.floor(src_x)
+    y0 = np.floor(src_y)
+    fx = (src_x - x0)[..., None]
+    fy = (src_y - y0)[..., None]
+    x0 = np.clip(x0, 0, width - 1).astype(np.intp)
+    y0 = np.clip(y0, 0, height - 1).astype(np.intp)
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    return (pixels[y0, x0] * (1 - fx) * (1 - fy) + pixels[y0, x1] * fx * (1 - fy)
+            + pixels[y1, x0] * (1 - fx) * fy + pixels[y1, x1] * fx * fy)
+
+
+def _smooth_noise(rng: np.random.Generator, height: int, width: int, cells: int, amplitude: float) -> np.ndarray:
+    ''' Low-frequency colour field: random `cells`x`cells` grid upscaled with bilinear interpolation '''
+    import numpy as np
+
+    grid = rng.normal(0, amplitude, (cells, cells, 3)).astype(np.float32)
+    ys = np.linspace(0, cells - 1, height)
+    xs = np.linspace(0, cells - 1, width)
+    y0 = np.floor(ys).astype(np.intp)
+    x0 = np.floor(xs).astype(np.intp)
+    y1 = np.minimum(y0 + 1, cells - 1)
+    x1 = np.minimum(x0 + 1, cells - 1)
+    fy = (ys - y0)[:, None, None]
+    fx = (xs - x0)[None, :, None]
+    rows = grid[y0] * (1 - fy) + grid[y1] * fy
+    return rows[:, x0] * (1 - fx) + rows[:, x1] * fx
@@ -0,0 +1,144 @@
+import io
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+from typing import Hashable
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFont
+
+log = logging.getLogger('tools.templates')
+
+DEFAULT_TEMPLATE_CACHE_SIZE = 64 * 1024 * 1024  # bytes
+
+
+@dataclass
+class Template:
+    ''' Decoded image together with the data meta-receiver requires '''
+    image: Image.Image
+    im_bytes: bytes
+    im_shape: tuple[int, int, int]
+
+    @property
+    def nbytes(self) -> int:
+        ''' Approximate memory footprint: decoded pixels + encoded JPEG '''
+        width, height = self.image.size
+        return width * height * len(self.image.getbands()) + len(self.im_bytes)
+
+
+def encode_image(image: Image.Image) -> Template:
+    image_bytes = io.BytesIO()
+    image.save(image_bytes, format='JPEG', exif=b'')
+    return Template(
+        image=image,
+        im_bytes=image_bytes.getvalue(),
+        im_shape=(image.size[1], image.size[0], 3),
+    )
+
+
+def load_template(path: Path) -> Template:
+    image = Image.open(path)
+    image.load()
+    return encode_image(image)
+
+
+@lru_cache(maxsize=256)
+def get_font(name: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(name, size)
+
+
+def fit_font_size(name: str, text: str, width: float) -> int:
+    '''
+    The smallest font size which makes `text` at least `width` pixels wide.
+    Exponential + binary search: only a few (cached) fonts are loaded.
+    '''
+    def _fits(size: int) -> bool:
+        return get_font(name, size).getlength(text) >= width
+
+    low, high = 0, 1   # invariant: `low` doesn't fit, `high` is to be checked
+    while not _fits(high):
+        low, high = high, high * 2
+    while high - low > 1:
+        middle = (low + high) // 2
+        if _fits(middle):
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def draw_text(
+        image: Image.Image,
+        text: str,
+        font_name: str,
+        width_ratio: float = 1.1,
+        xy: tuple[int, int] = (10, 100),
+        fill: tuple[int, int, int] = (0, 255, 0)) -> None:
+    ''' Draw `text` (in place) with font size fitted to image width '''
+    font = get_font(font_name, fit_font_size(font_name, text, width_ratio * image.size[0]))
+    ImageDraw.Draw(image).text(xy=xy, text=text, fill=fill, font=font)
+
+
+class TemplateCache:
+    '''
+    Process-wide LRU cache of templates.
+    Memory limit is applied to the sum of `Template.nbytes`.
+    '''
+    def __init__(self, max_bytes: int = DEFAULT_TEMPLATE_CACHE_SIZE):
+        self._max_bytes = max_bytes
+        self._items: OrderedDict[Hashable, Template] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def __str__(self):
+        return (f'TemplateCache items={len(self)} size={self._size}/{self._max_bytes} '
+                f'hits={self.hits} misses={self.misses}')
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Template]) -> Template:
+        with self._lock:
+            template = self._items.get(key)
+            if template is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+        template = loader()  # do not block other threads while decoding/encoding
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = template
+                self._size += template.nbytes
+                self._evict()
+        return template
+
+    def _evict(self) -> None:
+        while self._size > self._max_bytes and len(self._items) > 1:
+            key, template = self._items.popitem(last=False)
+            self._size -= template.nbytes
+            log.debug(f'Evict template {key}')
+
+
+template_cache = TemplateCache()
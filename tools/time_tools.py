@@ -169,15 +169,12 @@ def filter_objects_by_timestamps(
     return objects
 
 
-def filter_objects_by_timeslice(
-        objects: Sequence[ObjectData],
-        get_time: Callable[[ObjectData], datetime],
-        timeslice: Optional[str],
+def timeslice_to_range(
+        timeslice: str,
         detalization=None,
-) -> Sequence[ObjectData]:
+) -> tuple[datetime, datetime]:
+    ''' Dates which bound `timeslice` (the same way as charts do) '''
     # TODO: strict type hint for `timeslice`
-    if timeslice is None:
-        return objects
     if timeslice == 'custom_default':
         timeslice = '12h'
         detalization = 0
@@ -188,6 +185,18 @@ def filter_objects_by_timeslice(
     date_from = now_pst() - timedelta(seconds=consts.TIMESLICES_IN_SECONDS[timeslice])
     date_from = _round_time(date_from, detalization)
     date_to = now_pst()  # ceil_timestampt ???
+    return date_from, date_to
+
+
+def filter_objects_by_timeslice(
+        objects: Sequence[ObjectData],
+        get_time: Callable[[ObjectData], datetime],
+        timeslice: Optional[str],
+        detalization=None,
+) -> Sequence[ObjectData]:
+    if timeslice is None:
+        return objects
+    date_from, date_to = timeslice_to_range(timeslice, detalization)
     return filter_objects_by_timestamps(objects, get_time, date_from, date_to)
 
 
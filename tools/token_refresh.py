@@ -0,0 +1,151 @@
+'''
+Proactive refresh of access tokens.
+
+Expiration time is decoded from the access token (JWT `exp` claim, signature isn't verified).
+Tokens are refreshed by one background thread shortly before they expire, so long runs don't get
+"Token is expired" responses (and retries of all requests in flight) every token lifetime.
+Clients are referenced weakly: a forgotten client doesn't keep the thread busy.
+Refresh token is rotated by backend, so clients which share tokens (e.g. copies of a client)
+must not refresh them independently:
+ - in a process, the first client refreshes and the others adopt its tokens (`refreshed_tokens`)
+ - unpickled copies (worker processes) don't refresh proactively: the parent process owns the refresh
+   and publishes new access tokens to them (`SharedTokens`)
+'''
+from __future__ import annotations
+from typing import Optional
+from typing import TYPE_CHECKING
+import heapq
+import itertools
+import logging
+import threading
+import time
+import weakref
+
+import jwt
+
+if TYPE_CHECKING:
+    from tools.client import ApiClient
+
+log = logging.getLogger('tools.token_refresh')
+
+DEFAULT_REFRESH_AHEAD = 60.  # seconds before expiration
+MAX_SHARED_TOKEN_SIZE = 16 * 1024  # bytes
+
+
+def token_expiration(token: Optional[str]) -> Optional[float]:
+    ''' `exp` claim of JWT (None if token isn't JWT or doesn't expire) '''
+    if not token:
+        return None
+    try:
+        exp = jwt.decode(token, options={'verify_signature': False}).get('exp')
+    except jwt.PyJWTError:
+        return None
+    return float(exp) if exp is not None else None
+
+
+def refresh_time(expires_at: float, ahead: float, now: Optional[float] = None) -> float:
+    '''
+    `ahead` seconds before expiration, but not earlier than a half of the remaining lifetime
+    (short-living tokens are not refreshed in a loop)
+    '''
+    now = time.time() if now is None else now
+    return max(expires_at - ahead, now + (expires_at - now) / 2)
+
+
+class RefreshScheduler:
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._queue: list[tuple[float, int, weakref.ref, str]] = []
+        self._seq = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, client: ApiClient, token: str, at: float) -> None:
+        with self._lock:
+            heapq.heappush(self._queue, (at, next(self._seq), weakref.ref(client), token))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='token-refresh', daemon=True)
+                self._thread.start()
+            self._lock.notify()
+        log.debug(f'Refresh token of {client} in {at - time.time():.0f}s')
+
+    def _next(self) -> tuple[weakref.ref, str]:
+        with self._lock:
+            while True:
+                if not self._queue:
+                    self._lock.wait()
+                    continue
+                at, _, client_ref, token = self._queue[0]
+                if (delay := at - time.time()) > 0:
+                    self._lock.wait(delay)
+                    continue
+                heapq.heappop(self._queue)
+                return client_ref, token
+
+    def _run(self) -> None:
+        while True:
+            client_ref, token = self._next()
+            client = client_ref()
+            if client is None or client._access_token != token:
+                continue   # client has been forgotten or token has already been changed
+            try:
+                client.refresh_access_token(token)
+            except Exception as exc:
+                log.warning(f'Unable to refresh token of {client} in background: {exc!r}')
+
+
+class RefreshedTokens:
+    ''' Tokens issued in exchange for refresh token: refresh token is used once per process '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token_locks: dict[str, threading.Lock] = {}
+        self._issued: dict[str, tuple[str, str]] = {}
+
+    def lock(self, refresh_token: str) -> threading.Lock:
+        with self._lock:
+            return self._token_locks.setdefault(refresh_token, threading.Lock())
+
+    def issued(self, refresh_token: str) -> Optional[tuple[str, str]]:
+        ''' (access token, refresh token) which have been issued instead of `refresh_token` '''
+        with self._lock:
+            return self._issued.get(refresh_token)
+
+    def add(self, refresh_token: str, access_token: str, new_refresh_token: str) -> None:
+        with self._lock:
+            self._issued[refresh_token] = access_token, new_refresh_token
+
+
+class SharedTokens:
+    '''
+    Access token of the parent process for worker processes with copies of its client.
+    The parent publishes every new token, workers adopt it before sending.
+    Version lives in shared memory: the check is cheap enough to be done per packet.
+    Must be passed to workers when they start (e.g. `initargs` of a process pool), not with tasks.
+    '''
+    def __init__(self, context):
+        self._version = context.Value('Q', 0)
+        self._token = context.Array('c', MAX_SHARED_TOKEN_SIZE, lock=self._version.get_lock())
+        self._seen = 0   # version adopted by this process
+
+    def publish(self, token: str) -> None:
+        data = token.encode()
+        if len(data) >= MAX_SHARED_TOKEN_SIZE:
+            raise ValueError(f'Token is too long to be shared: {len(data)} bytes')
+        with self._version.get_lock():
+            self._token.value = data
+            self._version.value += 1
+
+    def sync(self, client: ApiClient) -> None:
+        ''' Adopt the latest published token (if it's new for this process) '''
+        if self._version.value == self._seen:
+            return
+        with self._version.get_lock():
+            version = self._version.value
+            token = self._token.value.decode()
+        self._seen = version
+        if token and client._access_token != token:
+            log.info(f'{client}: adopt access token of the parent process')
+            client.set_access_token(token)
+
+
+refresh_scheduler = RefreshScheduler()
+refreshed_tokens = RefreshedTokens()